@@ -0,0 +1,109 @@
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import ImageOps
+
+from cache_ocr import hash_contenuto
+from metriche import misura
+
+# Foto caricate, decodificate una sola volta e condivise da tutte le sessioni.
+# Le sessioni tengono solo l'hash della foto: né i byte del file né l'immagine
+# decodificata finiscono in session_state. L'archivio ha un limite di memoria
+# (stimata sui pixel decodificati) e scarta le foto usate meno di recente; per
+# l'anteprima nell'interfaccia c'è una miniatura JPEG già ridotta.
+
+MAX_BYTE_DEFAULT = 256 * 1024 * 1024
+LATO_ANTEPRIMA = 800
+QUALITA_ANTEPRIMA = 80
+
+
+def byte_immagine(image):
+    """Memoria occupata dai pixel decodificati di un'immagine Pillow."""
+    return image.width * image.height * len(image.getbands())
+
+
+def crea_anteprima(image, lato=LATO_ANTEPRIMA):
+    """Miniatura JPEG (lato massimo `lato`) orientata secondo l'EXIF."""
+    anteprima = ImageOps.exif_transpose(image)
+    anteprima = anteprima.convert('RGB') if anteprima.mode != 'RGB' else anteprima.copy()
+    anteprima.thumbnail((lato, lato))
+    buffer = io.BytesIO()
+    anteprima.save(buffer, format='JPEG', quality=QUALITA_ANTEPRIMA)
+    return buffer.getvalue()
+
+
+class _Voce:
+    __slots__ = ('immagine', 'anteprima', 'byte')
+
+    def __init__(self, immagine, anteprima):
+        self.immagine = immagine
+        self.anteprima = anteprima
+        self.byte = byte_immagine(immagine) + len(anteprima)
+
+
+class ArchivioImmagini:
+    """LRU thread-safe di immagini decodificate, con limite sulla memoria totale."""
+
+    def __init__(self, max_byte=MAX_BYTE_DEFAULT):
+        self.max_byte = max_byte
+        self._lock = threading.Lock()
+        self._voci = OrderedDict()
+        self.byte_totali = 0
+        self.decodifiche = 0
+        self.scartate = 0
+
+    def aggiungi(self, dati_bytes):
+        """Decodifica la foto (se non è già presente) e ne restituisce l'hash."""
+        chiave = hash_contenuto(dati_bytes)
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                return chiave
+        # Decodifica completa subito: i thread OCR leggeranno l'immagine insieme.
+        # ocr_patente (e Tesseract) si importano al primo caricamento, non all'avvio dell'app.
+        from ocr_patente import apri_immagine, decodifica_immagine
+        image = apri_immagine(decodifica_immagine(io.BytesIO(dati_bytes)))
+        with misura('anteprima'):
+            anteprima = crea_anteprima(image)
+        voce = _Voce(image, anteprima)
+        with self._lock:
+            self.decodifiche += 1
+            if chiave not in self._voci:
+                self._voci[chiave] = voce
+                self.byte_totali += voce.byte
+                self._libera()
+        return chiave
+
+    def _libera(self):
+        # L'ultima voce inserita resta anche se da sola supera il limite.
+        while self.byte_totali > self.max_byte and len(self._voci) > 1:
+            _, voce = self._voci.popitem(last=False)
+            self.byte_totali -= voce.byte
+            self.scartate += 1
+
+    def _voce(self, chiave):
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is not None:
+                self._voci.move_to_end(chiave)
+            return voce
+
+    def immagine(self, chiave):
+        """Immagine decodificata (da non modificare), o None se è stata scartata."""
+        voce = self._voce(chiave)
+        return voce.immagine if voce is not None else None
+
+    def anteprima(self, chiave):
+        voce = self._voce(chiave)
+        return voce.anteprima if voce is not None else None
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                'voci': len(self._voci),
+                'byte': self.byte_totali,
+                'max_byte': self.max_byte,
+                'decodifiche': self.decodifiche,
+                'scartate': self.scartate,
+            }
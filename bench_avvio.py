@@ -0,0 +1,74 @@
+"""
+Tempo di avvio a freddo e di ogni rerun dell'app, in locale.
+
+    python bench_avvio.py
+    python bench_avvio.py --processi 5 --rerun 30
+
+Ogni misura a freddo parte da un processo Python nuovo: importa Streamlit,
+esegue la prima volta main_andy.py con AppTest (come alla prima apertura
+della pagina) e poi --rerun esecuzioni complete (come un click fuori dai
+fragment). Per il primo processo si elencano anche i moduli pesanti
+caricati dalla prima esecuzione: quelli non necessari alla prima pagina
+dovrebbero arrivare solo al primo uso.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+MODULI_PESANTI = ["pandas", "numpy", "pyarrow", "gspread", "google.oauth2", "pytesseract", "tesserocr",
+                  "pillow_heif", "pytz"]
+
+_PROCESSO = """
+import json, sys, time
+inizio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import_streamlit = time.perf_counter() - inizio
+app = AppTest.from_file("main_andy.py", default_timeout=120)
+inizio = time.perf_counter()
+app.run()
+prima = time.perf_counter() - inizio
+caricati = [m for m in {moduli} if m in sys.modules]
+rerun = []
+for _ in range({rerun}):
+    inizio = time.perf_counter()
+    app.run()
+    rerun.append(time.perf_counter() - inizio)
+print(json.dumps({{"import_streamlit": import_streamlit, "prima": prima, "rerun": rerun, "caricati": caricati,
+                  "eccezioni": [str(e.value) for e in app.exception]}}))
+"""
+
+
+def misura_processo(rerun):
+    codice = _PROCESSO.format(moduli=MODULI_PESANTI, rerun=rerun)
+    ambiente = dict(os.environ, PYTHONPATH=CARTELLA + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    uscita = subprocess.run([sys.executable, "-c", codice], cwd=CARTELLA, env=ambiente,
+                            capture_output=True, text=True, check=True)
+    return json.loads(uscita.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo di avvio a freddo e di rerun dell'app.")
+    parser.add_argument("--processi", type=int, default=3, help="Avvii a freddo da misurare")
+    parser.add_argument("--rerun", type=int, default=20, help="Rerun completi per processo")
+    args = parser.parse_args()
+
+    misure = [misura_processo(args.rerun) for _ in range(args.processi)]
+    if misure[0]["eccezioni"]:
+        print("Eccezioni nell'app:", *misure[0]["eccezioni"], sep="\n  ")
+    prime = [m["prima"] * 1000 for m in misure]
+    rerun = sorted(r * 1000 for m in misure for r in m["rerun"])
+    print(f"Import di Streamlit: {statistics.median(m['import_streamlit'] for m in misure) * 1000:.0f} ms")
+    print(f"Prima esecuzione (avvio a freddo): mediana {statistics.median(prime):.0f} ms, "
+          f"min {min(prime):.0f}, max {max(prime):.0f} su {len(prime)} processi")
+    if rerun:
+        print(f"Rerun completo: p50 {rerun[len(rerun) // 2]:.1f} ms, "
+              f"p95 {rerun[min(len(rerun) - 1, int(len(rerun) * 0.95))]:.1f} ms su {len(rerun)} rerun")
+    print("Moduli pesanti caricati dalla prima esecuzione:", ", ".join(misure[0]["caricati"]) or "nessuno")
+
+
+if __name__ == "__main__":
+    main()
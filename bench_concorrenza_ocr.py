@@ -0,0 +1,109 @@
+"""
+Prova di carico dell'OCR con più sessioni contemporanee, in locale.
+
+    python bench_concorrenza_ocr.py --sessioni 12 --immagini foto1.jpg foto2.jpg
+    python bench_concorrenza_ocr.py --sessioni 12 --simula-ms 400
+    python bench_concorrenza_ocr.py --sessioni 12 --simula-ms 400 --concorrenti 0
+
+Ogni sessione è un thread che estrae --documenti documenti uno dopo l'altro,
+come una pattuglia che carica foto. Con --immagini si usa il vero
+estrai_dati_patente (senza cache, serve Tesseract); con --simula-ms ogni
+documento è una lettura fittizia di circa quella durata su un core (hash di un
+buffer, che come Tesseract non tiene il GIL), passata dallo stesso scheduler.
+--concorrenti 0 toglie il limite dello scheduler, per confrontare.
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import threading
+import time
+
+from scheduler_ocr import scheduler_ocr, sessione_corrente
+
+_BUFFER = os.urandom(1 << 20)
+
+
+def calibra_lettura_fittizia(durata_ms):
+    """Numero di hash del buffer che occupano un core per circa durata_ms."""
+    inizio = time.perf_counter()
+    giri = 0
+    while time.perf_counter() - inizio < 0.2:
+        hashlib.sha256(_BUFFER).digest()
+        giri += 1
+    return max(1, int(giri * durata_ms / 200))
+
+
+def lettura_fittizia(giri):
+    with scheduler_ocr.slot():
+        for _ in range(giri):
+            hashlib.sha256(_BUFFER).digest()
+
+
+def sessione(nome, documenti, elabora, latenze):
+    with sessione_corrente(nome):
+        for i in range(documenti):
+            inizio = time.perf_counter()
+            elabora(i)
+            latenze.append((time.perf_counter() - inizio) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico dell'OCR con più sessioni contemporanee.")
+    parser.add_argument('--sessioni', type=int, default=8)
+    parser.add_argument('--documenti', type=int, default=5, help="Documenti per sessione")
+    parser.add_argument('--immagini', nargs='*', help="Foto da leggere con estrai_dati_patente")
+    parser.add_argument('--modalita', choices=['pagina', 'zone', 'cascata'], default='pagina')
+    parser.add_argument('--simula-ms', type=float, default=300.0,
+                        help="Durata su un core della lettura fittizia (senza --immagini)")
+    parser.add_argument('--concorrenti', type=int,
+                        help="Letture contemporanee ammesse (predefinito: come l'app; 0 = nessun limite)")
+    args = parser.parse_args()
+
+    if args.concorrenti is not None:
+        scheduler_ocr.max_concorrenti = args.concorrenti or 10 ** 6
+    scheduler_ocr.azzera_statistiche()
+
+    if args.immagini:
+        from ocr_patente import apri_immagine, estrai_dati_patente
+        immagini = [apri_immagine(percorso) for percorso in args.immagini]
+        immagini = [immagine.copy() for immagine in immagini]
+
+        def elabora(i):
+            estrai_dati_patente(immagini[i % len(immagini)], modalita=args.modalita)
+        descrizione = f"estrai_dati_patente ({args.modalita}) su {len(immagini)} immagini"
+    else:
+        giri = calibra_lettura_fittizia(args.simula_ms)
+
+        def elabora(i):
+            lettura_fittizia(giri)
+        descrizione = f"lettura fittizia di ~{args.simula_ms:.0f} ms"
+
+    limite = scheduler_ocr.max_concorrenti
+    print(f"{args.sessioni} sessioni x {args.documenti} documenti, {descrizione}, "
+          f"{os.cpu_count()} core, limite {'nessuno' if limite >= 10 ** 6 else limite}")
+
+    latenze = {f"sessione-{n}": [] for n in range(args.sessioni)}
+    thread = [threading.Thread(target=sessione, args=(nome, args.documenti, elabora, valori))
+              for nome, valori in latenze.items()]
+    inizio = time.perf_counter()
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    durata = time.perf_counter() - inizio
+
+    tutte = sorted(v for valori in latenze.values() for v in valori)
+    medie = [statistics.mean(valori) for valori in latenze.values()]
+    stato = scheduler_ocr.statistiche()
+    print(f"Durata totale {durata:.1f} s, {len(tutte) / durata:.2f} documenti/s")
+    print(f"Latenza documento: p50 {tutte[len(tutte) // 2]:.0f} ms, "
+          f"p95 {tutte[min(len(tutte) - 1, int(len(tutte) * 0.95))]:.0f} ms")
+    print(f"Media per sessione: min {min(medie):.0f} ms, max {max(medie):.0f} ms")
+    print(f"Scheduler: attesa p50 {stato['attesa_p50_ms']:.0f} ms (p95 {stato['attesa_p95_ms']:.0f}), "
+          f"lettura p50 {stato['ocr_p50_ms']:.0f} ms (p95 {stato['ocr_p95_ms']:.0f}) "
+          f"su {stato['eseguiti']} letture")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Accuratezza e tempi di estrai_dati_patente su un corpus con i valori attesi.
+
+    python corpus_sintetico.py --output corpus/ --numero 200
+    python bench_ocr.py corpus/ --modalita pagina zone cascata --json oggi.json
+    python bench_ocr.py corpus/ --modalita zone --confronta oggi.json
+
+Per ogni immagine del corpus (il JSON accanto indica l'immagine e i valori
+attesi, vedi corpus_sintetico.py) si esegue l'estrazione senza cache, una
+immagine alla volta, e si confronta ogni campo dopo pulisci_testo_ocr su
+entrambi i lati. Per ogni modalità si riportano l'accuratezza per campo, la
+quota di documenti con tutti i campi giusti, i percentili della latenza,
+l'accuratezza per risoluzione della tessera e i tempi delle fasi (metriche).
+Nei corpus con più tipi di documento (--documenti) il tipo atteso è un campo
+come gli altri: la sua accuratezza è quella della classificazione.
+Con --luoghi si accetta il luogo di nascita suggerito dall'elenco dei luoghi,
+come farebbe l'operatore nell'app (vedi indice_luoghi.py). Con --json si salvano i risultati; con --confronta si stampano le differenze
+rispetto a un'esecuzione precedente, per valutare una modifica al parser o al
+motore OCR.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+
+from metriche import metriche, percentile
+from indice_luoghi import SOGLIA_SUGGERIMENTO, carica_indice
+from ocr_patente import estrai_dati_patente
+from parser_patente import pulisci_testo_ocr
+
+
+def carica_corpus(cartella, limite=None):
+    """[(percorso immagine, valori attesi, parametri)] dai JSON della cartella."""
+    campioni = []
+    for percorso_json in sorted(glob.glob(os.path.join(cartella, '*.json'))):
+        with open(percorso_json, encoding='utf-8') as f:
+            voce = json.load(f)
+        if 'immagine' not in voce or 'attesi' not in voce:
+            continue
+        campioni.append((os.path.join(cartella, voce['immagine']), voce['attesi'], voce.get('parametri', {})))
+        if limite and len(campioni) >= limite:
+            break
+    return campioni
+
+
+def campo_corretto(estratto, atteso):
+    return pulisci_testo_ocr(estratto or '') == pulisci_testo_ocr(atteso or '')
+
+
+def valuta(campioni, modalita, indice=None):
+    """Estrae ogni campione con la modalità indicata e riassume accuratezza e tempi."""
+    metriche.azzera()
+    latenze = []
+    giusti = defaultdict(int)
+    per_larghezza = defaultdict(lambda: [0, 0])
+    completi = errori = 0
+    for percorso, attesi, parametri in campioni:
+        inizio = time.perf_counter()
+        try:
+            dati, _, _ = estrai_dati_patente(percorso, modalita=modalita)
+            if indice is not None and dati['luogo_nascita']:
+                luogo, confidenza = indice.correggi_luogo(dati['luogo_nascita'])
+                if confidenza >= SOGLIA_SUGGERIMENTO:
+                    dati['luogo_nascita'] = luogo
+        except Exception as e:
+            errori += 1
+            dati = {}
+            if errori == 1:
+                print(f"  errore su {os.path.basename(percorso)}: {e}")
+        latenze.append((time.perf_counter() - inizio) * 1000)
+        esiti = {campo: campo_corretto(dati.get(campo), atteso) for campo, atteso in attesi.items()}
+        for campo, esito in esiti.items():
+            giusti[campo] += esito
+        completi += all(esiti.values())
+        gruppo = per_larghezza[str(parametri.get('larghezza_tessera', '?'))]
+        gruppo[0] += sum(esiti.values())
+        gruppo[1] += len(esiti)
+
+    documenti = len(campioni)
+    return {
+        'modalita': modalita,
+        'documenti': documenti,
+        'errori': errori,
+        'completi_%': round(100 * completi / documenti, 1),
+        'campi_%': {campo: round(100 * n / documenti, 1) for campo, n in sorted(giusti.items())},
+        'latenza_ms': {
+            'p50': round(percentile(latenze, 0.5), 1),
+            'p95': round(percentile(latenze, 0.95), 1),
+            'max': round(max(latenze), 1),
+            'totale': round(sum(latenze), 1),
+        },
+        'larghezza_tessera_%': {
+            larghezza: round(100 * ok / totale, 1)
+            for larghezza, (ok, totale) in sorted(per_larghezza.items(), key=lambda v: (len(v[0]), v[0]))
+        },
+        'fasi': metriche.riepilogo(),
+    }
+
+
+def stampa(risultato, precedente=None):
+    def delta(valore, chiave, *sotto):
+        if precedente is None:
+            return ''
+        vecchio = precedente
+        for parte in (chiave, *sotto):
+            vecchio = vecchio.get(parte) if isinstance(vecchio, dict) else None
+        return f" ({valore - vecchio:+.1f})" if isinstance(vecchio, (int, float)) else ''
+
+    latenza = risultato['latenza_ms']
+    print(f"\n== {risultato['modalita']}: {risultato['documenti']} documenti, {risultato['errori']} errori")
+    print(f"Documenti con tutti i campi giusti: {risultato['completi_%']}%"
+          f"{delta(risultato['completi_%'], 'completi_%')}")
+    print(f"Latenza: p50 {latenza['p50']:.0f} ms{delta(latenza['p50'], 'latenza_ms', 'p50')}, "
+          f"p95 {latenza['p95']:.0f} ms{delta(latenza['p95'], 'latenza_ms', 'p95')}, "
+          f"max {latenza['max']:.0f} ms")
+    print("Campi giusti:")
+    for campo, quota in risultato['campi_%'].items():
+        print(f"  {campo:<16} {quota:5.1f}%{delta(quota, 'campi_%', campo)}")
+    print("Campi giusti per larghezza della tessera (px):")
+    for larghezza, quota in risultato['larghezza_tessera_%'].items():
+        print(f"  {larghezza:<16} {quota:5.1f}%{delta(quota, 'larghezza_tessera_%', larghezza)}")
+    if risultato['fasi']:
+        print("Fasi (ms):")
+        for fase in risultato['fasi']:
+            print(f"  {fase['span']:<36} x{fase['misure']:<5} p50 {fase['p50_ms']:8.1f}  "
+                  f"p95 {fase['p95_ms']:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuratezza e tempi dell'OCR su un corpus con valori attesi.")
+    parser.add_argument('corpus', help="Cartella creata da corpus_sintetico.py")
+    parser.add_argument('--modalita', nargs='+', choices=['pagina', 'zone', 'cascata'], default=['pagina'])
+    parser.add_argument('--limite', type=int, help="Numero massimo di documenti")
+    parser.add_argument('--luoghi', action='store_true', help="Accetta il luogo di nascita suggerito dall'elenco dei luoghi")
+    parser.add_argument('--json', help="File in cui salvare i risultati")
+    parser.add_argument('--confronta', help="Risultati di un'esecuzione precedente (--json) da confrontare")
+    args = parser.parse_args()
+
+    campioni = carica_corpus(args.corpus, args.limite)
+    if not campioni:
+        parser.error(f"nessun documento con valori attesi in {args.corpus}")
+    precedenti = {}
+    if args.confronta:
+        with open(args.confronta, encoding='utf-8') as f:
+            precedenti = {r['modalita']: r for r in json.load(f)['risultati']}
+
+    print(f"{len(campioni)} documenti da {args.corpus}")
+    indice = carica_indice() if args.luoghi else None
+    risultati = []
+    for modalita in args.modalita:
+        risultato = valuta(campioni, modalita, indice)
+        stampa(risultato, precedenti.get(modalita))
+        risultati.append(risultato)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'corpus': os.path.abspath(args.corpus), 'documenti': len(campioni),
+                       'risultati': risultati}, f, ensure_ascii=False, indent=1)
+        print(f"\nRisultati salvati in {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Prova di carico del servizio HTTP di estrazione (servizio_ocr.py), in locale.
+
+    python servizio_ocr.py &
+    python bench_servizio.py --immagini corpus/ --client 8 --richieste 200
+    python bench_servizio.py --immagini corpus/ --client 4 --lotto 4 --modalita zone
+
+    python servizio_ocr.py --simula-ms 300 --coda 4 &   # senza Tesseract
+    python bench_servizio.py --client 16 --richieste 300
+
+Ogni client è un thread con una connessione persistente che manda richieste
+una dopo l'altra, a turno sulle immagini indicate (file o cartelle; senza
+--immagini una foto bianca generata qui). Con --lotto N ogni richiesta è un
+lotto di N immagini a /estrai/lotto. Si riportano documenti al secondo, i
+percentili della latenza delle richieste, le richieste rifiutate dal servizio
+(503, coda piena: il client aspetta Retry-After e passa alla successiva) e i
+tempi di attesa e di estrazione dichiarati dal servizio.
+"""
+import argparse
+import base64
+import glob
+import http.client
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from metriche import percentile
+
+ESTENSIONI_IMMAGINE = ('.jpg', '.jpeg', '.png', '.heic', '.heif')
+MAX_ATTESA_RIPROVA_SECONDI = 2
+
+
+def carica_immagini(percorsi):
+    """Byte delle immagini indicate (file o cartelle); una foto bianca se non ce ne sono."""
+    file = []
+    for percorso in percorsi or []:
+        if os.path.isdir(percorso):
+            file += sorted(p for p in glob.glob(os.path.join(percorso, '*'))
+                           if p.lower().endswith(ESTENSIONI_IMMAGINE))
+        else:
+            file.append(percorso)
+    immagini = []
+    for percorso in file:
+        with open(percorso, 'rb') as f:
+            immagini.append(f.read())
+    if not immagini:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (856, 540), 'white').save(buffer, format='PNG')
+        immagini.append(buffer.getvalue())
+    return immagini
+
+
+class Client(threading.Thread):
+    def __init__(self, url, immagini, modalita, lotto, prossima):
+        super().__init__(daemon=True)
+        self.indirizzo = urlsplit(url)
+        self.immagini = immagini
+        self.modalita = modalita
+        self.lotto = lotto
+        self.prossima = prossima
+        self.latenze_ms = []
+        self.tempi_servizio = []
+        self.esiti = Counter()
+        self.documenti = 0
+
+    def _richiesta(self, numero):
+        if self.lotto > 1:
+            scelte = [self.immagini[(numero * self.lotto + i) % len(self.immagini)] for i in range(self.lotto)]
+            corpo = json.dumps({'modalita': self.modalita,
+                                'immagini': [base64.b64encode(dati).decode('ascii') for dati in scelte]})
+            return '/estrai/lotto', corpo.encode('ascii'), 'application/json'
+        return (f'/estrai?modalita={self.modalita}', self.immagini[numero % len(self.immagini)],
+                'application/octet-stream')
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.indirizzo.hostname, self.indirizzo.port or 80, timeout=300)
+        while True:
+            numero = self.prossima()
+            if numero is None:
+                break
+            percorso, corpo, tipo = self._richiesta(numero)
+            inizio = time.perf_counter()
+            try:
+                conn.request('POST', percorso, body=corpo, headers={'Content-Type': tipo})
+                risposta = conn.getresponse()
+                dati = risposta.read()
+            except (OSError, http.client.HTTPException):
+                self.esiti['connessione'] += 1
+                conn.close()
+                continue
+            durata_ms = (time.perf_counter() - inizio) * 1000
+            self.esiti[risposta.status] += 1
+            if risposta.status == 503:
+                attesa = float(risposta.getheader('Retry-After') or 1)
+                time.sleep(min(attesa, MAX_ATTESA_RIPROVA_SECONDI))
+                continue
+            if risposta.status != 200:
+                continue
+            self.latenze_ms.append(durata_ms)
+            corpo = json.loads(dati)
+            for risultato in corpo.get('risultati', [corpo]):
+                if 'tempi_ms' in risultato:
+                    self.documenti += 1
+                    self.tempi_servizio.append(risultato['tempi_ms'])
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico del servizio HTTP di estrazione.")
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--immagini', nargs='*', help="Foto o cartelle da inviare")
+    parser.add_argument('--modalita', choices=['pagina', 'zone', 'cascata'], default='pagina')
+    parser.add_argument('--client', type=int, default=4, help="Client contemporanei")
+    parser.add_argument('--richieste', type=int, default=100, help="Richieste totali")
+    parser.add_argument('--lotto', type=int, default=1, help="Immagini per richiesta (>1: /estrai/lotto)")
+    args = parser.parse_args()
+
+    immagini = carica_immagini(args.immagini)
+    contatore = iter(range(args.richieste))
+    lock = threading.Lock()
+
+    def prossima():
+        with lock:
+            return next(contatore, None)
+
+    client = [Client(args.url, immagini, args.modalita, args.lotto, prossima) for _ in range(args.client)]
+    print(f"{args.client} client, {args.richieste} richieste da {args.lotto} immagini "
+          f"({len(immagini)} distinte), modalità {args.modalita}, {args.url}")
+    inizio = time.perf_counter()
+    for c in client:
+        c.start()
+    for c in client:
+        c.join()
+    durata = time.perf_counter() - inizio
+
+    esiti = sum((c.esiti for c in client), Counter())
+    latenze = [v for c in client for v in c.latenze_ms]
+    tempi = [t for c in client for t in c.tempi_servizio]
+    documenti = sum(c.documenti for c in client)
+    print(f"Durata {durata:.1f} s: {documenti} documenti letti, {documenti / durata:.2f} documenti/s")
+    print("Risposte:", ", ".join(f"{stato}: {n}" for stato, n in sorted(esiti.items(), key=str)))
+    if latenze:
+        print(f"Latenza richieste riuscite: p50 {percentile(latenze, 0.5):.0f} ms, "
+              f"p95 {percentile(latenze, 0.95):.0f} ms, p99 {percentile(latenze, 0.99):.0f} ms, "
+              f"max {max(latenze):.0f} ms")
+    if tempi:
+        for chiave in ('attesa', 'estrazione'):
+            valori = [t[chiave] for t in tempi]
+            print(f"  {chiave} nel servizio: p50 {percentile(valori, 0.5):.0f} ms, "
+                  f"p95 {percentile(valori, 0.95):.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark delle statistiche su un foglio sintetico.
+
+    python bench_statistiche.py --righe 1000000
+
+Genera un DataFrame di stringhe come quello scaricato dal foglio e confronta
+il calcolo a stringhe della vecchia tab STATISTICHE (startswith sulla data,
+un filtro per comune) con statistiche.prepara_controlli + groupby.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from statistiche import FORMATO_DATA_ORA, prepara_controlli, riepilogo_per_comune, totali
+
+COMUNI = [
+    "ALBERA LIGURE", "ARQUATA SCRIVIA", "BASALUZZO", "GAVI", "NOVI LIGURE", "POZZOLO FORMIGARO",
+    "SERRAVALLE SCRIVIA", "STAZZANO", "TASSAROLO", "VOLTAGGIO", "VIGNOLE BORBERA", "CASSANO SPINOLA"
+]
+
+
+def foglio_sintetico(righe, giorni=730, seme=0):
+    """Righe del foglio come stringhe, distribuite sugli ultimi giorni fino a oggi."""
+    rng = np.random.default_rng(seme)
+    fine = datetime.now().replace(microsecond=0)
+    secondi = rng.integers(0, giorni * 86400, size=righe)
+    istanti = pd.to_datetime(fine) - pd.to_timedelta(np.sort(secondi)[::-1], unit="s")
+    si_no = np.array(["NO", "SI"])
+    rilievi = np.array(["", "", "", "", "MANCATA REVISIONE", "ECCESSO VELOCITA"])
+    return pd.DataFrame({
+        "DATA_ORA": istanti.strftime(FORMATO_DATA_ORA),
+        "COMUNE": rng.choice(COMUNI, size=righe),
+        "VEICOLO": "FIAT PANDA",
+        "TARGA": "AB123CD",
+        "COGNOME": "ROSSI",
+        "NOME": "MARIO",
+        "LUOGO_NASCITA": "ROMA",
+        "DATA_NASCITA": "01/01/1980",
+        "COMMERCIALE": si_no[(rng.random(righe) < 0.3).astype(int)],
+        "COPE": si_no[(rng.random(righe) < 0.05).astype(int)],
+        "RILIEVI": rng.choice(rilievi, size=righe),
+        "CINOFILI": si_no[(rng.random(righe) < 0.02).astype(int)],
+    })
+
+
+def statistiche_a_stringhe(df, oggi):
+    """Il calcolo della vecchia tab STATISTICHE, riportato qui solo per confronto."""
+    df_oggi = df[df["DATA_ORA"].astype(str).str.startswith(oggi, na=False)].copy()
+    commerciali_oggi = df_oggi["COMMERCIALE"].astype(str).str.upper().eq("SI").sum()
+    riepilogo = {
+        "totale": len(df_oggi),
+        "commerciali": commerciali_oggi,
+        "privati": len(df_oggi) - commerciali_oggi,
+        "cope": df_oggi["COPE"].astype(str).str.upper().eq("SI").sum(),
+        "cinofili": df_oggi["CINOFILI"].astype(str).str.upper().eq("SI").sum(),
+        "rilievi": df_oggi[df_oggi["RILIEVI"].astype(str).str.strip() != ""].shape[0],
+    }
+    df_oggi["COMUNE"] = df_oggi["COMUNE"].astype(str)
+    per_comune = {}
+    for comune in df_oggi["COMUNE"].unique():
+        df_comune_oggi = df_oggi[df_oggi["COMUNE"] == comune]
+        commerciali_comune = df_comune_oggi["COMMERCIALE"].astype(str).str.upper().eq("SI").sum()
+        per_comune[comune] = (df_comune_oggi["DATA_ORA"].min(), df_comune_oggi["DATA_ORA"].max(),
+                              len(df_comune_oggi), commerciali_comune)
+    return riepilogo, per_comune
+
+
+def misura(descrizione, funzione, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        risultato = funzione()
+        tempi.append(time.perf_counter() - inizio)
+    print(f"{descrizione:<45} {min(tempi) * 1000:10.1f} ms (migliore di {ripetizioni})")
+    return risultato
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delle statistiche su un foglio sintetico.")
+    parser.add_argument("--righe", type=int, default=1_000_000)
+    parser.add_argument("--giorni", type=int, default=730, help="Giorni coperti dai controlli sintetici")
+    parser.add_argument("--ripetizioni", type=int, default=3)
+    args = parser.parse_args()
+
+    inizio = time.perf_counter()
+    df = foglio_sintetico(args.righe, args.giorni)
+    print(f"Foglio sintetico: {len(df)} righe generate in {time.perf_counter() - inizio:.1f} s")
+
+    oggi = datetime.now().date()
+    vecchio, _ = misura("Stringhe, solo oggi (vecchia tab)",
+                        lambda: statistiche_a_stringhe(df, oggi.strftime("%d/%m/%Y")), args.ripetizioni)
+    controlli = misura("prepara_controlli (una volta per caricamento)",
+                       lambda: prepara_controlli(df), args.ripetizioni)
+    tabella = misura("groupby per comune, oggi",
+                     lambda: riepilogo_per_comune(controlli, oggi, oggi), args.ripetizioni)
+    misura("groupby per comune, ultimi 30 giorni",
+           lambda: riepilogo_per_comune(controlli, oggi - timedelta(days=29), oggi), args.ripetizioni)
+    misura("groupby per comune, tutto lo storico",
+           lambda: riepilogo_per_comune(controlli, oggi - timedelta(days=args.giorni), oggi), args.ripetizioni)
+
+    nuovo = totali(tabella)
+    coincidono = all(int(vecchio[chiave]) == nuovo[chiave] for chiave in nuovo)
+    print(f"Totali di oggi uguali al calcolo a stringhe: {'sì' if coincidono else 'NO'} {nuovo}")
+
+
+if __name__ == "__main__":
+    main()
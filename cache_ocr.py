@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Cache dei risultati OCR condivisa da tutte le sessioni Streamlit del processo.
+# Vive in un modulo importato (e non in main_andy.py) perché Streamlit riesegue
+# lo script principale a ogni rerun: qui lo stato sopravvive tra i rerun.
+
+MAX_VOCI_DEFAULT = 128
+TTL_SECONDI_DEFAULT = 60 * 60
+# Distanza di Hamming massima (su 64 bit) per considerare due foto "la stessa".
+# Disattivata (None): solo la chiave esatta sui byte. A 9x8 pixel le patenti di
+# persone diverse, fotografate con la stessa inquadratura, hanno lo stesso dHash,
+# e la cache è condivisa tra le sessioni: un risultato simile sarebbe i dati di
+# un'altra persona. Da attivare solo su foto ripetute dello stesso documento.
+SOGLIA_PHASH_DEFAULT = None
+
+
+def hash_contenuto(dati_bytes):
+    """Restituisce lo SHA-256 esadecimale dei byte dell'immagine."""
+    return hashlib.sha256(dati_bytes).hexdigest()
+
+
+def hash_percettivo(image):
+    """
+    Calcola il difference hash (dHash) a 64 bit di un'immagine Pillow.
+    Due scatti quasi identici dello stesso documento producono hash vicini.
+    """
+    piccola = image.convert('L').resize((9, 8))
+    pixel = piccola.tobytes()
+    valore = 0
+    for riga in range(8):
+        base = riga * 9
+        for colonna in range(8):
+            valore = (valore << 1) | (pixel[base + colonna] > pixel[base + colonna + 1])
+    return valore
+
+
+def distanza_hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class CacheOCR:
+    """
+    Cache LRU con scadenza (TTL) dei risultati di estrai_dati_patente,
+    indicizzata per hash del contenuto e, opzionalmente, per hash percettivo.
+    """
+
+    def __init__(self, max_voci=MAX_VOCI_DEFAULT, ttl_secondi=TTL_SECONDI_DEFAULT,
+                 soglia_phash=SOGLIA_PHASH_DEFAULT):
+        self.max_voci = max_voci
+        self.ttl_secondi = ttl_secondi
+        self.soglia_phash = soglia_phash
+        self._voci = OrderedDict()  # chiave -> (scadenza, phash, valore)
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.hit_phash = 0
+        self.miss = 0
+
+    def _elimina_scadute(self, adesso):
+        scadute = [k for k, (scadenza, _, _) in self._voci.items() if scadenza <= adesso]
+        for k in scadute:
+            del self._voci[k]
+
+    def get(self, chiave):
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                return None
+            if voce[0] <= time.monotonic():
+                del self._voci[chiave]
+                return None
+            self._voci.move_to_end(chiave)
+            self.hit += 1
+            return voce[2]
+
+    def get_simile(self, phash, prefisso=''):
+        """
+        Cerca un risultato con hash percettivo entro la soglia configurata,
+        limitandosi alle chiavi che iniziano con prefisso.
+        """
+        if self.soglia_phash is None or phash is None:
+            return None
+        with self._lock:
+            adesso = time.monotonic()
+            self._elimina_scadute(adesso)
+            migliore = None
+            for chiave, (_, phash_voce, valore) in self._voci.items():
+                if phash_voce is None or not chiave.startswith(prefisso):
+                    continue
+                distanza = distanza_hamming(phash, phash_voce)
+                if distanza <= self.soglia_phash and (migliore is None or distanza < migliore[0]):
+                    migliore = (distanza, chiave, valore)
+            if migliore is None:
+                return None
+            self._voci.move_to_end(migliore[1])
+            self.hit_phash += 1
+            return migliore[2]
+
+    def put(self, chiave, valore, phash=None):
+        with self._lock:
+            self._voci[chiave] = (time.monotonic() + self.ttl_secondi, phash, valore)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.max_voci:
+                self._voci.popitem(last=False)
+
+    def registra_miss(self):
+        with self._lock:
+            self.miss += 1
+
+    def svuota(self):
+        with self._lock:
+            self._voci.clear()
+
+    def __len__(self):
+        return len(self._voci)
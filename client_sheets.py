@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from metriche import misura
+
+# Client Google Sheets creato una sola volta per processo, alla prima richiesta
+# del foglio (dalla coda di invio o dal mirror), e condiviso da tutti i thread.
+# gspread e google-auth si importano solo in quel momento: l'avvio dell'app e i
+# rerun non li caricano. Le richieste passano da un'unica sessione HTTP con un
+# pool di connessioni (keep-alive), e un thread rinnova il token di accesso
+# prima della scadenza, così nessuna richiesta al foglio aspetta il rinnovo.
+
+NOME_FOGLIO = "Controlli_Pattuglia"
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive",
+]
+CONNESSIONI_POOL = 8
+# (connessione, lettura) in secondi per ogni richiesta al foglio.
+TIMEOUT_RICHIESTE = (10, 60)
+# Il token si rinnova quando mancano meno di questi secondi alla scadenza.
+MARGINE_RINNOVO_SECONDI = 5 * 60
+# Attesa prima di riprovare un rinnovo fallito.
+ATTESA_RINNOVO_FALLITO_SECONDI = 30
+
+
+class ClientSheets:
+    """Worksheet gspread aperto alla prima richiesta, con sessione HTTP condivisa e rinnovo del token."""
+
+    def __init__(self, fornitore_credenziali, nome_foglio=NOME_FOGLIO):
+        """
+        fornitore_credenziali: funzione senza argomenti che restituisce il dizionario
+        del service account (chiamata solo alla prima apertura del foglio).
+        """
+        self.fornitore_credenziali = fornitore_credenziali
+        self.nome_foglio = nome_foglio
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._foglio = None
+        self._credenziali = None
+        self._richiesta_token = None
+        self._thread = None
+        self.aperto = None
+        self.ultimo_rinnovo = None
+        self.ultimo_errore = ''
+
+    def foglio(self):
+        """Il worksheet dei controlli; la prima chiamata autorizza il client e apre il foglio."""
+        if self._foglio is not None:
+            return self._foglio
+        with self._lock:
+            if self._foglio is None:
+                self._foglio = self._apri()
+                self._thread = threading.Thread(target=self._ciclo_rinnovo, name="rinnovo-token-sheets",
+                                                daemon=True)
+                self._thread.start()
+        return self._foglio
+
+    def _apri(self):
+        with misura('sheets.import'):
+            import gspread
+            import requests
+            from google.auth.transport.requests import AuthorizedSession, Request
+            from google.oauth2.service_account import Credentials
+
+        info = self.fornitore_credenziali()
+        with misura('sheets.autorizzazione'):
+            credenziali = Credentials.from_service_account_info(info, scopes=SCOPE)
+            adattatore = requests.adapters.HTTPAdapter(pool_connections=CONNESSIONI_POOL,
+                                                       pool_maxsize=CONNESSIONI_POOL)
+            sessione_token = requests.Session()
+            sessione_token.mount("https://", adattatore)
+            richiesta_token = Request(session=sessione_token)
+            credenziali.refresh(richiesta_token)
+            sessione = AuthorizedSession(credenziali, auth_request=richiesta_token)
+            sessione.mount("https://", adattatore)
+            client = gspread.authorize(credenziali, session=sessione)
+            client.set_timeout(TIMEOUT_RICHIESTE)
+        with misura('sheets.apertura'):
+            foglio = client.open(self.nome_foglio).sheet1
+        self._credenziali, self._richiesta_token = credenziali, richiesta_token
+        self.aperto = self.ultimo_rinnovo = time.time()
+        return foglio
+
+    def _secondi_alla_scadenza(self):
+        scadenza = self._credenziali.expiry
+        if scadenza is None:
+            return None
+        # google-auth usa datetime UTC senza fuso.
+        return (scadenza - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+    def _ciclo_rinnovo(self):
+        attesa = 0
+        while not self._stop.wait(attesa):
+            restanti = self._secondi_alla_scadenza()
+            if restanti is None or restanti > MARGINE_RINNOVO_SECONDI:
+                # Senza scadenza nota ci pensa la sessione, che rinnova il token alla prima risposta 401.
+                attesa = restanti - MARGINE_RINNOVO_SECONDI if restanti is not None else MARGINE_RINNOVO_SECONDI
+                continue
+            try:
+                with misura('sheets.rinnovo_token'):
+                    self._credenziali.refresh(self._richiesta_token)
+                self.ultimo_rinnovo = time.time()
+                self.ultimo_errore = ''
+                attesa = 0
+            except Exception as e:
+                self.ultimo_errore = f"{type(e).__name__}: {e}"
+                attesa = ATTESA_RINNOVO_FALLITO_SECONDI
+
+    def stato(self):
+        """Descrizione breve per la sidebar."""
+        if self._foglio is None:
+            return "non ancora aperto"
+        restanti = self._secondi_alla_scadenza()
+        stato = f"aperto, token valido per {restanti / 60:.0f} min" if restanti is not None else "aperto"
+        return f"{stato} (ultimo errore di rinnovo: {self.ultimo_errore})" if self.ultimo_errore else stato
+
+    def chiudi(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
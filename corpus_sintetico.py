@@ -0,0 +1,339 @@
+"""
+Generatore di patenti sintetiche per misurare l'OCR senza documenti reali.
+
+    python corpus_sintetico.py --output corpus/ --numero 200
+    python corpus_sintetico.py --output corpus/ --numero 50 --formati heic --seme 7
+
+Ogni patente è disegnata con PIL sul layout dei campi numerati della patente
+UE italiana (le stesse zone di zone_patente), con font, dimensioni e posizione
+del testo variabili, e poi "fotografata": appoggiata su uno sfondo, ruotata,
+sfocata, con rumore, a risoluzioni diverse e salvata in JPEG/PNG/HEIC con
+qualità variabile. Accanto a ogni immagine c'è un JSON con i valori attesi
+(nello stesso formato di estrai_dati_patente) e i parametri usati.
+Con --documenti si mescolano altri lati e documenti, per misurare anche il
+riconoscimento del tipo (vedi documenti.py): il retro della patente (solo la
+tabella delle categorie) e il retro della carta d'identità, con la MRZ.
+Vedi bench_ocr.py per misurare accuratezza e tempi sul corpus.
+
+    python corpus_sintetico.py --output corpus/ --numero 200 --documenti patente_fronte,carta_identita,patente_retro
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import random
+from datetime import date, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from mrz import LUNGHEZZA_TD1, componi_td1
+from parser_patente import analizza_testo_patente, pulisci_testo_ocr
+from zone_patente import ALTEZZA_CANONICA, LARGHEZZA_CANONICA, ZONE_PATENTE
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+COGNOMI = [
+    "ROSSI", "RUSSO", "FERRARI", "ESPOSITO", "BIANCHI", "ROMANO", "COLOMBO", "RICCI", "MARINO", "GRECO",
+    "BRUNO", "GALLO", "CONTI", "DE LUCA", "MANCINI", "COSTA", "GIORDANO", "RIZZO", "LOMBARDI", "MORETTI",
+    "BARBIERI", "FONTANA", "SANTORO", "MARIANI", "RINALDI", "CARUSO", "FERRARA", "GALLI", "MARTINI", "LEONE",
+    "D'ANGELO", "DELL'ACQUA", "LO BIANCO", "DI STEFANO", "PAGANINI",
+]
+NOMI = [
+    "MARIO", "GIUSEPPE", "LUCA", "MARCO", "ANDREA", "FRANCESCO", "ALESSANDRO", "GIOVANNI", "ROBERTO", "STEFANO",
+    "MARIA", "ANNA", "GIULIA", "FRANCESCA", "CHIARA", "SARA", "LAURA", "ELENA", "VALENTINA", "SILVIA",
+    "GIAN MARCO", "MARIA GRAZIA", "ANNA MARIA", "PIER LUIGI",
+]
+LUOGHI = [
+    ("ROMA", "RM"), ("MILANO", "MI"), ("NAPOLI", "NA"), ("TORINO", "TO"), ("GENOVA", "GE"), ("PALERMO", "PA"),
+    ("BOLOGNA", "BO"), ("FIRENZE", "FI"), ("BARI", "BA"), ("ALESSANDRIA", "AL"), ("NOVI LIGURE", "AL"),
+    ("SERRAVALLE SCRIVIA", "AL"), ("GAVI", "AL"), ("TORTONA", "AL"), ("ASTI", "AT"), ("PAVIA", "PV"),
+    ("REGGIO CALABRIA", "RC"), ("LA SPEZIA", "SP"), ("SAN REMO", "IM"), ("CASTELLETTO D'ORBA", "AL"),
+]
+ENTI = ["MIT-UCO", "MC-RM", "MC-MI", "MC-AL", "MC-GE"]
+CATEGORIE = ["B", "AM/B1/B", "A/B", "B/BE", "AM/A1/A2/A/B1/B/C1/C/D1/D/BE/C1E/CE"]
+# Righe della tabella sul retro della patente.
+CATEGORIE_RETRO = ["AM", "A1", "A2", "A", "B1", "B", "C1", "C", "D1", "D", "BE", "C1E", "CE", "D1E", "DE"]
+TIPI_DOCUMENTO = ("patente_fronte", "patente_retro", "carta_identita")
+PREFISSI_FILE = {"patente_fronte": "patente", "patente_retro": "retro", "carta_identita": "cie"}
+
+# Percorsi tipici dei font TrueType; con --font se ne possono indicare altri.
+CARTELLE_FONT = [
+    "/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts"),
+    "/Library/Fonts", "/System/Library/Fonts", "C:\\Windows\\Fonts",
+]
+COLORE_TESSERA = (236, 214, 221)
+COLORE_CARTA_IDENTITA = (226, 232, 238)
+COLORE_TESTO = (20, 20, 35)
+
+
+def trova_font(extra=None):
+    """Font TrueType disponibili (quelli indicati più quelli di sistema); lista vuota se nessuno."""
+    trovati = list(extra or [])
+    for cartella in CARTELLE_FONT:
+        trovati += glob.glob(os.path.join(cartella, "**", "*.ttf"), recursive=True)
+    # Solo font latini "normali": niente simboli o emoji.
+    return sorted(f for f in set(trovati) if not any(x in os.path.basename(f).lower()
+                                                     for x in ("symbol", "emoji", "math", "dingbat")))
+
+
+def carica_font(percorsi, dimensione, rng):
+    if percorsi:
+        try:
+            return ImageFont.truetype(rng.choice(percorsi), dimensione)
+        except OSError:
+            pass
+    return ImageFont.load_default(size=dimensione)
+
+
+def data_casuale(rng, inizio, fine):
+    return inizio + timedelta(days=rng.randrange((fine - inizio).days))
+
+
+def numero_patente(rng):
+    lettere = "ABCDEFGHJKLMNPRSTUVZ"
+    return (rng.choice(lettere) + rng.choice(lettere) + "".join(rng.choice("0123456789") for _ in range(7))
+            + rng.choice(lettere))
+
+
+def dati_casuali(rng):
+    """Valori della patente e righe di testo da stampare per ciascun campo."""
+    oggi = date.today()
+    nascita = data_casuale(rng, date(1940, 1, 1), oggi - timedelta(days=18 * 366))
+    rilascio = data_casuale(rng, max(nascita + timedelta(days=18 * 366), oggi - timedelta(days=3650)), oggi)
+    scadenza = rilascio.replace(year=rilascio.year + 10) if not (rilascio.month == 2 and rilascio.day == 29) \
+        else rilascio + timedelta(days=3652)
+    luogo, provincia = rng.choice(LUOGHI)
+    valori = {
+        'cognome': rng.choice(COGNOMI),
+        'nome': rng.choice(NOMI),
+        'data_nascita': nascita.strftime("%d/%m/%Y"),
+        'luogo_nascita': f"{luogo} ({provincia})",
+        'data_rilascio': rilascio.strftime("%d/%m/%Y"),
+        'data_scadenza': scadenza.strftime("%d/%m/%Y"),
+        'numero_patente': numero_patente(rng),
+    }
+    righe = {
+        '1': f"1. {valori['cognome']}",
+        '2': f"2. {valori['nome']}",
+        # Sulla tessera la data di nascita ha l'anno a due cifre.
+        '3': f"3. {nascita.strftime('%d/%m/%y')} {valori['luogo_nascita']}",
+        '4A': f"4a. {valori['data_rilascio']}",
+        '4B': f"4b. {valori['data_scadenza']}",
+        '5': f"5. {valori['numero_patente']}",
+    }
+    return valori, righe
+
+
+def dati_carta_identita(rng):
+    """Valori della carta d'identità (come li restituisce estrai_dati_patente) e righe della MRZ."""
+    valori, _ = dati_casuali(rng)
+    lettere = "ABCDEFGHJKLMNPRSTUVZ"
+    numero = "CA" + "".join(rng.choice("0123456789") for _ in range(5)) + rng.choice(lettere) + rng.choice(lettere)
+    valori = {
+        'cognome': valori['cognome'].replace("'", " "),
+        'nome': valori['nome'],
+        'data_nascita': valori['data_nascita'],
+        'data_scadenza': valori['data_scadenza'],
+        'numero_documento': numero,
+    }
+    righe = componi_td1(numero, valori['data_nascita'], rng.choice("MF"), valori['data_scadenza'],
+                        valori['cognome'], valori['nome'])
+    return valori, righe
+
+
+def _font_mono(font_disponibili):
+    return [f for f in font_disponibili if any(x in os.path.basename(f).lower() for x in ("mono", "code", "cour"))]
+
+
+def disegna_carta_identita_retro(righe_mrz, font_disponibili, rng):
+    """Retro della carta d'identità: qualche dicitura in alto e le tre righe della MRZ in basso."""
+    larghezza, altezza = LARGHEZZA_CANONICA, ALTEZZA_CANONICA
+    trama = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 4, (altezza, larghezza, 1))
+    fondo = np.clip(np.array(COLORE_CARTA_IDENTITA, dtype=np.float32) + trama, 0, 255).astype(np.uint8)
+    tessera = Image.fromarray(fondo)
+    disegno = ImageDraw.Draw(tessera)
+    font_etichette = carica_font(font_disponibili, 20, rng)
+    for riga, etichetta in enumerate(("INDIRIZZO DI RESIDENZA / RESIDENCE", "CODICE FISCALE / FISCAL CODE")):
+        disegno.text((0.05 * larghezza, (0.06 + 0.16 * riga) * altezza), etichetta, font=font_etichette,
+                     fill=(60, 60, 90))
+    disegno.rectangle((0.05 * larghezza, 0.40 * altezza, 0.55 * larghezza, 0.52 * altezza), fill=(40, 40, 40))
+
+    # Font a spaziatura fissa, della dimensione che porta le 30 colonne a circa il 90% della tessera.
+    mono = _font_mono(font_disponibili)
+    dimensione = int(altezza * 0.075)
+    font_mrz = carica_font(mono, dimensione, rng)
+    while dimensione > 10 and font_mrz.getlength("<" * LUNGHEZZA_TD1) > 0.92 * larghezza:
+        dimensione -= 2
+        font_mrz = carica_font(mono, dimensione, rng)
+    dx = rng.uniform(0.03, 0.05)
+    for riga, testo in enumerate(righe_mrz):
+        disegno.text((dx * larghezza, (0.65 + 0.105 * riga) * altezza), testo, font=font_mrz, fill=COLORE_TESTO)
+    return tessera
+
+
+def disegna_patente_retro(font_disponibili, rng):
+    """Retro della patente: la tabella delle categorie (colonne 9-12), senza dati anagrafici."""
+    larghezza, altezza = LARGHEZZA_CANONICA, ALTEZZA_CANONICA
+    trama = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 4, (altezza, larghezza, 1))
+    fondo = np.clip(np.array(COLORE_TESSERA, dtype=np.float32) + trama, 0, 255).astype(np.uint8)
+    tessera = Image.fromarray(fondo)
+    disegno = ImageDraw.Draw(tessera)
+    font_tabella = carica_font(font_disponibili, int(altezza * 0.04), rng)
+    colonne = (0.04, 0.16, 0.36, 0.56, 0.76)
+    for colonna, intestazione in zip(colonne[1:], ("9.", "10.", "11.", "12.")):
+        disegno.text((colonna * larghezza, 0.03 * altezza), intestazione, font=font_tabella, fill=COLORE_TESTO)
+    passo = 0.84 / len(CATEGORIE_RETRO)
+    oggi = date.today()
+    for riga, categoria in enumerate(CATEGORIE_RETRO):
+        y = (0.10 + riga * passo) * altezza
+        disegno.line((0.03 * larghezza, y, 0.97 * larghezza, y), fill=(120, 110, 130), width=1)
+        disegno.text((colonne[0] * larghezza, y + 2), categoria, font=font_tabella, fill=COLORE_TESTO)
+        if rng.random() < 0.3:
+            rilascio = data_casuale(rng, oggi - timedelta(days=3650), oggi)
+            disegno.text((colonne[2] * larghezza, y + 2), rilascio.strftime("%d.%m.%y"), font=font_tabella,
+                         fill=COLORE_TESTO)
+    return tessera
+
+
+def disegna_tessera(righe, font_disponibili, rng):
+    """Tessera canonica (stesse dimensioni e zone di zone_patente) con il testo dei campi."""
+    larghezza, altezza = LARGHEZZA_CANONICA, ALTEZZA_CANONICA
+    # Fondo rosato con una leggera trama, come la carta filigranata.
+    trama = np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 4, (altezza, larghezza, 1))
+    fondo = np.clip(np.array(COLORE_TESSERA, dtype=np.float32) + trama, 0, 255).astype(np.uint8)
+    tessera = Image.fromarray(fondo)
+    disegno = ImageDraw.Draw(tessera)
+
+    disegno.text((0.30 * larghezza, 0.04 * altezza), "PATENTE DI GUIDA",
+                 font=carica_font(font_disponibili, 40, rng), fill=(40, 40, 120))
+    disegno.text((0.30 * larghezza, 0.11 * altezza), "REPUBBLICA ITALIANA",
+                 font=carica_font(font_disponibili, 24, rng), fill=(40, 40, 120))
+    disegno.rectangle((0.03 * larghezza, 0.20 * altezza, 0.27 * larghezza, 0.75 * altezza), fill=(170, 165, 170))
+
+    font_campi = carica_font(font_disponibili, int(altezza * rng.uniform(0.045, 0.062)), rng)
+    dx, dy = rng.uniform(-0.01, 0.015), rng.uniform(-0.012, 0.012)
+    for campo, testo in righe.items():
+        sinistra, alto, _, _ = ZONE_PATENTE[campo]
+        disegno.text(((sinistra + 0.01 + dx) * larghezza, (alto + 0.012 + dy) * altezza), testo,
+                     font=font_campi, fill=COLORE_TESTO)
+    # Campi non letti dall'app, ma presenti sulla tessera vera.
+    _, alto_4a, _, _ = ZONE_PATENTE['4A']
+    disegno.text(((0.66 + dx) * larghezza, (alto_4a + 0.012 + dy) * altezza), f"4c. {rng.choice(ENTI)}",
+                 font=font_campi, fill=COLORE_TESTO)
+    disegno.text(((0.31 + dx) * larghezza, (0.80 + dy) * altezza), f"9. {rng.choice(CATEGORIE)}",
+                 font=font_campi, fill=COLORE_TESTO)
+    return tessera
+
+
+def fotografa(tessera, rng):
+    """Simula una foto della tessera: sfondo, rotazione, risoluzione, sfocatura e rumore."""
+    parametri = {
+        'larghezza_tessera': rng.choice([500, 750, 1000, 1500, 2200]),
+        'rotazione': round(rng.uniform(-4, 4), 2),
+        'sfocatura': round(rng.choice([0, 0, 0.6, 1.0, 1.6]), 2),
+        'rumore': round(rng.choice([0, 3, 6, 10]), 1),
+        'margine': round(rng.uniform(0.08, 0.3), 2),
+    }
+    larghezza = parametri['larghezza_tessera']
+    altezza = round(larghezza * tessera.height / tessera.width)
+    tessera = tessera.resize((larghezza, altezza), Image.LANCZOS)
+    tessera = tessera.rotate(parametri['rotazione'], resample=Image.BICUBIC, expand=True, fillcolor=(0, 0, 0))
+    maschera = Image.new('L', (larghezza, altezza), 255).rotate(parametri['rotazione'], expand=True)
+
+    colore_sfondo = tuple(rng.randrange(30, 110) for _ in range(3))
+    margine = int(larghezza * parametri['margine'])
+    foto = Image.new('RGB', (tessera.width + 2 * margine, tessera.height + 2 * margine), colore_sfondo)
+    foto.paste(tessera, (margine + rng.randrange(-margine // 2, margine // 2 + 1),
+                         margine + rng.randrange(-margine // 2, margine // 2 + 1)), maschera)
+
+    if parametri['sfocatura']:
+        foto = foto.filter(ImageFilter.GaussianBlur(parametri['sfocatura'] * larghezza / 1000))
+    if parametri['rumore']:
+        pixel = np.asarray(foto, dtype=np.float32)
+        pixel += np.random.default_rng(rng.randrange(2 ** 32)).normal(0, parametri['rumore'], pixel.shape)
+        foto = Image.fromarray(np.clip(pixel, 0, 255).astype(np.uint8))
+    return foto, parametri
+
+
+def salva(foto, percorso_base, formato, rng):
+    """Salva la foto nel formato indicato con una qualità casuale; restituisce (percorso, qualità)."""
+    qualita = rng.choice([45, 60, 75, 90]) if formato in ('jpg', 'heic') else None
+    percorso = f"{percorso_base}.{formato}"
+    if formato == 'jpg':
+        foto.save(percorso, format='JPEG', quality=qualita)
+    elif formato == 'heic':
+        foto.save(percorso, format='HEIF', quality=qualita)
+    else:
+        foto.save(percorso, format='PNG')
+    return percorso, qualita
+
+
+def verifica_parser(righe, valori):
+    """Campi che il parser non ricava nemmeno dal testo perfetto (dovrebbe essere vuoto)."""
+    dati = analizza_testo_patente(pulisci_testo_ocr('\n'.join(righe.values())))
+    return [campo for campo, atteso in valori.items() if pulisci_testo_ocr(dati[campo]) != pulisci_testo_ocr(atteso)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera patenti sintetiche con i valori attesi in JSON.")
+    parser.add_argument('--output', required=True, help="Cartella del corpus")
+    parser.add_argument('--numero', type=int, default=100)
+    parser.add_argument('--seme', type=int, default=0)
+    parser.add_argument('--formati', default='jpg,png,heic', help="Formati tra cui scegliere (jpg, png, heic)")
+    parser.add_argument('--font', nargs='*', help="File .ttf da usare oltre a quelli di sistema")
+    parser.add_argument('--documenti', default='patente_fronte',
+                        help=f"Tipi di documento tra cui scegliere ({', '.join(TIPI_DOCUMENTO)})")
+    args = parser.parse_args()
+
+    formati = [f.strip().lower() for f in args.formati.split(',') if f.strip()]
+    if 'heic' in formati and pillow_heif is None:
+        print("pillow_heif non installato: niente HEIC.")
+        formati.remove('heic')
+    if not formati:
+        parser.error("nessun formato disponibile")
+    tipi = [t.strip() for t in args.documenti.split(',') if t.strip()]
+    if not tipi or any(t not in TIPI_DOCUMENTO for t in tipi):
+        parser.error(f"--documenti: scegliere tra {', '.join(TIPI_DOCUMENTO)}")
+    font_disponibili = trova_font(args.font)
+    if not font_disponibili:
+        print("Nessun font TrueType trovato: uso il font predefinito di Pillow.")
+
+    os.makedirs(args.output, exist_ok=True)
+    rng = random.Random(args.seme)
+    incoerenti = 0
+    for indice in range(args.numero):
+        # Con un solo tipo la sequenza casuale resta quella di sempre (stesso seme, stesso corpus).
+        tipo = tipi[0] if len(tipi) == 1 else rng.choice(tipi)
+        if tipo == 'carta_identita':
+            valori, righe = dati_carta_identita(rng)
+            tessera = disegna_carta_identita_retro(righe, font_disponibili, rng)
+        elif tipo == 'patente_retro':
+            valori, righe = {campo: '' for campo in analizza_testo_patente('')}, {}
+            tessera = disegna_patente_retro(font_disponibili, rng)
+        else:
+            valori, righe = dati_casuali(rng)
+            tessera = disegna_tessera(righe, font_disponibili, rng)
+            incoerenti += bool(verifica_parser(righe, valori))
+        valori['tipo_documento'] = tipo
+        foto, parametri = fotografa(tessera, rng)
+        percorso_base = os.path.join(args.output, f"{PREFISSI_FILE[tipo]}_{indice:05d}")
+        percorso, qualita = salva(foto, percorso_base, rng.choice(formati), rng)
+        parametri.update(formato=os.path.splitext(percorso)[1][1:], qualita=qualita,
+                         larghezza_foto=foto.width, altezza_foto=foto.height)
+        with open(percorso_base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'immagine': os.path.basename(percorso), 'attesi': valori,
+                       'testo': list(righe.values()) if isinstance(righe, dict) else righe,
+                       'parametri': parametri}, f, ensure_ascii=False, indent=1)
+    print(f"Generati {args.numero} documenti in {args.output} ({len(font_disponibili)} font disponibili).")
+    if incoerenti:
+        print(f"Attenzione: su {incoerenti} patenti il parser sbaglia già sul testo perfetto.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from metriche import misura, registra
+from motore_ocr import leggi_testo
+from mrz import ALFABETO_MRZ, analizza_td1, righe_mrz
+from parser_patente import analizza_testo_patente, pulisci_testo_ocr
+from preelaborazione import preelabora_immagine, soglia_adattiva, stima_inclinazione
+from zone_patente import individua_tessera
+
+# Riconoscimento del documento fotografato prima dell'OCR completo: fronte o
+# retro della patente, fronte o retro (con la MRZ) della carta d'identità
+# elettronica. Sono tutti nel formato ID-1, quindi il rapporto dei lati dice
+# solo se nella foto c'è una tessera. Prima si guardano i pixel: righe MRZ
+# (tre righe piene e fitte in basso) vogliono dire carta d'identità. Poi una
+# lettura a metà risoluzione della sola striscia alta della tessera (la
+# sonda), dove ci sono le intestazioni ("PATENTE DI GUIDA", "CARTA DI
+# IDENTITÀ") o, sul retro della patente, la tabella delle categorie: costa una
+# frazione dell'OCR completo, che così non si spreca su un retro o sul fronte
+# della carta d'identità. Se nemmeno la sonda decide si legge la foto come il
+# fronte della patente, il caso comune, e solo se non ne escono campi validi
+# si cerca il tipo nel testo letto.
+
+TIPO_PREDEFINITO = 'patente_fronte'
+
+# Zone in frazioni della tessera canonica: (sinistra, alto, destra, basso).
+ZONA_MRZ = (0.02, 0.58, 0.98, 0.98)
+ZONA_SONDA = (0.0, 0.0, 1.0, 0.4)
+SCALA_SONDA = 0.5
+
+# La MRZ ha solo maiuscole, cifre e '<' su righe fisse: lettura a blocco con alfabeto ridotto,
+# poi riga per riga con la segmentazione automatica se le cifre di controllo non tornano.
+CONFIG_MRZ = f'--psm 6 -c tessedit_char_whitelist={ALFABETO_MRZ}'
+CONFIG_MRZ_ALTERNATIVA = f'--psm 4 -c tessedit_char_whitelist={ALFABETO_MRZ}'
+CONFIG_SONDA = '--psm 11'
+
+# Righe MRZ sui pixel: larghezza di analisi, estensione minima della riga rispetto alla
+# tessera e numero minimo di caratteri (segmenti di inchiostro) su una riga.
+_LARGHEZZA_ANALISI_MRZ = 600
+_FINESTRA_SOGLIA_MRZ = 31
+_OFFSET_SOGLIA_MRZ = 10
+_ANGOLO_MAX_MRZ = 5.0
+_PASSO_ANGOLO_MRZ = 1.0
+# Quota minima di pixel di inchiostro perché una riga di pixel faccia parte di una riga di testo,
+# e quota media su tutta la riga di testo: l'OCR-B della MRZ è molto più fitto delle diciture
+# del fronte, e i puntini del rumore formano solo righe sottili e vuote.
+_INCHIOSTRO_RIGA_MRZ = 0.03
+_DENSITA_RIGA_MRZ = 0.2
+_ESTENSIONE_RIGA_MRZ = 0.75
+_CARATTERI_RIGA_MRZ = 18
+RIGHE_MRZ_MINIME = 2
+
+# Categorie di patente che compaiono nella tabella sul retro.
+_RE_CATEGORIE = re.compile(r'\b(AM|A1|A2|B1|BE|C1E|C1|CE|D1E|D1|DE)\b')
+
+Classificazione = namedtuple('Classificazione', 'tipo motivo tessera testo')
+
+
+def ritaglia(tessera, zona):
+    sinistra, alto, destra, basso = zona
+    w, h = tessera.size
+    return tessera.crop((round(sinistra * w), round(alto * h), round(destra * w), round(basso * h)))
+
+
+def dati_vuoti():
+    """Le chiavi di dati_patente, tutte vuote."""
+    return analizza_testo_patente('')
+
+
+def _segmenti(valori):
+    """Numero di tratti consecutivi True in un vettore booleano."""
+    return int(np.count_nonzero(valori[1:] & ~valori[:-1]) + valori[0])
+
+
+def conta_righe_mrz(tessera):
+    """Righe che sui pixel hanno l'aspetto di righe MRZ: piene da un bordo all'altro e fitte di caratteri."""
+    zona = ritaglia(tessera, ZONA_MRZ).convert('L')
+    scala = _LARGHEZZA_ANALISI_MRZ / zona.width
+    zona = zona.resize((_LARGHEZZA_ANALISI_MRZ, max(1, round(zona.height * scala))))
+    # Soglia locale: lo sfondo fuori dalla tessera e le ombre non diventano inchiostro.
+    binaria = soglia_adattiva(zona, _FINESTRA_SOGLIA_MRZ, _OFFSET_SOGLIA_MRZ)
+    # individua_tessera non raddrizza: su una foto storta le righe si toccherebbero nel profilo.
+    angolo = stima_inclinazione(binaria, _ANGOLO_MAX_MRZ, _PASSO_ANGOLO_MRZ)
+    if angolo:
+        binaria = binaria.rotate(angolo, resample=Image.NEAREST, fillcolor=255)
+    inchiostro = np.asarray(binaria) == 0
+    profilo = inchiostro.mean(axis=1)
+    con_testo = np.append(profilo > _INCHIOSTRO_RIGA_MRZ, False)
+    righe = 0
+    inizio = None
+    for y, attiva in enumerate(con_testo):
+        if attiva and inizio is None:
+            inizio = y
+        elif not attiva and inizio is not None:
+            colonne = inchiostro[inizio:y].any(axis=0)
+            piene = np.flatnonzero(colonne)
+            estensione = (piene[-1] - piene[0] + 1) / colonne.size if piene.size else 0
+            if (estensione >= _ESTENSIONE_RIGA_MRZ and _segmenti(colonne) >= _CARATTERI_RIGA_MRZ
+                    and profilo[inizio:y].mean() >= _DENSITA_RIGA_MRZ):
+                righe += 1
+            inizio = None
+    return righe
+
+
+def sonda_testo(tessera):
+    """Lettura veloce della striscia alta della tessera, a metà risoluzione."""
+    striscia = ritaglia(tessera, ZONA_SONDA)
+    striscia = striscia.resize((round(striscia.width * SCALA_SONDA), round(striscia.height * SCALA_SONDA)))
+    return leggi_testo(ImageOps.autocontrast(striscia.convert('L')), lang='ita', config=CONFIG_SONDA)
+
+
+def tipo_da_testo(testo):
+    """Tipo di documento dalle parole lette (sonda o pagina intera), o None se non si capisce."""
+    testo = testo.upper()
+    if righe_mrz(testo):
+        return 'carta_identita'
+    if 'PATENTE' in testo:
+        return 'patente_fronte'
+    if 'IDENTIT' in testo:
+        return 'carta_identita_fronte'
+    # Il fronte ha l'intestazione "REPUBBLICA ITALIANA"; il retro solo la tabella delle categorie.
+    if len(set(_RE_CATEGORIE.findall(testo))) >= 2 and 'REPUBBLICA' not in testo:
+        return 'patente_retro'
+    return None
+
+
+def classifica_documento(image):
+    """
+    Tipo del documento nella foto (vedi ocr_patente.ESTRATTORI) prima dell'OCR
+    completo: carta d'identità se ci sono le righe MRZ, altrimenti il tipo
+    indicato dalle parole della sonda o, se non ce ne sono, il tipo
+    predefinito (motivo 'predefinito', da confermare con riconosci_dal_testo).
+    Restituisce Classificazione(tipo, motivo, tessera, testo), con la tessera
+    già ritagliata e il testo della sonda.
+    """
+    inizio = time.perf_counter()
+    tessera = individua_tessera(image)
+    if conta_righe_mrz(tessera) >= RIGHE_MRZ_MINIME:
+        classificazione = Classificazione('carta_identita', 'righe MRZ', tessera, '')
+    else:
+        with misura('classificazione.sonda'):
+            testo = sonda_testo(tessera)
+        tipo = tipo_da_testo(testo)
+        classificazione = Classificazione(tipo or TIPO_PREDEFINITO, 'parole chiave' if tipo else 'predefinito',
+                                          tessera, testo)
+    registra('classificazione', (time.perf_counter() - inizio) * 1000,
+             tipo=classificazione.tipo, motivo=classificazione.motivo)
+    return classificazione
+
+
+def riconosci_dal_testo(classificazione, full_text):
+    """
+    Tipo del documento dopo una lettura come fronte della patente senza campi
+    validi, quando la sonda non aveva deciso: dalle parole del testo letto a
+    pagina intera. Classificazione con il testo da cui si è deciso.
+    """
+    tipo = tipo_da_testo(full_text)
+    if tipo is None:
+        return classificazione
+    return Classificazione(tipo, 'parole chiave', classificazione.tessera, full_text)
+
+
+def leggi_mrz(tessera):
+    """
+    (MRZ letta, sue righe, testo OCR): la lettura con più cifre di controllo
+    giuste; MRZ None e nessuna riga se in nessuna lettura ci sono tre righe.
+    """
+    zona = ImageOps.autocontrast(ritaglia(tessera, ZONA_MRZ).convert('L'))
+    migliore, righe_migliori, testi = None, [], []
+    for config in (CONFIG_MRZ, CONFIG_MRZ_ALTERNATIVA):
+        testo = leggi_testo(zona, lang='ita', config=config)
+        testi.append(testo)
+        righe = righe_mrz(testo)
+        if righe is None:
+            continue
+        letta = analizza_td1(righe)
+        if migliore is None or sum(letta.controlli.values()) > sum(migliore.controlli.values()):
+            migliore, righe_migliori = letta, righe
+        if all(letta.controlli.values()):
+            break
+    return migliore, righe_migliori, '\n'.join(testi)
+
+
+def dati_da_mrz(letta):
+    """dati_patente (con le chiavi in più della carta d'identità) da una MRZ letta."""
+    dati = dati_vuoti()
+    if letta is None:
+        dati['controllo_mrz'] = 'non letta'
+        return dati
+    dati.update(letta.campi)
+    errati = [campo for campo, valido in letta.controlli.items() if not valido]
+    dati['controllo_mrz'] = f"non valido: {', '.join(errati)}" if errati else 'valido'
+    return dati
+
+
+def mrz_nel_testo(full_text):
+    """dati_patente dalla MRZ trovata in un testo a pagina intera, se quasi tutte le cifre di controllo tornano."""
+    righe = righe_mrz(full_text)
+    if righe is None:
+        return None
+    letta = analizza_td1(righe)
+    return dati_da_mrz(letta) if sum(letta.controlli.values()) >= 3 else None
+
+
+def estrai_carta_identita(image, classificazione, modalita='pagina', preelaborazione=True):
+    """Retro della carta d'identità: legge solo la zona MRZ (la modalità non conta)."""
+    tessera = classificazione.tessera
+    if preelaborazione:
+        config = preelaborazione if isinstance(preelaborazione, dict) else None
+        with misura('preelaborazione'):
+            tessera = individua_tessera(preelabora_immagine(image, config)[0])
+    elif tessera is None:
+        tessera = individua_tessera(image)
+    with misura('mrz'):
+        letta, righe, full_text = leggi_mrz(tessera)
+    return dati_da_mrz(letta), full_text, '\n'.join(righe)
+
+
+def estrai_senza_dati(image, classificazione, modalita='pagina', preelaborazione=True):
+    """Lati senza dati da leggere (retro della patente, fronte della CIE): solo il testo della sonda."""
+    return dati_vuoti(), classificazione.testo, pulisci_testo_ocr(classificazione.testo)
@@ -0,0 +1,172 @@
+"""
+Estrazione in blocco dei dati delle patenti, senza interfaccia Streamlit.
+
+Esempi:
+    python estrazione_batch.py archivio/ --output risultati.jsonl
+    python estrazione_batch.py --lista percorsi.txt --output risultati.csv --workers 4
+    python estrazione_batch.py archivio/ --output risultati.jsonl --riprendi
+
+Le immagini vengono lette dai processi di lavoro una alla volta (mai tutte in
+memoria) e ogni risultato viene scritto appena pronto. Con --riprendi i file
+già presenti nell'output vengono saltati, così un'elaborazione interrotta
+riparte da dove si era fermata.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+ESTENSIONI_IMMAGINE = ('.jpg', '.jpeg', '.png', '.heic', '.heif')
+
+CAMPI_PATENTE = [
+    'cognome', 'nome', 'data_nascita', 'luogo_nascita',
+    'data_rilascio', 'data_scadenza', 'numero_patente'
+]
+# Carta d'identità: numero del documento ed esito delle cifre di controllo della MRZ.
+CAMPI_DOCUMENTO = ['tipo_documento', 'numero_documento', 'controllo_mrz']
+COLONNE_OUTPUT = ['file'] + CAMPI_PATENTE + CAMPI_DOCUMENTO + ['durata_ms', 'errore']
+
+
+def elenca_immagini(percorsi, lista=None):
+    """Generatore dei file immagine da elaborare: file indicati, cartelle (ricorsive) e righe di una lista."""
+    def da_percorso(percorso):
+        if os.path.isdir(percorso):
+            for cartella, sottocartelle, file in os.walk(percorso):
+                sottocartelle.sort()
+                for nome in sorted(file):
+                    if nome.lower().endswith(ESTENSIONI_IMMAGINE):
+                        yield os.path.join(cartella, nome)
+        else:
+            yield percorso
+
+    for percorso in percorsi:
+        yield from da_percorso(percorso)
+    if lista:
+        with open(lista, encoding='utf-8') as f:
+            for riga in f:
+                riga = riga.strip()
+                if riga and not riga.startswith('#'):
+                    yield from da_percorso(riga)
+
+
+def elabora_file(percorso, modalita):
+    """Eseguita nei processi di lavoro: estrae i dati da un file e non solleva mai eccezioni."""
+    # Import qui: il processo principale non ha bisogno di Tesseract né di Pillow.
+    from ocr_patente import estrai_dati_patente
+
+    riga = {'file': percorso, 'errore': ''}
+    inizio = time.perf_counter()
+    try:
+        dati_patente, _, _ = estrai_dati_patente(percorso, modalita=modalita)
+        riga.update(dati_patente)
+    except Exception as e:
+        riga.update({campo: '' for campo in CAMPI_PATENTE})
+        riga['errore'] = f"{type(e).__name__}: {e}"
+    riga['durata_ms'] = round((time.perf_counter() - inizio) * 1000, 1)
+    return {colonna: riga.get(colonna, '') for colonna in COLONNE_OUTPUT}
+
+
+class ScrittoreRisultati:
+    """Scrive le righe in JSONL o CSV (in aggiunta al file esistente), una per volta."""
+
+    def __init__(self, percorso, formato):
+        self.formato = formato
+        nuovo = not os.path.exists(percorso) or os.path.getsize(percorso) == 0
+        self._file = open(percorso, 'a', encoding='utf-8', newline='')
+        if formato == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=COLONNE_OUTPUT)
+            if nuovo:
+                self._csv.writeheader()
+
+    def scrivi(self, riga):
+        if self.formato == 'csv':
+            self._csv.writerow(riga)
+        else:
+            self._file.write(json.dumps(riga, ensure_ascii=False) + '\n')
+        # Ogni riga è subito su disco: un'interruzione non perde il lavoro fatto.
+        self._file.flush()
+
+    def chiudi(self):
+        self._file.close()
+
+
+def file_gia_elaborati(percorso, formato):
+    """Insieme dei file già presenti in un output precedente (per --riprendi)."""
+    if not os.path.exists(percorso):
+        return set()
+    fatti = set()
+    with open(percorso, encoding='utf-8', newline='') as f:
+        if formato == 'csv':
+            for riga in csv.DictReader(f):
+                fatti.add(riga.get('file'))
+        else:
+            for linea in f:
+                try:
+                    fatti.add(json.loads(linea)['file'])
+                except (ValueError, KeyError):
+                    # Riga troncata da un'interruzione: il file verrà rielaborato.
+                    continue
+    return fatti
+
+
+def esegui(percorsi, output, formato, workers, modalita, riprendi=False, lista=None):
+    saltare = file_gia_elaborati(output, formato) if riprendi else set()
+    scrittore = ScrittoreRisultati(output, formato)
+    # Al massimo due file in coda per processo: la memoria non cresce con l'archivio.
+    max_in_volo = workers * 2
+    elaborati = errori = 0
+    inizio = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_volo = set()
+            for percorso in elenca_immagini(percorsi, lista):
+                if percorso in saltare:
+                    continue
+                if len(in_volo) >= max_in_volo:
+                    completati, in_volo = wait(in_volo, return_when=FIRST_COMPLETED)
+                    for futuro in completati:
+                        riga = futuro.result()
+                        scrittore.scrivi(riga)
+                        elaborati += 1
+                        errori += bool(riga['errore'])
+                in_volo.add(executor.submit(elabora_file, percorso, modalita))
+            for futuro in wait(in_volo).done:
+                riga = futuro.result()
+                scrittore.scrivi(riga)
+                elaborati += 1
+                errori += bool(riga['errore'])
+    finally:
+        scrittore.chiudi()
+    durata = time.perf_counter() - inizio
+    print(f"Elaborati {elaborati} file ({errori} con errori, {len(saltare)} già presenti) "
+          f"in {durata:.1f} s", file=sys.stderr)
+    return elaborati, errori
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estrae in blocco i dati da foto di patenti (JPG/PNG/HEIC).")
+    parser.add_argument('percorsi', nargs='*', help="File immagine o cartelle da esplorare ricorsivamente")
+    parser.add_argument('--lista', help="File di testo con un percorso per riga")
+    parser.add_argument('--output', required=True, help="File di output (.jsonl o .csv)")
+    parser.add_argument('--formato', choices=['jsonl', 'csv'],
+                        help="Formato di output (predefinito: dall'estensione del file)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Numero di processi di lavoro (predefinito: numero di core)")
+    parser.add_argument('--modalita', choices=['pagina', 'zone', 'cascata'], default='pagina',
+                        help="Modalità di lettura OCR (vedi estrai_dati_patente)")
+    parser.add_argument('--riprendi', action='store_true',
+                        help="Salta i file già presenti nel file di output")
+    args = parser.parse_args(argv)
+
+    if not args.percorsi and not args.lista:
+        parser.error("indicare almeno un file, una cartella o --lista")
+    formato = args.formato or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    esegui(args.percorsi, args.output, formato, max(1, args.workers), args.modalita,
+           riprendi=args.riprendi, lista=args.lista)
+
+
+if __name__ == '__main__':
+    main()
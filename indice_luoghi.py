@@ -0,0 +1,270 @@
+"""
+Suggerimento del luogo di nascita letto dall'OCR dall'elenco dei luoghi (luoghi.txt).
+
+    python indice_luoghi.py                                   # ricostruisce l'indice
+    python indice_luoghi.py --istat Elenco-comuni-italiani.csv  # aggiunge i comuni ISTAT
+    python indice_luoghi.py --cerca "TORTQNA AL"
+
+L'indice è per trigrammi: ogni nome normalizzato (maiuscolo, senza accenti né
+apostrofi) è scomposto nei gruppi di tre caratteri, e per ogni trigramma si
+tengono i luoghi che lo contengono. Una ricerca conta i trigrammi in comune
+con pochi elenchi già pronti, poi calcola la distanza di Levenshtein solo sui
+candidati migliori: resta sotto il millisecondo anche con tutti i comuni.
+L'indice si costruisce dall'elenco al primo uso e si salva nella cartella di
+cache dell'utente (vedi cartella_cache); dopo si carica quello, e si ricostruisce
+da solo se luoghi.txt è cambiato.
+
+Il luogo trovato è solo un suggerimento per l'operatore, mai una sostituzione:
+l'elenco non ha tutti i comuni, e un comune vero ma assente (es. SAREZZANO)
+verrebbe cambiato nel più simile dell'elenco (AVEZZANO).
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import io
+import os
+import pickle
+import sys
+import time
+import unicodedata
+from collections import Counter, namedtuple
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+ELENCO_LUOGHI = os.path.join(CARTELLA, 'luoghi.txt')
+VERSIONE_INDICE = 1
+
+# Sigla dei luoghi esteri in luoghi.txt.
+ESTERO = 'EE'
+# Confidenza minima per suggerire all'operatore il luogo dell'elenco.
+SOGLIA_SUGGERIMENTO = 0.6
+# Candidati (per trigrammi in comune) su cui calcolare la distanza di Levenshtein.
+CANDIDATI = 12
+# Vantaggio del luogo della provincia letta accanto al nome.
+BONUS_SIGLA = 0.05
+
+Luogo = namedtuple('Luogo', 'nome sigla confidenza')
+
+
+def cartella_cache():
+    """Cartella per i file generati: SCANNER_CACHE_DIR, oppure la cache dell'utente del sistema operativo."""
+    if os.environ.get('SCANNER_CACHE_DIR'):
+        return os.environ['SCANNER_CACHE_DIR']
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'scanner_patenti')
+
+
+INDICE_LUOGHI = os.path.join(cartella_cache(), 'luoghi.idx')
+
+
+def normalizza(testo):
+    """Chiave di ricerca: maiuscolo, senza accenti, con spazi al posto di apostrofi e trattini."""
+    testo = unicodedata.normalize('NFKD', testo.upper())
+    testo = ''.join(c if 'A' <= c <= 'Z' else ' ' for c in testo if not unicodedata.combining(c))
+    return ' '.join(testo.split())
+
+
+def forma_patente(nome):
+    """Nome come stampato sulla patente: maiuscolo e con l'apostrofo al posto dell'accento (FORLÌ -> FORLI')."""
+    risultato = []
+    for c in unicodedata.normalize('NFD', nome.upper()):
+        if unicodedata.combining(c):
+            risultato.append("'")
+        else:
+            risultato.append(c)
+    return ''.join(risultato)
+
+
+def trigrammi(chiave):
+    spaziata = f"  {chiave} "
+    return {spaziata[i:i + 3] for i in range(len(spaziata) - 2)}
+
+
+def distanza(a, b, limite=None):
+    """Distanza di Levenshtein tra due stringhe; oltre `limite` si ferma e restituisce limite + 1."""
+    if len(a) < len(b):
+        a, b = b, a
+    if limite is not None and len(a) - len(b) > limite:
+        return limite + 1
+    precedente = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        corrente = [i]
+        for j, cb in enumerate(b, 1):
+            corrente.append(min(precedente[j] + 1, corrente[j - 1] + 1, precedente[j - 1] + (ca != cb)))
+        if limite is not None and min(corrente) > limite:
+            return limite + 1
+        precedente = corrente
+    return precedente[-1] if limite is None else min(precedente[-1], limite + 1)
+
+
+def leggi_elenco(percorso=ELENCO_LUOGHI):
+    """[(nome, sigla)] dal file dell'elenco, ignorando righe vuote e commenti."""
+    luoghi = []
+    with open(percorso, encoding='utf-8') as f:
+        for riga in f:
+            riga = riga.strip()
+            if riga and not riga.startswith('#'):
+                nome, _, sigla = riga.partition(';')
+                luoghi.append((nome.strip(), sigla.strip()))
+    return luoghi
+
+
+class IndiceLuoghi:
+    """Indice per trigrammi dei luoghi, con ricerca del più vicino a un testo OCR."""
+
+    def __init__(self, luoghi):
+        self.nomi = [nome for nome, _ in luoghi]
+        self.sigle = [sigla for _, sigla in luoghi]
+        self.chiavi = [normalizza(nome) for nome in self.nomi]
+        self.province = frozenset(s for s in self.sigle if s != ESTERO)
+        self.esatti = {}
+        liste = {}
+        for posizione, chiave in enumerate(self.chiavi):
+            self.esatti.setdefault(chiave, []).append(posizione)
+            for trigramma in trigrammi(chiave):
+                liste.setdefault(trigramma, []).append(posizione)
+        self.trigrammi = {trigramma: tuple(posizioni) for trigramma, posizioni in liste.items()}
+        self.quanti_trigrammi = [len(trigrammi(chiave)) for chiave in self.chiavi]
+
+    def __len__(self):
+        return len(self.nomi)
+
+    def cerca(self, testo, sigla=None):
+        """Luogo più vicino al testo (a parità, quello della provincia `sigla`), o None."""
+        chiave = normalizza(testo)
+        if not chiave:
+            return None
+        esatti = self.esatti.get(chiave)
+        if esatti:
+            scelto = next((p for p in esatti if self.sigle[p] == sigla), esatti[0])
+            return Luogo(self.nomi[scelto], self.sigle[scelto], 1.0)
+
+        propri = trigrammi(chiave)
+        comuni = Counter()
+        for trigramma in propri:
+            comuni.update(self.trigrammi.get(trigramma, ()))
+        if not comuni:
+            return None
+        # Coefficiente di Dice sui trigrammi per scegliere i candidati.
+        candidati = heapq.nlargest(
+            CANDIDATI, comuni, key=lambda p: comuni[p] / (len(propri) + self.quanti_trigrammi[p]))
+
+        migliore, punteggio_migliore = None, -1.0
+        for posizione in candidati:
+            candidata = self.chiavi[posizione]
+            lunghezza = max(len(chiave), len(candidata))
+            # La sigla letta accanto al nome decide tra omonimi e candidati quasi pari.
+            bonus = BONUS_SIGLA if sigla and self.sigle[posizione] == sigla else 0
+            # Oltre questa distanza il candidato non può superare il migliore: il calcolo si ferma prima.
+            limite = int((1 + bonus - punteggio_migliore) * lunghezza)
+            confidenza = 1 - distanza(chiave, candidata, limite) / lunghezza
+            punteggio = confidenza + bonus
+            if punteggio > punteggio_migliore:
+                migliore, punteggio_migliore = Luogo(self.nomi[posizione], self.sigle[posizione],
+                                                     round(confidenza, 3)), punteggio
+        return migliore
+
+    def correggi_luogo(self, testo):
+        """
+        (valore suggerito, confidenza) per un luogo di nascita letto dall'OCR,
+        es. "TORTQNA AL" -> ("TORTONA AL", 0.857). Se il testo finisce con una
+        sigla di provincia, la ricerca la usa e il valore la mantiene (quella
+        dell'elenco). Senza corrispondenze restituisce (testo, 0.0).
+        """
+        parole = testo.split()
+        sigla = None
+        if len(parole) > 1 and parole[-1] in self.province:
+            sigla = parole.pop()
+        luogo = self.cerca(' '.join(parole), sigla)
+        if luogo is None:
+            return testo, 0.0
+        if sigla and luogo.sigla != ESTERO:
+            return f"{luogo.nome} {luogo.sigla}", luogo.confidenza
+        return luogo.nome, luogo.confidenza
+
+
+def _impronta(percorso):
+    with open(percorso, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def costruisci_indice(percorso_elenco=ELENCO_LUOGHI, percorso_indice=INDICE_LUOGHI):
+    """Costruisce l'indice dall'elenco e lo salva (se la cartella è scrivibile)."""
+    indice = IndiceLuoghi(leggi_elenco(percorso_elenco))
+    try:
+        os.makedirs(os.path.dirname(percorso_indice), exist_ok=True)
+        with open(percorso_indice, 'wb') as f:
+            # Solo gli attributi (tipi predefiniti): il file non dipende dal modulo che l'ha scritto.
+            pickle.dump({'versione': VERSIONE_INDICE, 'impronta': _impronta(percorso_elenco),
+                         'attributi': vars(indice)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return indice
+
+
+def carica_indice(percorso_elenco=ELENCO_LUOGHI, percorso_indice=INDICE_LUOGHI):
+    """Indice salvato nella cache; se manca o non corrisponde all'elenco lo ricostruisce."""
+    try:
+        with open(percorso_indice, 'rb') as f:
+            salvato = pickle.load(f)
+        if (salvato.get('versione') == VERSIONE_INDICE
+                and salvato.get('impronta') == _impronta(percorso_elenco)):
+            indice = IndiceLuoghi.__new__(IndiceLuoghi)
+            indice.__dict__.update(salvato['attributi'])
+            return indice
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+        pass
+    return costruisci_indice(percorso_elenco, percorso_indice)
+
+
+def importa_istat(percorso_csv, percorso_elenco=ELENCO_LUOGHI):
+    """Aggiunge all'elenco i comuni del CSV ISTAT (Elenco-comuni-italiani.csv); restituisce quanti."""
+    with open(percorso_csv, 'rb') as f:
+        grezzo = f.read()
+    try:
+        testo = grezzo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        testo = grezzo.decode('latin-1')
+    presenti = {(normalizza(nome), sigla) for nome, sigla in leggi_elenco(percorso_elenco)}
+    nuovi = []
+    for riga in csv.DictReader(io.StringIO(testo), delimiter=';'):
+        nome = forma_patente(riga['Denominazione in italiano'].strip())
+        sigla = riga['Sigla automobilistica'].strip().upper()
+        if nome and sigla and (normalizza(nome), sigla) not in presenti:
+            presenti.add((normalizza(nome), sigla))
+            nuovi.append(f"{nome};{sigla}")
+    if nuovi:
+        with open(percorso_elenco, 'a', encoding='utf-8') as f:
+            f.write("\n# Comuni ISTAT\n" + "\n".join(sorted(nuovi)) + "\n")
+    return len(nuovi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costruisce l'indice dei luoghi di nascita o lo interroga.")
+    parser.add_argument('--istat', help="CSV ISTAT dei comuni da aggiungere a luoghi.txt")
+    parser.add_argument('--cerca', nargs='*', help="Luoghi letti dall'OCR da cercare nell'elenco")
+    args = parser.parse_args()
+
+    if args.istat:
+        print(f"Aggiunti {importa_istat(args.istat)} comuni a {ELENCO_LUOGHI}")
+    if args.cerca:
+        indice = carica_indice()
+        for testo in args.cerca:
+            inizio = time.perf_counter()
+            valore, confidenza = indice.correggi_luogo(testo)
+            print(f"{testo!r} -> {valore!r} (confidenza {confidenza:.2f}, "
+                  f"{(time.perf_counter() - inizio) * 1000:.3f} ms)")
+        return
+    inizio = time.perf_counter()
+    indice = costruisci_indice()
+    print(f"Indice di {len(indice)} luoghi salvato in {INDICE_LUOGHI} "
+          f"({(time.perf_counter() - inizio) * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from parser_patente import espandi_anno
+
+# Indice locale (SQLite) dei controlli già fatti, per avvisare al momento del
+# salvataggio se la stessa targa o la stessa persona (cognome, nome e data di
+# nascita) sono già state controllate di recente. Si aggiorna a ogni
+# salvataggio dall'app e a ogni sincronizzazione del foglio (vedi
+# sync_sheets.MirrorFoglio): le ricerche non leggono mai il foglio e, grazie
+# agli indici su targa e persona, restano immediate anche con anni di storico.
+
+GIORNI_PRECEDENTI = 90
+MAX_PRECEDENTI = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS controlli (
+    id_riga TEXT PRIMARY KEY,
+    origine TEXT NOT NULL,
+    data_ora TEXT NOT NULL,
+    comune TEXT NOT NULL,
+    targa TEXT NOT NULL,
+    cognome TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    data_nascita TEXT NOT NULL,
+    chiave_targa TEXT NOT NULL,
+    chiave_persona TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS controlli_targa ON controlli (chiave_targa, data_ora);
+CREATE INDEX IF NOT EXISTS controlli_persona ON controlli (chiave_persona, data_ora);
+"""
+
+_RE_NON_ALFANUMERICI = re.compile(r'[^A-Z0-9]')
+_RE_SEPARATORI_DATA = re.compile(r'[./\-\s]+')
+_RE_DATA_ORA = re.compile(r'(\d{2})/(\d{2})/(\d{4}) (\d{2}):(\d{2})(?::(\d{2}))?')
+_FORMATI_DATA_ORA = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+
+
+def chiave_targa(targa):
+    """Targa normalizzata: maiuscola, senza spazi né trattini."""
+    return _RE_NON_ALFANUMERICI.sub('', (targa or '').upper())
+
+
+def _data_nascita_normalizzata(data):
+    parti = [p for p in _RE_SEPARATORI_DATA.split((data or '').strip()) if p]
+    if len(parti) != 3 or not all(p.isdigit() for p in parti):
+        return ''
+    return espandi_anno(f"{int(parti[0]):02d}/{int(parti[1]):02d}/{parti[2]}")
+
+
+def chiave_persona(cognome, nome, data_nascita):
+    """COGNOME|NOME|GG/MM/AAAA normalizzati, o '' se manca uno dei tre."""
+    parti = [' '.join(_RE_NON_ALFANUMERICI.sub(' ', (v or '').upper()).split()) for v in (cognome, nome)]
+    parti.append(_data_nascita_normalizzata(data_nascita))
+    return '|'.join(parti) if all(parti) else ''
+
+
+def data_ora_iso(valore):
+    """DATA_ORA del foglio (GG/MM/AAAA HH:MM[:SS]) in formato ordinabile, o '' se non leggibile."""
+    valore = (valore or '').strip()
+    # Formato scritto dall'app: basta riordinare i pezzi (strptime costerebbe 30 µs a riga).
+    # I giorni oltre il 28, che dipendono da mese e anno, e i valori fuori
+    # intervallo passano da strptime, che li controlla davvero.
+    parti = _RE_DATA_ORA.fullmatch(valore)
+    if parti:
+        giorno, mese, anno, ora, minuti, secondi = parti.groups()
+        secondi = secondi or '00'
+        if '01' <= giorno <= '28' and '01' <= mese <= '12' and ora <= '23' and minuti <= '59' and secondi <= '59':
+            return f"{anno}-{mese}-{giorno} {ora}:{minuti}:{secondi}"
+    for formato in _FORMATI_DATA_ORA:
+        try:
+            return datetime.strptime(valore, formato).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    return ''
+
+
+def _riga_indice(id_riga, origine, dati):
+    return (
+        id_riga, origine, data_ora_iso(dati.get("DATA_ORA")), dati.get("COMUNE", ""), dati.get("TARGA", ""),
+        dati.get("COGNOME", ""), dati.get("NOME", ""), dati.get("DATA_NASCITA", ""),
+        chiave_targa(dati.get("TARGA")),
+        chiave_persona(dati.get("COGNOME"), dati.get("NOME"), dati.get("DATA_NASCITA")),
+    )
+
+
+class IndicePrecedenti:
+    """Controlli già salvati, cercabili per targa e per persona."""
+
+    def __init__(self, percorso_db):
+        self.percorso_db = percorso_db
+        with self._connetti() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connetti(self):
+        conn = sqlite3.connect(self.percorso_db, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def registra(self, id_riga, dati):
+        """Aggiunge un controllo appena salvato dall'app (dizionario colonna -> valore)."""
+        with self._connetti() as conn:
+            conn.execute("INSERT OR REPLACE INTO controlli VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         _riga_indice(id_riga, 'app', dati))
+
+    def aggiorna_da_foglio(self, intestazioni, righe, completa=False):
+        """
+        Aggiunge le righe del foglio [(numero di riga, valori)]. Le righe con
+        l'identificativo della coda di invio (colonna ID_RIGA) sostituiscono il
+        controllo salvato dall'app; con completa=True si ricomincia da zero per
+        le righe del foglio.
+        """
+        posizione_id = intestazioni.index("ID_RIGA") if "ID_RIGA" in intestazioni else None
+        voci = []
+        for numero, valori in righe:
+            if not any(str(c).strip() for c in valori):
+                continue
+            dati = dict(zip(intestazioni, valori))
+            id_riga = valori[posizione_id] if posizione_id is not None and len(valori) > posizione_id else ''
+            voci.append(_riga_indice(id_riga or f"foglio:{numero}", 'foglio', dati))
+        with self._connetti() as conn:
+            if completa:
+                conn.execute("DELETE FROM controlli WHERE origine = 'foglio'")
+            conn.executemany("INSERT OR REPLACE INTO controlli VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", voci)
+        return len(voci)
+
+    def vuoto(self):
+        with self._connetti() as conn:
+            return conn.execute("SELECT 1 FROM controlli LIMIT 1").fetchone() is None
+
+    def _cerca(self, conn, colonna, chiave, dal):
+        # DISTINCT: una riga del foglio senza ID_RIGA e la stessa riga salvata dall'app coincidono.
+        return [
+            dict(zip(("data_ora", "comune", "targa", "cognome", "nome", "data_nascita"), riga))
+            for riga in conn.execute(
+                f"SELECT DISTINCT data_ora, comune, targa, cognome, nome, data_nascita FROM controlli "
+                f"WHERE {colonna} = ? AND data_ora >= ? ORDER BY data_ora DESC LIMIT ?",
+                (chiave, dal, MAX_PRECEDENTI)
+            )
+        ]
+
+    def cerca(self, targa='', cognome='', nome='', data_nascita='', giorni=GIORNI_PRECEDENTI):
+        """
+        Controlli degli ultimi `giorni` giorni con la stessa targa e con la stessa
+        persona: {'targa': [...], 'persona': [...]}, dal più recente; ogni
+        controllo è un dizionario con data_ora (AAAA-MM-GG HH:MM:SS), comune,
+        targa, cognome, nome e data_nascita.
+        """
+        dal = (datetime.now() - timedelta(days=giorni)).strftime("%Y-%m-%d %H:%M:%S")
+        risultato = {'targa': [], 'persona': []}
+        chiavi = {'targa': chiave_targa(targa), 'persona': chiave_persona(cognome, nome, data_nascita)}
+        if not any(chiavi.values()):
+            return risultato
+        with self._connetti() as conn:
+            for tipo, chiave in chiavi.items():
+                if chiave:
+                    risultato[tipo] = self._cerca(conn, f"chiave_{tipo}", chiave, dal)
+        return risultato
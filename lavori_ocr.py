@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler_ocr import sessione_corrente
+
+# Lavori OCR eseguiti in background, così la sessione Streamlit non resta
+# bloccata mentre Tesseract legge la foto. Ogni lavoro è identificato dall'hash
+# dell'immagine (più la modalità di lettura): la stessa foto caricata due volte,
+# anche da sessioni diverse, produce un solo lavoro. Ogni sessione ha al più un
+# lavoro "corrente": un nuovo caricamento lo sostituisce, e se il precedente è
+# ancora in coda e nessun'altra sessione lo aspetta viene scartato senza
+# eseguirlo. Un lavoro già avviato non può essere interrotto: finisce e il suo
+# risultato resta nella cache OCR.
+
+# Un lavoro per core: quante letture Tesseract girano davvero insieme, e in che
+# ordine tra le sessioni, lo decide scheduler_ocr.
+MAX_LAVORATORI_DEFAULT = os.cpu_count() or 1
+MAX_LAVORI_DEFAULT = 64
+# Streamlit non avvisa quando una sessione si chiude: una sessione che non chiede
+# il suo lavoro da questo tempo si considera chiusa, e il lavoro si può potare.
+SESSIONE_INATTIVA_SECONDI = 2 * 60 * 60
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+ERRORE = 'errore'
+ANNULLATO = 'annullato'
+
+
+class LavoroOCR:
+    def __init__(self, chiave):
+        self.chiave = chiave
+        self.stato = IN_CODA
+        self.risultato = None
+        self.errore = ''
+        self.sessioni = set()
+        self.sessione_origine = ''
+        self.futuro = None
+
+    @property
+    def in_attesa(self):
+        return self.stato in (IN_CODA, IN_CORSO)
+
+
+class CodaLavoriOCR:
+    """Pool di thread per l'OCR, con i lavori indicizzati per hash dell'immagine."""
+
+    def __init__(self, max_lavoratori=MAX_LAVORATORI_DEFAULT, max_lavori=MAX_LAVORI_DEFAULT,
+                 funzione_ocr=None, sessione_inattiva_secondi=SESSIONE_INATTIVA_SECONDI):
+        """
+        funzione_ocr: chiamata come funzione_ocr(immagine, modalita=..., digest=...)
+        e deve restituire (dati_patente, full_text, cleaned_text_block); se None,
+        ocr_patente.estrai_dati_patente_cache, importata al primo lavoro.
+        """
+        self.max_lavori = max_lavori
+        self.funzione_ocr = funzione_ocr
+        self.sessione_inattiva_secondi = sessione_inattiva_secondi
+        self._executor = ThreadPoolExecutor(max_workers=max_lavoratori, thread_name_prefix='ocr')
+        self._lock = threading.Lock()
+        self._lavori = OrderedDict()
+        self._per_sessione = {}
+        self._ultimo_accesso = {}
+        self.annullati = 0
+
+    def invia(self, sessione, chiave_immagine, immagine, modalita='pagina'):
+        """
+        Rende il lavoro per questa immagine (già decodificata, con chiave_immagine
+        l'hash dei byte del file) il lavoro corrente della sessione, avviandolo se
+        non esiste già, e ne restituisce la chiave.
+        """
+        chiave = f"{modalita}:{chiave_immagine}"
+        with self._lock:
+            self._tocca(sessione)
+            precedente = self._per_sessione.get(sessione)
+            if precedente == chiave:
+                return chiave
+            if precedente is not None:
+                self._abbandona(sessione, precedente)
+            self._per_sessione[sessione] = chiave
+            lavoro = self._lavori.get(chiave)
+            if lavoro is None or lavoro.stato == ERRORE:
+                # Dopo un errore lo stesso file si può ricaricare per riprovare.
+                lavoro = LavoroOCR(chiave)
+                lavoro.sessione_origine = sessione
+                self._lavori[chiave] = lavoro
+                lavoro.futuro = self._executor.submit(self._esegui, lavoro, immagine, chiave_immagine, modalita)
+            self._lavori.move_to_end(chiave)
+            lavoro.sessioni.add(sessione)
+            self._pota()
+        return chiave
+
+    def lavoro(self, sessione):
+        """Il lavoro corrente della sessione, o None."""
+        with self._lock:
+            self._tocca(sessione)
+            chiave = self._per_sessione.get(sessione)
+            return self._lavori.get(chiave) if chiave is not None else None
+
+    def annulla(self, sessione):
+        """La sessione non aspetta più nessun risultato (es. foto rimossa)."""
+        with self._lock:
+            self._ultimo_accesso.pop(sessione, None)
+            chiave = self._per_sessione.pop(sessione, None)
+            if chiave is not None:
+                self._abbandona(sessione, chiave)
+
+    def in_coda(self):
+        with self._lock:
+            return sum(1 for lavoro in self._lavori.values() if lavoro.in_attesa)
+
+    def _tocca(self, sessione):
+        # Segna l'accesso della sessione e dimentica quelle inattive da troppo tempo.
+        adesso = time.monotonic()
+        self._ultimo_accesso[sessione] = adesso
+        limite = adesso - self.sessione_inattiva_secondi
+        inattive = [s for s, visto in self._ultimo_accesso.items() if visto < limite]
+        for inattiva in inattive:
+            del self._ultimo_accesso[inattiva]
+            chiave = self._per_sessione.pop(inattiva, None)
+            if chiave is not None:
+                self._abbandona(inattiva, chiave)
+        if inattive:
+            self._pota()
+
+    def _abbandona(self, sessione, chiave):
+        lavoro = self._lavori.get(chiave)
+        if lavoro is None:
+            return
+        lavoro.sessioni.discard(sessione)
+        if not lavoro.sessioni and lavoro.stato == IN_CODA and lavoro.futuro.cancel():
+            lavoro.stato = ANNULLATO
+            del self._lavori[chiave]
+            self.annullati += 1
+
+    def _pota(self):
+        # Tiene solo gli ultimi max_lavori lavori finiti che nessuna sessione sta guardando.
+        eccesso = len(self._lavori) - self.max_lavori
+        if eccesso <= 0:
+            return
+        da_togliere = [chiave for chiave, lavoro in self._lavori.items()
+                       if not lavoro.in_attesa and not lavoro.sessioni][:eccesso]
+        for chiave in da_togliere:
+            del self._lavori[chiave]
+
+    def _esegui(self, lavoro, immagine, chiave_immagine, modalita):
+        with self._lock:
+            lavoro.stato = IN_CORSO
+        if self.funzione_ocr is None:
+            from ocr_patente import estrai_dati_patente_cache
+            self.funzione_ocr = estrai_dati_patente_cache
+        try:
+            with sessione_corrente(lavoro.sessione_origine):
+                risultato = self.funzione_ocr(immagine, modalita=modalita, digest=chiave_immagine)
+        except Exception as e:
+            with self._lock:
+                lavoro.errore = str(e)
+                lavoro.stato = ERRORE
+            return
+        with self._lock:
+            lavoro.risultato = risultato
+            lavoro.stato = COMPLETATO
+
+    def chiudi(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,17 +1,35 @@
+import time
+
+# Avvio a freddo e rerun si misurano da qui (vedi la fine del file).
+inizio_esecuzione = time.perf_counter()
+
 import streamlit as st
-from PIL import Image
-import pytesseract
-import pandas as pd
-import gspread
-import re
-from google.oauth2.service_account import Credentials
 from datetime import datetime
 import json
-import io
-import pillow_heif
-import pytz
-
-pillow_heif.register_heif_opener()
+import logging
+import os
+import sys
+import uuid
+
+from archivio_immagini import ArchivioImmagini
+from client_sheets import ClientSheets
+from indice_luoghi import SOGLIA_SUGGERIMENTO, carica_indice
+from indice_precedenti import GIORNI_PRECEDENTI, IndicePrecedenti
+from lavori_ocr import COMPLETATO, CodaLavoriOCR
+from memoria import RegistroSessioni, memoria_sessione, rss_processo
+from metriche import metriche, misura, registra
+from outbox_sheets import OutboxSheets
+from scheduler_ocr import scheduler_ocr
+from sync_sheets import MirrorFoglio
+
+# Moduli pesanti (pandas, gspread/google-auth, pytesseract, pillow_heif, pytz, la
+# catena OCR con numpy) si importano al primo uso, non all'avvio né a ogni rerun:
+# la prima pagina non ne ha bisogno.
+
+# I messaggi di debug dell'OCR (testo estratto, campi trovati) si attivano con SCANNER_LOG_LEVEL=DEBUG.
+logging.basicConfig(level=os.environ.get("SCANNER_LOG_LEVEL", "WARNING"))
+# Con SCANNER_LOG_METRICHE=INFO ogni span di metriche.py viene scritto come riga JSON.
+logging.getLogger("metriche").setLevel(os.environ.get("SCANNER_LOG_METRICHE", "WARNING"))
 
 st.set_page_config(
     page_title="Scanner Patenti - GdF",
@@ -20,45 +38,60 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-rome_tz = pytz.timezone('Europe/Rome')
-now_rome = datetime.now(pytz.utc).astimezone(rome_tz)
+def fuso_roma():
+    # pytz serve solo all'inizio e alla fine del soffermo.
+    import pytz
+    return pytz.timezone('Europe/Rome')
 
-# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+@st.cache_data(show_spinner=False)
+def leggi_immagine_statica(percorso):
+    # Logo e banner letti dal disco una sola volta, non a ogni rerun.
+    with open(percorso, "rb") as f:
+        return f.read()
 
 logo_path = "Logo1.png"
 try:
-    st.sidebar.image(logo_path, use_container_width=True)
+    st.sidebar.image(leggi_immagine_statica(logo_path), use_container_width=True)
 except Exception as e:
     st.sidebar.error(f"Errore nel caricamento del logo '{logo_path}': {e}. Assicurati che il file esista e sia leggibile.")
 
 st.sidebar.markdown("---")
 st.sidebar.write("La mia App Patenti")
 
-scope = [
-    "[https://spreadsheets.google.com/feeds](https://spreadsheets.google.com/feeds)",
-    "[https://www.googleapis.com/auth/spreadsheets](https://www.googleapis.com/auth/spreadsheets)",
-    "[https://www.googleapis.com/auth/drive.file](https://www.googleapis.com/auth/drive.file)",
-    "[https://www.googleapis.com/auth/drive](https://www.googleapis.com/auth/drive)"
-]
-
-try:
-    #creds_json_string = st.secrets["google_service_account_json"]
-    #service_account_info = json.loads(creds_json_string)
-    #creds = Credentials.from_service_account_info(service_account_info, scopes=scope)
-    #client = gspread.authorize(creds)
-    #sheet = client.open("Controlli_Pattuglia").sheet1
-    pass
-except KeyError:
-    st.error("Errore: La secret 'google_service_account_json' non è configurata o ha un nome errato. Verifica le tue Streamlit secrets.")
-except json.JSONDecodeError as e:
-    st.error(f"Errore di decodifica JSON delle credenziali Google Sheets: {e}. Controlla la formattazione della secret.")
-except Exception as e:
-    st.error(f"Errore generico durante l'autorizzazione di Google Sheets: {e}. Controlla la connessione o i permessi.")
+MODALITA_OCR = {
+    "Pagina intera": "pagina",
+    "Zone dei campi": "zone",
+    "Cascata (rapida, poi zone)": "cascata",
+}
+lettura_ocr = st.sidebar.radio(
+    "Lettura OCR",
+    list(MODALITA_OCR),
+    help="'Zone dei campi' ritaglia la tessera e legge solo i campi numerati: più veloce sulle foto nitide. "
+         "'Cascata' prova prima una lettura a bassa risoluzione e rilegge solo i campi mancanti.",
+    key="lettura_ocr_radio"
+)
+modalita_ocr = MODALITA_OCR[lettura_ocr]
+# La catena OCR si carica al primo documento: prima non ci sono statistiche della cascata.
+ocr_patente = sys.modules.get("ocr_patente")
+if ocr_patente is not None and ocr_patente.statistiche_cascata["documenti"]:
+    statistiche_cascata = ocr_patente.statistiche_cascata
+    st.sidebar.caption(
+        f"Cascata: {statistiche_cascata['documenti_solo_rapido']}/{statistiche_cascata['documenti']} "
+        "documenti risolti dal solo passaggio rapido."
+    )
+stato_scheduler = scheduler_ocr.statistiche()
+if stato_scheduler["eseguiti"]:
+    st.sidebar.caption(
+        f"OCR: {stato_scheduler['attivi']}/{stato_scheduler['max_concorrenti']} letture in corso, "
+        f"{stato_scheduler['in_coda']} in coda. Attesa p50 {stato_scheduler['attesa_p50_ms']:.0f} ms "
+        f"(p95 {stato_scheduler['attesa_p95_ms']:.0f}), lettura p50 {stato_scheduler['ocr_p50_ms']:.0f} ms "
+        f"(p95 {stato_scheduler['ocr_p95_ms']:.0f})."
+    )
 
 st.title("COMPAGNIA NOVI LIGURE")
 def show_banner():
     try:
-        st.image("sfondo.png", use_container_width=True)
+        st.image(leggi_immagine_statica("sfondo.png"), use_container_width=True)
     except FileNotFoundError:
         st.warning("File 'sfondo.png' non trovato. Assicurati che sia nel tuo repository.")
 
@@ -71,211 +104,30 @@ def show_banner():
     </style>
     """, unsafe_allow_html=True)
 
-def estrai_dati_patente(image_input):
-    """
-    Estrae i dati da un'immagine della patente usando OCR.
-    Accetta un percorso di file (stringa) o un oggetto immagine Pillow/Streamlit UploadedFile.
-    """
-    image = None
-    if isinstance(image_input, str):
-        # Se è un percorso, apri l'immagine
-        image = Image.open(image_input)
-    elif hasattr(image_input, 'getvalue'): # Se è un oggetto Streamlit UploadedFile
-        image = Image.open(io.BytesIO(image_input.getvalue()))
-    elif isinstance(image_input, Image.Image):
-        # Se è già un oggetto Pillow Image, usalo direttamente
-        image = image_input
-    else:
-        raise TypeError(f"Tipo di oggetto immagine non supportato: {type(image_input)}")
-
-    # Assicurati che l'immagine sia in modalità RGB per Tesseract se necessario
-    if image.mode == 'RGBA':
-        image = image.convert('RGB')
-    elif image.mode == 'P': # Gestisci immagini con palette
-        image = image.convert('RGB')
-
-    # Esegui l'OCR sull'intera immagine con lingua italiana
-    full_text = pytesseract.image_to_string(image, lang='ita')
-    print(f"DEBUG: Testo OCR completo estratto:\n{full_text}")
-
-    # Pulizia del testo: Rimuovi caratteri non alfanumerici, ma mantieni '/' '.' '-' '(' ')' ':'
-    # E poi normalizza gli spazi e le parentesi per il luogo di nascita
-    cleaned_text_block = full_text.upper()
-    
-    # Passaggio 1: Rimuovi caratteri indesiderati che non sono numeri, lettere, o i delimitatori / . - : ( )
-    # Mantieni il punto, il trattino, lo slash, i due punti, le parentesi e gli spazi.
-    # Ogni altro carattere viene rimosso.
-    cleaned_text_block = re.sub(r'[^A-Z0-9\s\/\.:\-\(\)]', '', cleaned_text_block)
-    
-    # Passaggio 2: Rimuovi le parentesi intorno al luogo di nascita
-    cleaned_text_block = re.sub(r'\(([A-Z\s]+)\)', r'\1', cleaned_text_block)
-    
-    # Passaggio 3: Normalizza gli spazi multipli in un singolo spazio
-    cleaned_text_block = re.sub(r'\s+', ' ', cleaned_text_block).strip()
-    
-    print(f"DEBUG: Testo OCR pulito per l'elaborazione:\n{cleaned_text_block}")
-
-    # Dizionario per i dati estratti
-    dati_patente = {
-        'cognome': '',
-        'nome': '',
-        'data_nascita': '',
-        'luogo_nascita': '',
-        'data_rilascio': '',
-        'data_scadenza': '',
-        'numero_patente': ''
-    }
-
-    # === REGEX MIGLIORATE E PIÙ SPECIFICHE PER I DELIMITATORI NUMERICI ===
-
-    # Regex per il cognome (campo 1)
-    # Cerchiamo "1." seguito da spazi, poi catturiamo il dato fino al prossimo numero di campo (2., 3., 4A., 4B., 4C., 5.)
-    cognome_match = re.search(r'1\s*\.\s*(.+?)(?=\s*(?:2|3|4A|4B|4C|5)\s*\.|$)', cleaned_text_block)
-    if cognome_match:
-        extracted_value = cognome_match.group(1).strip()
-        # Pulizia per rimuovere eventuali caratteri speciali indesiderati che Tesseract potrebbe aver aggiunto
-        cleaned_value = re.sub(r'[^A-Z\s\'-]', '', extracted_value).strip()
-        dati_patente['cognome'] = cleaned_value
-        print(f"DEBUG: Cognome (Campo 1) - Estratto: '{extracted_value}', Pulito: '{cleaned_value}'")
-    else:
-        print("DEBUG: Cognome (Campo 1) non trovato.")
-
-
-    # Regex per il nome (campo 2)
-    # Cerchiamo "2." seguito da spazi, poi catturiamo il dato fino al prossimo numero di campo (3., 4A., 4B., 4C., 5.)
-    nome_match = re.search(r'2\s*\.\s*(.+?)(?=\s*(?:3|4A|4B|4C|5)\s*\.|$)', cleaned_text_block)
-    if nome_match:
-        extracted_value = nome_match.group(1).strip()
-        cleaned_value = re.sub(r'[^A-Z\s\'-]', '', extracted_value).strip()
-        dati_patente['nome'] = cleaned_value
-        print(f"DEBUG: Nome (Campo 2) - Estratto: '{extracted_value}', Pulito: '{cleaned_value}'")
-    else:
-        print("DEBUG: Nome (Campo 2) non trovato.")
-
-    # Regex per data e luogo di nascita (campo 3)
-    # Cattura da "3." data (GG/MM/AA o AAAA) e poi luogo, fino all'inizio del campo 4A o 4C o fine stringa
-    data_luogo_nascita_match = re.search(
-        r'3\s*\.\s*(\d{2}[./]\d{2}[./]\d{2}(?:\d{2})?)\s*([A-Z\s\'-]+?)(?=\s*(?:4A|4C|4B|5)\s*\.|$)',
-        cleaned_text_block
-    )
-    if data_luogo_nascita_match:
-        data_nascita_raw = data_luogo_nascita_match.group(1).strip()
-        # Converte l'anno a 2 cifre in 4 cifre
-        anno_raw = data_nascita_raw[-2:]
-        if len(anno_raw) == 2:
-            current_year_last_two_digits = datetime.now().year % 100
-            # Aggiunta una tolleranza di 5 anni nel futuro per patenti molto recenti
-            if int(anno_raw) <= current_year_last_two_digits + 5:
-                anno_full = f"20{anno_raw}"
-            else:
-                anno_full = f"19{anno_raw}"
-            dati_patente['data_nascita'] = data_nascita_raw[:-2] + anno_full
-        else: # Se l'anno è già a 4 cifre
-            dati_patente['data_nascita'] = data_nascita_raw
-
-        extracted_luogo = data_luogo_nascita_match.group(2).strip() # Group 2 per il luogo
-        cleaned_luogo = re.sub(r'[^A-Z\s\'-]', '', extracted_luogo).strip() # Pulizia ulteriore
-        dati_patente['luogo_nascita'] = cleaned_luogo
-        print(f"DEBUG: Data di Nascita (Campo 3) - Estratto: '{data_nascita_raw}', Pulito: '{dati_patente['data_nascita']}'")
-        print(f"DEBUG: Luogo di Nascita (Campo 3) - Estratto: '{extracted_luogo}', Pulito: '{cleaned_luogo}'")
-    else:
-        print("DEBUG: Data e Luogo di Nascita (Campo 3) non trovati.")
-
-    # Regex per data di rilascio (campo 4a)
-    data_rilascio_match = re.search(r'4A\s*\.\s*(\d{2}[./]\d{2}[./]\d{4})(?=\s*(?:4C|4B|5)\s*\.|$)', cleaned_text_block)
-    if data_rilascio_match:
-        dati_patente['data_rilascio'] = data_rilascio_match.group(1).strip()
-        print(f"DEBUG: Data di Rilascio (Campo 4A) - Estratto: '{dati_patente['data_rilascio']}'")
-    else:
-        print("DEBUG: Data di Rilascio (Campo 4A) non trovata.")
-
-    # Regex per data di scadenza (campo 4b)
-    data_scadenza_match = re.search(r'4B\s*\.\s*(\d{2}[./]\d{2}[./]\d{4})(?=\s*(?:4C|5)\s*\.|$)', cleaned_text_block)
-    if data_scadenza_match:
-        dati_patente['data_scadenza'] = data_scadenza_match.group(1).strip()
-        print(f"DEBUG: Data di Scadenza (Campo 4B) - Estratto: '{dati_patente['data_scadenza']}'")
-    else:
-        print("DEBUG: Data di Scadenza (Campo 4B) non trovata.")
-
-    # Regex per il numero della patente (campo 5)
-    # Cerchiamo "5." seguito da spazi, poi una sequenza di alfanumerici, "/", o "-" di almeno 8 caratteri.
-    numero_patente_match = re.search(r'5\s*\.\s*([A-Z0-9\/\-]{8,})', cleaned_text_block)
-    if numero_patente_match:
-        extracted_value = numero_patente_match.group(1).strip()
-        cleaned_value = re.sub(r'\s+', '', extracted_value) # Rimuovi spazi extra interni
-        dati_patente['numero_patente'] = cleaned_value
-        print(f"DEBUG: Numero Patente (Campo 5) - Estratto: '{extracted_value}', Pulito: '{cleaned_value}'")
-    else:
-        # Fallback più generico se la regex stretta fallisce.
-        # Questo catturerà qualsiasi cosa dopo "5." ma potrebbe essere meno preciso.
-        numero_patente_fallback_match = re.search(r'5\s*\.\s*(\S+)', cleaned_text_block)
-        if numero_patente_fallback_match:
-            extracted_value = numero_patente_fallback_match.group(1).strip()
-            cleaned_value = re.sub(r'\s+', '', extracted_value)
-            dati_patente['numero_patente'] = cleaned_value
-            print(f"DEBUG: Numero Patente (Campo 5) - FALLBACK - Estratto: '{extracted_value}', Pulito: '{cleaned_value}'")
-        else:
-            print("DEBUG: Numero Patente (Campo 5) non trovato.")
-
-    return dati_patente, full_text, cleaned_text_block
-
-st.title("Scanner Patente")
-
-uploaded_file = st.file_uploader("Carica un'immagine della patente", type=["png", "jpg", "jpeg", "heic"])
-
-if uploaded_file is not None:
-    try:
-        st.image(uploaded_file, caption='Immagine Caricata.', use_column_width=True)
-        st.write("Elaborazione in corso...")
-
-        dati_patente, full_text_debug, cleaned_text_block_debug = estrai_dati_patente(uploaded_file)
-
-        st.subheader("Dati Estratti:")
-        st.write(f"**Cognome:** {dati_patente['cognome']}")
-        st.write(f"**Nome:** {dati_patente['nome']}")
-        st.write(f"**Data di Nascita:** {dati_patente['data_nascita']}")
-        st.write(f"**Luogo di Nascita:** {dati_patente['luogo_nascita']}")
-        st.write(f"**Data di Rilascio:** {dati_patente['data_rilascio']}")
-        st.write(f"**Data di Scadenza:** {dati_patente['data_scadenza']}")
-        st.write(f"**Numero Patente:** {dati_patente['numero_patente']}")
-
-        st.subheader("Informazioni di Debug (per l'assistenza):")
-        st.text_area("Testo OCR completo estratto:", value=full_text_debug, height=200)
-        st.text_area("Testo OCR pulito per l'elaborazione:", value=cleaned_text_block_debug, height=200)
-        st.json(dati_patente)
-
-    except Exception as e:
-        st.error(f"Si è verificato un errore durante l'elaborazione: {e}")
-        st.error("Assicurati che l'immagine sia chiara e leggibile e che le dipendenze siano installate correttamente.")
-
 def aggiorna_su_google_sheets(dati_dict):
+    """Mette il controllo nella coda locale: l'invio al foglio avviene in background."""
     values = [dati_dict.get(col, "") for col in COLUMNS]
-    sheet.append_row(values)
+    with misura("aggiorna_su_google_sheets"):
+        id_riga = avvia_outbox().accoda(values)
+        indice_precedenti().registra(id_riga, dati_dict)
+    return id_riga
 
-def get_current_data_from_sheet():
-    data_raw = sheet.get_all_values()
-    if not data_raw:
-        return pd.DataFrame(columns=COLUMNS)
-
-    header_row_index = -1
-    for i, row in enumerate(data_raw):
-        if "DATA_ORA" in [c.strip().upper() for c in row]:
-            header_row_index = i
-            break
+def get_current_data_from_sheet(completa=False):
+    """
+    Dati del foglio dalla copia locale condivisa: entro il TTL nessuna richiesta
+    al foglio, altrimenti si scaricano solo le righe nuove (tutto con completa=True).
+    """
+    mirror = mirror_controlli()
+    with misura("get_current_data_from_sheet", completa=completa):
+        mirror.sincronizza(completa=completa)
+        df = mirror.dataframe()
 
-    if header_row_index == -1:
+    if df is None:
+        import pandas as pd
         st.warning("Impossibile trovare le intestazioni nel foglio Google. Verificare il formato o il nome della colonna 'DATA_ORA'.")
         return pd.DataFrame(columns=COLUMNS)
-
-    headers = [c.strip().upper() for c in data_raw[header_row_index]]
-    data_rows = data_raw[header_row_index + 1:]
-    data_rows = [r for r in data_rows if any(cell.strip() for cell in r)]
-
-    if data_rows and len(headers) == len(data_rows[0]):
-        df = pd.DataFrame(data_rows, columns=headers)
-    else:
+    if df.empty:
         st.warning("I dati recuperati non corrispondono alle intestazioni previste o sono vuoti.")
-        df = pd.DataFrame(columns=headers if headers else COLUMNS)
 
     return df
 
@@ -283,6 +135,114 @@ COLUMNS = [
     "DATA_ORA", "COMUNE", "VEICOLO", "TARGA", "COGNOME", "NOME",
     "LUOGO_NASCITA", "DATA_NASCITA", "COMMERCIALE", "COPE", "RILIEVI", "CINOFILI"
 ]
+# Campi del foglio precompilati dall'OCR -> chiavi restituite da estrai_dati_patente.
+CAMPI_OCR = {
+    "COGNOME": "cognome", "NOME": "nome", "LUOGO_NASCITA": "luogo_nascita", "DATA_NASCITA": "data_nascita"
+}
+# Stadi della lettura a cascata (dati_patente["provenienza"]) come li vede l'operatore.
+STADI_OCR = {
+    "rapido": "Letto nel passaggio rapido",
+    "zone": "Letto rileggendo la sua zona",
+    "zone_psm": "Letto rileggendo la sua zona con un'altra segmentazione",
+}
+# Nel foglio, la colonna subito dopo COLUMNS ("ID_RIGA") contiene l'identificativo
+# scritto dalla coda di invio, usato per non duplicare le righe ritrasmesse.
+
+PERCORSO_OUTBOX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox_controlli.sqlite3")
+PERCORSO_MIRROR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mirror_controlli.sqlite3")
+PERCORSO_PRECEDENTI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "precedenti_controlli.sqlite3")
+
+def credenziali_google():
+    """Service account dalle secret di Streamlit, letto alla prima apertura del foglio."""
+    try:
+        return json.loads(st.secrets["google_service_account_json"])
+    except (KeyError, FileNotFoundError) as e:
+        raise RuntimeError("La secret 'google_service_account_json' non è configurata o ha un nome errato. "
+                           "Verifica le tue Streamlit secrets.") from e
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Errore di decodifica JSON delle credenziali Google Sheets: {e}. "
+                           "Controlla la formattazione della secret.") from e
+
+@st.cache_resource
+def client_sheets():
+    # Client autorizzato e worksheet condivisi da tutto il processo, aperti alla prima richiesta (vedi client_sheets).
+    return ClientSheets(credenziali_google)
+
+@st.cache_resource
+def avvia_outbox():
+    # Una sola coda e un solo thread di invio per processo, condivisi da tutte le sessioni.
+    return OutboxSheets(PERCORSO_OUTBOX, client_sheets().foglio, colonna_id=len(COLUMNS) + 1).avvia()
+
+@st.cache_resource
+def coda_lavori_ocr():
+    # Un solo pool di thread OCR per processo: i lavori sono condivisi tra le sessioni (vedi lavori_ocr).
+    return CodaLavoriOCR()
+
+@st.cache_resource
+def archivio_immagini():
+    # Foto decodificate una volta e condivise; in session_state resta solo l'hash (vedi archivio_immagini).
+    return ArchivioImmagini()
+
+@st.cache_resource
+def indice_luoghi():
+    # Indice dei luoghi di nascita (vedi indice_luoghi), caricato una volta per processo.
+    return carica_indice()
+
+@st.cache_resource
+def stato_avvio():
+    # Dice se la prima esecuzione del processo è già stata misurata (vedi la fine del file).
+    return {"registrato": False}
+
+@st.cache_resource
+def registro_sessioni():
+    return RegistroSessioni()
+
+@st.cache_resource
+def indice_precedenti():
+    # Controlli già fatti per targa e persona (vedi indice_precedenti), aggiornato dal salvataggio e dal mirror.
+    return IndicePrecedenti(PERCORSO_PRECEDENTI)
+
+@st.cache_resource
+def mirror_controlli():
+    # Copia locale del foglio condivisa da tutte le sessioni (vedi sync_sheets).
+    indice = indice_precedenti()
+    mirror = MirrorFoglio(PERCORSO_MIRROR, client_sheets().foglio, alla_sincronizzazione=indice.aggiorna_da_foglio)
+    intestazioni = mirror.intestazioni()
+    if intestazioni and indice.vuoto():
+        # Indice nuovo su un mirror già pieno: si riempie dalla copia locale, senza rileggere il foglio.
+        indice.aggiorna_da_foglio(intestazioni, mirror.righe_numerate(), completa=True)
+    return mirror
+
+def data_ora_leggibile(data_ora):
+    """AAAA-MM-GG HH:MM:SS dell'indice come GG/MM/AAAA HH:MM; un valore non leggibile resta com'è."""
+    try:
+        return datetime.strptime(data_ora, '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
+    except (TypeError, ValueError):
+        return data_ora or 'data sconosciuta'
+
+
+def mostra_precedenti(precedenti, descrizione):
+    """Avviso con gli ultimi controlli trovati nell'indice dei precedenti."""
+    if not precedenti:
+        return
+    elenco = "\n".join(
+        f"- {data_ora_leggibile(p['data_ora'])} "
+        f"a {p['comune']}: {p['targa']} {p['cognome']} {p['nome']}".rstrip()
+        for p in precedenti
+    )
+    volte = f"{len(precedenti)} volte " if len(precedenti) > 1 else ""
+    st.warning(f"⚠️ {descrizione} già controllata {volte}negli ultimi {GIORNI_PRECEDENTI} giorni:\n\n{elenco}")
+
+outbox = avvia_outbox()
+controlli_in_attesa = outbox.in_attesa()
+if controlli_in_attesa:
+    st.sidebar.warning(f"📤 Controlli in attesa di invio al foglio: **{controlli_in_attesa}**")
+    if outbox.ultimo_errore:
+        st.sidebar.caption(f"Ultimo errore di invio: {outbox.ultimo_errore}")
+    if st.sidebar.button("🔄 Riprova invio ora", key="riprova_invio_button"):
+        outbox.riprova_subito()
+else:
+    st.sidebar.caption("📤 Tutti i controlli sono stati inviati al foglio.")
 
 if "comune_corrente" not in st.session_state:
     st.session_state["comune_corrente"] = "NON DEFINITO"
@@ -291,15 +251,75 @@ if "inizio_turno" not in st.session_state:
 if "dati_precompilati" not in st.session_state:
     st.session_state["dati_precompilati"] = {k: "" for k in COLUMNS}
 if "df_controlli" not in st.session_state:
-    st.session_state["df_controlli"] = pd.DataFrame(columns=COLUMNS)
-if "uploaded_file_data" not in st.session_state:
-    st.session_state["uploaded_file_data"] = None
+    # Nessun dato finché le statistiche non vengono caricate (pandas si importa solo allora).
+    st.session_state["df_controlli"] = None
+if "immagine_documento" not in st.session_state:
+    # (file_id del caricamento, hash della foto nell'archivio immagini)
+    st.session_state["immagine_documento"] = None
+if "id_sessione" not in st.session_state:
+    st.session_state["id_sessione"] = uuid.uuid4().hex
+if "caricamenti_salvati" not in st.session_state:
+    # Parte della chiave del caricatore: cambiandola dopo un salvataggio il caricatore torna vuoto.
+    st.session_state["caricamenti_salvati"] = 0
+
+memoria_per_chiave = memoria_sessione(st.session_state)
+registro_sessioni().aggiorna(st.session_state["id_sessione"], sum(memoria_per_chiave.values()))
+
+# Pannelli di diagnostica a richiesta: le tabelle richiedono pandas, che così
+# non si carica alla prima pagina né pesa sui rerun di chi non li apre.
+if st.sidebar.toggle("🩺 Diagnostica e metriche", key="diagnostica_toggle"):
+    import pandas as pd
+
+    with st.sidebar.expander("🩺 Diagnostica memoria"):
+        rss = rss_processo()
+        st.caption(f"Memoria del processo (RSS): **{rss / 2**20:.0f} MB**" if rss is not None
+                   else "Memoria del processo (RSS): non disponibile")
+        stato_archivio = archivio_immagini().statistiche()
+        st.caption(
+            f"Archivio foto: {stato_archivio['voci']} foto, {stato_archivio['byte'] / 2**20:.0f} MB "
+            f"su {stato_archivio['max_byte'] / 2**20:.0f} MB ({stato_archivio['decodifiche']} decodifiche, "
+            f"{stato_archivio['scartate']} scartate)"
+        )
+        sessioni_attive = registro_sessioni().attive()
+        st.caption(f"Sessioni attive: {len(sessioni_attive)}")
+        st.dataframe(
+            pd.DataFrame(
+                [(sessione[:8] + (" (questa)" if sessione == st.session_state["id_sessione"] else ""), byte / 2**20)
+                 for sessione, byte in sessioni_attive],
+                columns=["Sessione", "MB stimati"]
+            ),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("Questa sessione, per chiave: " + ", ".join(
+            f"{chiave} {byte / 1024:.0f} kB"
+            for chiave, byte in sorted(memoria_per_chiave.items(), key=lambda voce: -voce[1])[:5]
+        ))
+
+    with st.sidebar.expander("📊 Metriche delle prestazioni"):
+        # Tempi delle fasi (p50/p95 sugli ultimi campioni) per capire quale fase rallenta l'app.
+        riepilogo_metriche = pd.DataFrame(metriche.riepilogo())
+        if riepilogo_metriche.empty:
+            st.caption("Nessuna misura ancora registrata.")
+        else:
+            st.bar_chart(riepilogo_metriche.set_index("span")[["p50_ms", "p95_ms"]], horizontal=True)
+            st.dataframe(riepilogo_metriche.round(1), hide_index=True, use_container_width=True)
+        riepilogo_campi = pd.DataFrame(metriche.riepilogo_campi())
+        if not riepilogo_campi.empty:
+            st.caption("Campi trovati dall'OCR, per documento:")
+            st.dataframe(riepilogo_campi, hide_index=True, use_container_width=True)
+        st.caption(f"Google Sheets: {client_sheets().stato()}")
+        if st.button("Azzera metriche", key="azzera_metriche_button"):
+            metriche.azzera()
+            st.rerun()
 
 show_banner()
 
-tabs = st.tabs(["📍START SOFFERMO", "📥 DATI SOGGETTO", "🔁STOP SOFFERMO", "📋STATISTICHE"])
+# Ogni tab è un fragment: un click su un widget riesegue solo la tab in cui si
+# trova, non tutta l'app. Solo le azioni che cambiano lo stato condiviso tra le
+# tab (inizio/fine soffermo, salvataggio) richiedono un rerun completo.
 
-with tabs[0]:
+@st.fragment
+def tab_inizio_soffermo():
     st.header("📍 Inizia il Posto di Controllo")
     comuni_lista = [
         "ALBERA LIGURE", "ARQUATA SCRIVIA", "BASALUZZO", "BORGHETTO DI BORBERA", "BOSIO",
@@ -329,7 +349,7 @@ with tabs[0]:
 
     if st.button("▶️ INIZIA SOFFERMO", key="start_soffermo_button", use_container_width=True):
         st.session_state["comune_corrente"] = comune_selezionato
-        st.session_state["inizio_turno"] = now_rome.strftime("%d/%m/%Y %H:%M")
+        st.session_state["inizio_turno"] = datetime.now(fuso_roma()).strftime("%d/%m/%Y %H:%M")
         success_message_placeholder.success(f"Inizio soffermo nel comune di **{st.session_state['comune_corrente']}** alle **{st.session_state['inizio_turno']}**")
         st.rerun()
 
@@ -338,7 +358,129 @@ with tabs[0]:
     else:
         st.info("Nessun soffermo attivo. Seleziona un comune e clicca 'INIZIA SOFFERMO'.")
 
-with tabs[1]:
+@st.fragment(run_every=1.0)
+def attendi_ocr():
+    # Controlla ogni secondo il lavoro OCR della sessione; a lavoro finito
+    # riesegue l'app, che precompila i campi col risultato.
+    lavoro = coda_lavori_ocr().lavoro(st.session_state["id_sessione"])
+    if lavoro is None or not lavoro.in_attesa:
+        st.rerun()
+
+def mostra_documento_riconosciuto(documento):
+    """Tipo di documento riconosciuto nella foto e, per la carta d'identità, l'esito delle cifre di controllo MRZ."""
+    if not documento or not documento[0]:
+        return
+    # ocr_patente è già caricato dal lavoro OCR appena concluso.
+    from ocr_patente import ESTRATTORI
+    tipo, controllo_mrz = documento
+    estrattore = ESTRATTORI.get(tipo)
+    if estrattore is None:
+        return
+    if estrattore.avviso:
+        st.warning(f"⚠️ {estrattore.avviso}")
+    elif tipo != "patente_fronte":
+        st.caption(f"Documento riconosciuto: {estrattore.descrizione}")
+    if controllo_mrz and controllo_mrz != "valido":
+        st.warning(f"⚠️ MRZ {controllo_mrz}: verifica i dati con il documento.")
+
+def mostra_provenienza(colonna):
+    """Sotto un campo precompilato: lo stadio della lettura a cascata che l'ha letto."""
+    stadio = st.session_state.get("ocr_provenienza", {}).get(colonna)
+    if stadio:
+        st.caption(STADI_OCR.get(stadio, f"Letto nello stadio {stadio}"))
+
+@st.fragment
+def pannello_revisione_ocr():
+    with st.expander("📝 Rivedi e Correggi Dati Estratti", expanded=True):
+        lavoro = coda_lavori_ocr().lavoro(st.session_state["id_sessione"])
+        if lavoro is not None and lavoro.in_attesa:
+            st.info("⏳ Estrazione dati in corso: intanto puoi compilare veicolo, targa e le altre voci.")
+            attendi_ocr()
+        elif lavoro is not None and st.session_state.get("ocr_chiave") != lavoro.chiave:
+            # Risultato nuovo: precompila i campi una sola volta, poi restano le correzioni a mano.
+            st.session_state["dati_precompilati"] = {k: "" for k in COLUMNS}
+            if lavoro.stato == COMPLETATO:
+                dati_patente_ocr, full_text_ocr, cleaned_text_block_ocr = lavoro.risultato
+                st.session_state["dati_precompilati"].update(
+                    {colonna: dati_patente_ocr.get(campo, "") for colonna, campo in CAMPI_OCR.items()}
+                )
+                # Luogo di nascita confrontato con l'elenco dei luoghi: il più vicino si propone
+                # all'operatore, che lo accetta o no; il campo resta come letto.
+                luogo_letto = st.session_state["dati_precompilati"]["LUOGO_NASCITA"]
+                st.session_state["ocr_luogo"] = None
+                if luogo_letto:
+                    with misura('correzione_luogo'):
+                        luogo_proposto, confidenza = indice_luoghi().correggi_luogo(luogo_letto)
+                    if luogo_proposto != luogo_letto and confidenza >= SOGLIA_SUGGERIMENTO:
+                        st.session_state["ocr_luogo"] = (luogo_letto, luogo_proposto, confidenza)
+                provenienza = dati_patente_ocr.get("provenienza") or {}
+                st.session_state["ocr_provenienza"] = {colonna: provenienza.get(campo)
+                                                       for colonna, campo in CAMPI_OCR.items()}
+                st.session_state["ocr_documento"] = (dati_patente_ocr.get("tipo_documento", ""),
+                                                     dati_patente_ocr.get("controllo_mrz", ""))
+                st.session_state["ocr_testi"] = (full_text_ocr, cleaned_text_block_ocr)
+                st.session_state["ocr_errore"] = ""
+            else:
+                st.session_state["ocr_testi"] = ("", "")
+                st.session_state["ocr_luogo"] = None
+                st.session_state["ocr_documento"] = None
+                st.session_state["ocr_provenienza"] = {}
+                st.session_state["ocr_errore"] = lavoro.errore
+            st.session_state["ocr_chiave"] = lavoro.chiave
+
+        if lavoro is not None and not lavoro.in_attesa:
+            if st.session_state["ocr_errore"]:
+                st.error(f"Errore durante l'OCR: {st.session_state['ocr_errore']}. Controlla i log per maggiori dettagli.")
+            else:
+                mostra_documento_riconosciuto(st.session_state.get("ocr_documento"))
+                full_text_ocr, cleaned_text_block_ocr = st.session_state["ocr_testi"]
+                st.text_area("🔍 Testo estratto (OCR)", value=full_text_ocr, height=150, key="ocr_text_area")
+                st.text_area("Testo OCR pulito per l'elaborazione:", value=cleaned_text_block_ocr, height=150, key="cleaned_ocr_text_area")
+
+        st.markdown("### Dati Anagrafici (Modificabili)")
+        col_cognome, col_nome = st.columns(2)
+        with col_cognome:
+            st.session_state["dati_precompilati"]["COGNOME"] = st.text_input(
+                "Cognome",
+                value=st.session_state.get('dati_precompilati', {}).get('COGNOME', '')
+            ).upper()
+            mostra_provenienza("COGNOME")
+        with col_nome:
+            st.session_state["dati_precompilati"]["NOME"] = st.text_input(
+                "Nome",
+                value=st.session_state.get('dati_precompilati', {}).get('NOME', '')
+            ).upper()
+            mostra_provenienza("NOME")
+
+        col_luogo_nascita, col_data_nascita = st.columns(2)
+        with col_luogo_nascita:
+            st.session_state["dati_precompilati"]["LUOGO_NASCITA"] = st.text_input(
+                "Luogo di Nascita",
+                value=st.session_state.get('dati_precompilati', {}).get('LUOGO_NASCITA', '')
+            ).upper()
+            mostra_provenienza("LUOGO_NASCITA")
+            if st.session_state.get("ocr_luogo"):
+                _, luogo_proposto, confidenza = st.session_state["ocr_luogo"]
+                st.caption(f"Forse «{luogo_proposto}»? (confidenza {confidenza:.0%})")
+                if st.button(f"Usa «{luogo_proposto}»", key="usa_luogo_proposto"):
+                    st.session_state["dati_precompilati"]["LUOGO_NASCITA"] = luogo_proposto
+                    st.session_state["ocr_luogo"] = None
+                    st.rerun()
+        with col_data_nascita:
+            st.session_state["dati_precompilati"]["DATA_NASCITA"] = st.text_input(
+                "Data di Nascita (GG.MM.AAAA)",
+                value=st.session_state.get('dati_precompilati', {}).get('DATA_NASCITA', ''),
+                key="data_nascita_input"
+            )
+            mostra_provenienza("DATA_NASCITA")
+
+        dati = st.session_state["dati_precompilati"]
+        precedenti = indice_precedenti().cerca(cognome=dati["COGNOME"], nome=dati["NOME"],
+                                               data_nascita=dati["DATA_NASCITA"])
+        mostra_precedenti(precedenti["persona"], "Persona")
+
+@st.fragment
+def tab_dati_soggetto(modalita_ocr):
     st.header("📥 Inserimento Dati Controllo")
 
     if st.session_state["comune_corrente"] == "NON DEFINITO":
@@ -351,6 +493,7 @@ with tabs[1]:
             veicolo = st.text_input("Marca e Modello del veicolo", value=st.session_state.get('dati_precompilati', {}).get('VEICOLO', ''), key="veicolo_input")
         with col_input_targa:
             targa = st.text_input("Targa del veicolo", value=st.session_state.get('dati_precompilati', {}).get('TARGA', ''), key="targa_input")
+        mostra_precedenti(indice_precedenti().cerca(targa=targa)["targa"], "Targa")
 
         col_radio_commerciale, col_radio_cope = st.columns(2)
         with col_radio_commerciale:
@@ -374,55 +517,35 @@ with tabs[1]:
         uploaded_file = st.file_uploader(
             "📸 Carica foto del documento",
             type=["jpg", "jpeg", "png", "heic", "heif"],
-            key="upload_document_file"
+            key=f"upload_document_file_{st.session_state['caricamenti_salvati']}"
         )
 
-        image = None
-
-        if uploaded_file is not None:
-            st.session_state["uploaded_file_data"] = uploaded_file.getvalue()
-            st.image(uploaded_file, caption="Documento caricato", use_container_width=True)
-
-            with st.expander("📝 Rivedi e Correggi Dati Estratti", expanded=True):
-                with st.spinner("Estrazione dati in corso..."):
-                    try:
-                        dati_patente_ocr, full_text_ocr, cleaned_text_block_ocr = estrai_dati_patente(uploaded_file)
-                        st.session_state["dati_precompilati"] = dati_patente_ocr
-
-                        st.text_area("🔍 Testo estratto (OCR)", value=full_text_ocr, height=150, key="ocr_text_area")
-                        st.text_area("Testo OCR pulito per l'elaborazione:", value=cleaned_text_block_ocr, height=150, key="cleaned_ocr_text_area")
-
-                    except Exception as e:
-                        st.error(f"Errore durante l'OCR: {e}. Controlla i log per maggiori dettagli.")
-                        full_text_ocr = ""
-                        cleaned_text_block_ocr = ""
-                        st.session_state["dati_precompilati"] = {k: "" for k in COLUMNS}
-
-                st.markdown("### Dati Anagrafici (Modificabili)")
-                col_cognome, col_nome = st.columns(2)
-                with col_cognome:
-                    st.session_state["dati_precompilati"]["COGNOME"] = st.text_input(
-                        "Cognome",
-                        value=st.session_state.get('dati_precompilati', {}).get('COGNOME', '')
-                    ).upper()
-                with col_nome:
-                    st.session_state["dati_precompilati"]["NOME"] = st.text_input(
-                        "Nome",
-                        value=st.session_state.get('dati_precompilati', {}).get('NOME', '')
-                    ).upper()
-
-                col_luogo_nascita, col_data_nascita = st.columns(2)
-                with col_luogo_nascita:
-                    st.session_state["dati_precompilati"]["LUOGO_NASCITA"] = st.text_input(
-                        "Luogo di Nascita",
-                        value=st.session_state.get('dati_precompilati', {}).get('LUOGO_NASCITA', '')
-                    ).upper()
-                with col_data_nascita:
-                    st.session_state["dati_precompilati"]["DATA_NASCITA"] = st.text_input(
-                        "Data di Nascita (GG.MM.AAAA)",
-                        value=st.session_state.get('dati_precompilati', {}).get('DATA_NASCITA', ''),
-                        key="data_nascita_input"
-                    )
+        if uploaded_file is None:
+            # Foto rimossa: se il suo OCR è ancora in coda non serve più.
+            coda_lavori_ocr().annulla(st.session_state["id_sessione"])
+            st.session_state["immagine_documento"] = None
+        else:
+            # Una sola decodifica per caricamento: ai rerun successivi basta l'hash.
+            archivio = archivio_immagini()
+            documento = st.session_state["immagine_documento"]
+            immagine = None
+            if documento is not None and documento[0] == uploaded_file.file_id:
+                immagine = archivio.immagine(documento[1])
+            if immagine is None:
+                documento = (uploaded_file.file_id, archivio.aggiungi(uploaded_file.getvalue()))
+                st.session_state["immagine_documento"] = documento
+                immagine = archivio.immagine(documento[1])
+            if immagine is None:
+                # Foto più grande dell'intero archivio, o già scartata per far posto a quelle di altre sessioni.
+                coda_lavori_ocr().annulla(st.session_state["id_sessione"])
+                st.session_state["immagine_documento"] = None
+                st.error("Impossibile tenere in memoria la foto: riprova, o carica una foto più piccola.")
+                return
+            st.image(archivio.anteprima(documento[1]), caption="Documento caricato", use_container_width=True)
+
+            # Un file o una modalità nuovi sostituiscono il lavoro OCR precedente della sessione.
+            coda_lavori_ocr().invia(st.session_state["id_sessione"], documento[1], immagine, modalita_ocr)
+            pannello_revisione_ocr()
 
             if st.button("✅ Salva Controllo", key="salva_controllo_button", use_container_width=True):
                 if not st.session_state["comune_corrente"] or st.session_state["comune_corrente"] == "NON DEFINITO":
@@ -445,19 +568,28 @@ with tabs[1]:
 
                     try:
                         aggiorna_su_google_sheets(dati_finali)
-                        st.success("Controllo salvato correttamente!")
+                        st.success("Controllo salvato! L'invio al foglio prosegue in background.")
                         st.session_state["dati_precompilati"] = {k: "" for k in COLUMNS}
-                        st.session_state["uploaded_file_data"] = None
+                        # Foto e lavoro OCR appartengono al controllo salvato: il prossimo parte vuoto,
+                        # senza che il risultato già usato ricompili i campi appena svuotati.
+                        coda_lavori_ocr().annulla(st.session_state["id_sessione"])
+                        st.session_state["immagine_documento"] = None
+                        st.session_state["caricamenti_salvati"] += 1
+                        st.session_state.pop("ocr_chiave", None)
+                        st.session_state.pop("ocr_luogo", None)
+                        st.session_state.pop("ocr_documento", None)
+                        st.session_state.pop("ocr_provenienza", None)
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Errore durante il salvataggio su Google Sheets: {e}")
+                        st.error(f"Errore durante il salvataggio del controllo: {e}")
 
-with tabs[2]:
+@st.fragment
+def tab_fine_soffermo():
     st.header("🔁 Ferma il Posto di Controllo")
     if st.session_state.get("comune_corrente", "NON DEFINITO") != "NON DEFINITO":
         st.info(f"Il controllo è attualmente in corso nel comune di **{st.session_state['comune_corrente']}** (Iniziato alle {st.session_state['inizio_turno']})")
         if st.button("🛑 CONFERMA FINE SOFFERMO", key="stop_soffermo_button", use_container_width=True):
-            ora_fine = now_rome.strftime("%d/%m/%Y %H:%M")
+            ora_fine = datetime.now(fuso_roma()).strftime("%d/%m/%Y %H:%M")
             st.success(f"✅ Il controllo nel comune di **{st.session_state['comune_corrente']}** è terminato il **{ora_fine}**")
             st.info(f"⏱️ Durata del controllo: dalle **{st.session_state['inizio_turno']}** alle **{ora_fine}**")
             st.session_state["comune_corrente"] = "NON DEFINITO"
@@ -467,65 +599,91 @@ with tabs[2]:
     else:
         st.info("Nessun posto di controllo attivo al momento.")
 
-with tabs[3]:
+@st.fragment
+def tab_statistiche():
     st.header("📊 Statistiche Giornaliere e Totali")
 
     if st.button("🔄 Carica/Aggiorna Dati Statistiche", key="update_stats_button", use_container_width=True):
         st.session_state["df_controlli"] = get_current_data_from_sheet()
+        st.session_state["controlli_preparati"] = None
         st.success("Dati statistiche aggiornati!")
+    if st.button("♻️ Risincronizza tutto il foglio", key="full_sync_stats_button", use_container_width=True,
+                 help="Scarica di nuovo tutto il foglio: serve solo se sono state modificate o cancellate righe già presenti."):
+        st.session_state["df_controlli"] = get_current_data_from_sheet(completa=True)
+        st.session_state["controlli_preparati"] = None
+        st.success("Dati statistiche riscaricati!")
 
     df = st.session_state["df_controlli"]
 
-    if not df.empty:
+    if df is not None and not df.empty:
+        # statistiche.py (e pandas) si importano solo quando ci sono dati da riassumere.
+        from statistiche import prepara_controlli, riepilogo_per_comune, riepilogo_per_giorno, totali
+
         st.subheader("📋 Report Controlli Completo")
         st.dataframe(df, use_container_width=True)
 
-        oggi = datetime.now().strftime("%d/%m/%Y")
-        df_oggi = df[df["DATA_ORA"].astype(str).str.startswith(oggi, na=False)].copy()
-
-        if not df_oggi.empty and "COMUNE" in df_oggi.columns:
-            st.markdown(f"### 📈 Statistiche Controlli del {oggi}")
+        controlli = st.session_state.get("controlli_preparati")
+        if controlli is None:
+            controlli = st.session_state["controlli_preparati"] = prepara_controlli(df)
 
-            tot_soggetti_oggi = len(df_oggi)
-            commerciali_oggi = df_oggi["COMMERCIALE"].astype(str).str.upper().eq("SI").sum()
-            privati_oggi = tot_soggetti_oggi - commerciali_oggi
-            cope_oggi = df_oggi["COPE"].astype(str).str.upper().eq("SI").sum()
-            cinofili_oggi = df_oggi["CINOFILI"].astype(str).str.upper().eq("SI").sum()
-            rilievi_oggi = df_oggi[df_oggi["RILIEVI"].astype(str).str.strip() != ""].shape[0]
+        oggi_data = datetime.now().date()
+        periodo = st.date_input("Periodo", value=(oggi_data, oggi_data), format="DD/MM/YYYY", key="periodo_statistiche")
+        # Durante la selezione dell'intervallo il widget restituisce una sola data.
+        dal, al = (periodo[0], periodo[-1]) if isinstance(periodo, (list, tuple)) and periodo else (periodo, periodo)
+        descrizione_periodo = dal.strftime("%d/%m/%Y") if dal == al else f"{dal.strftime('%d/%m/%Y')} - {al.strftime('%d/%m/%Y')}"
 
-            st.markdown("#### Riepilogo della giornata:")
-            col_tot, col_comm, col_priv = st.columns(3)
-            col_tot.metric("Totale Controlli", tot_soggetti_oggi)
-            col_comm.metric("Mezzi Commerciali", commerciali_oggi)
-            col_priv.metric("Mezzi Privati", privati_oggi)
+        per_comune = riepilogo_per_comune(controlli, dal, al)
 
-            col_cope, col_cinofili, col_rilievi = st.columns(3)
-            col_cope.metric("Interventi COPE", cope_oggi)
-            col_cinofili.metric("Interventi Cinofili", cinofili_oggi)
-            col_rilievi.metric("Rilievi Contestati", rilievi_oggi)
+        if not per_comune.empty:
+            st.markdown(f"### 📈 Statistiche Controlli del {descrizione_periodo}")
 
-            st.markdown("### 🗂️ Rendicontazione attività per ciascun Comune (Oggi)")
+            riepilogo = totali(per_comune)
 
-            df_oggi['COMUNE'] = df_oggi['COMUNE'].astype(str)
-            comuni_oggi = df_oggi["COMUNE"].unique()
+            st.markdown("#### Riepilogo del periodo:" if dal != al else "#### Riepilogo della giornata:")
+            col_tot, col_comm, col_priv = st.columns(3)
+            col_tot.metric("Totale Controlli", riepilogo["totale"])
+            col_comm.metric("Mezzi Commerciali", riepilogo["commerciali"])
+            col_priv.metric("Mezzi Privati", riepilogo["privati"])
 
-            for comune in comuni_oggi:
-                df_comune_oggi = df_oggi[df_oggi["COMUNE"] == comune]
+            col_cope, col_cinofili, col_rilievi = st.columns(3)
+            col_cope.metric("Interventi COPE", riepilogo["cope"])
+            col_cinofili.metric("Interventi Cinofili", riepilogo["cinofili"])
+            col_rilievi.metric("Rilievi Contestati", riepilogo["rilievi"])
 
-                ora_inizio_comune = df_comune_oggi["DATA_ORA"].min()
-                ora_fine_comune = df_comune_oggi["DATA_ORA"].max()
-                tot_soggetti_comune = len(df_comune_oggi)
+            if dal != al:
+                st.markdown("### 📅 Andamento giornaliero")
+                st.dataframe(riepilogo_per_giorno(controlli, dal, al), use_container_width=True)
 
-                commerciali_comune = df_comune_oggi["COMMERCIALE"].astype(str).str.upper().eq("SI").sum()
-                privati_comune = tot_soggetti_comune - commercials_comune
+            st.markdown(f"### 🗂️ Rendicontazione attività per ciascun Comune ({descrizione_periodo})")
 
+            for comune, riga in per_comune.iterrows():
                 st.markdown(f"""
                 ---
-                **📍 Comune:** **`{comune}`** ⏱️ **Primo controllo:** `{ora_inizio_comune}` — **Ultimo controllo:** `{ora_fine_comune}`
-                🚗 **Totale mezzi controllati:** `{tot_soggetti_comune}`
-                🔧 **Mezzi commerciali:** `{commerciali_comune}` — **Privati:** `{privati_comune}`
+                **📍 Comune:** **`{comune}`** ⏱️ **Primo controllo:** `{riga['primo_controllo']:%d/%m/%Y %H:%M:%S}` — **Ultimo controllo:** `{riga['ultimo_controllo']:%d/%m/%Y %H:%M:%S}`
+                🚗 **Totale mezzi controllati:** `{riga['totale']}`
+                🔧 **Mezzi commerciali:** `{riga['commerciali']}` — **Privati:** `{riga['privati']}`
+                👮 **COPE:** `{riga['cope']}` — **Cinofili:** `{riga['cinofili']}` — **Rilievi:** `{riga['rilievi']}`
                 """)
         else:
-            st.info(f"Nessun dato di controllo disponibile per la giornata di oggi ({oggi}).")
+            st.info(f"Nessun dato di controllo disponibile per il periodo selezionato ({descrizione_periodo}).")
     else:
         st.info("Nessun dato disponibile nel report generale. Clicca 'Carica/Aggiorna Dati Statistiche' o effettua i controlli.")
+
+tabs = st.tabs(["📍START SOFFERMO", "📥 DATI SOGGETTO", "🔁STOP SOFFERMO", "📋STATISTICHE"])
+with tabs[0]:
+    tab_inizio_soffermo()
+with tabs[1]:
+    tab_dati_soggetto(modalita_ocr)
+with tabs[2]:
+    tab_fine_soffermo()
+with tabs[3]:
+    tab_statistiche()
+
+# Prima esecuzione del processo (import compresi) o rerun completo; i rerun dei
+# soli fragment non passano di qui.
+avvio_processo = stato_avvio()
+if avvio_processo["registrato"]:
+    registra("rerun", (time.perf_counter() - inizio_esecuzione) * 1000)
+else:
+    avvio_processo["registrato"] = True
+    registra("avvio", (time.perf_counter() - inizio_esecuzione) * 1000)
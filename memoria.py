@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+import time
+
+from PIL import Image
+
+# Stime di memoria per il pannello di diagnostica: RSS del processo e quanto
+# occupa lo stato di ciascuna sessione attiva. Le sessioni si registrano a ogni
+# esecuzione completa dell'app; quelle non più viste entro la finestra non
+# vengono mostrate.
+
+FINESTRA_SESSIONI_SECONDI = 15 * 60
+# Righe su cui misurare un DataFrame: deep=True su milioni di stringhe richiederebbe secondi.
+RIGHE_CAMPIONE = 1000
+
+
+def rss_processo():
+    """
+    Memoria residente attuale del processo in byte: da /proc su Linux, da psutil
+    se installato, altrimenti il picco da resource (solo Unix). None se non è
+    disponibile (es. Windows senza psutil).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pagine = int(f.read().split()[1])
+        return pagine * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        # Modulo solo Unix: importato qui perché l'app deve partire anche su Windows.
+        import resource
+    except ImportError:
+        return None
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in kB su Linux, in byte su macOS.
+    return picco if sys.platform == 'darwin' else picco * 1024
+
+
+def stima_byte(valore, profondita=3):
+    """Stima (approssimata) della memoria di un valore di session_state."""
+    # pandas si guarda solo se già importato: se non lo è, non ci sono DataFrame da stimare.
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(valore, pd.DataFrame):
+        campione = valore.head(RIGHE_CAMPIONE)
+        if len(campione) == 0:
+            return int(valore.memory_usage().sum())
+        return int(campione.memory_usage(deep=True).sum() * len(valore) / len(campione))
+    if isinstance(valore, (bytes, bytearray)):
+        return len(valore)
+    if isinstance(valore, Image.Image):
+        return valore.width * valore.height * len(valore.getbands())
+    dimensione = sys.getsizeof(valore)
+    if profondita > 0:
+        if isinstance(valore, dict):
+            dimensione += sum(stima_byte(k, profondita - 1) + stima_byte(v, profondita - 1)
+                              for k, v in valore.items())
+        elif isinstance(valore, (list, tuple, set)):
+            dimensione += sum(stima_byte(v, profondita - 1) for v in valore)
+    return dimensione
+
+
+def memoria_sessione(stato):
+    """{chiave: byte stimati} per gli elementi di uno stato di sessione."""
+    return {str(chiave): stima_byte(valore) for chiave, valore in stato.items()}
+
+
+class RegistroSessioni:
+    """Ultima stima di memoria di ogni sessione, condivisa tra le sessioni."""
+
+    def __init__(self, finestra_secondi=FINESTRA_SESSIONI_SECONDI):
+        self.finestra_secondi = finestra_secondi
+        self._lock = threading.Lock()
+        self._sessioni = {}
+
+    def aggiorna(self, sessione, byte):
+        with self._lock:
+            self._sessioni[sessione] = (byte, time.monotonic())
+
+    def attive(self):
+        """[(sessione, byte)] delle sessioni viste di recente, dalla più pesante."""
+        limite = time.monotonic() - self.finestra_secondi
+        with self._lock:
+            for sessione in [s for s, (_, visto) in self._sessioni.items() if visto < limite]:
+                del self._sessioni[sessione]
+            return sorted(((s, byte) for s, (byte, _) in self._sessioni.items()), key=lambda v: -v[1])
@@ -0,0 +1,105 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Tempi delle fasi (span) dell'app e contatori dei campi estratti, condivisi da
+# tutte le sessioni del processo. Ogni span costa una lettura dell'orologio e
+# un append: si può lasciare sempre attivo. Con il logger "metriche" a livello
+# INFO (SCANNER_LOG_METRICHE=INFO) ogni span viene anche scritto come riga JSON.
+
+logger = logging.getLogger(__name__)
+
+CAMPIONI_PER_SPAN = 1000
+
+
+def percentile(valori, quota):
+    if not valori:
+        return 0.0
+    ordinati = sorted(valori)
+    return ordinati[min(len(ordinati) - 1, int(quota * len(ordinati)))]
+
+
+class RegistroMetriche:
+    def __init__(self, campioni_per_span=CAMPIONI_PER_SPAN):
+        self.campioni_per_span = campioni_per_span
+        self._lock = threading.Lock()
+        self._durate = {}
+        self._conteggi = Counter()
+        self._campi = Counter()
+
+    def registra(self, nome, durata_ms, **attributi):
+        """Registra la durata di uno span già misurato."""
+        with self._lock:
+            durate = self._durate.get(nome)
+            if durate is None:
+                durate = self._durate[nome] = deque(maxlen=self.campioni_per_span)
+            durate.append(durata_ms)
+            self._conteggi[nome] += 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'span': nome, 'ms': round(durata_ms, 2), **attributi}, ensure_ascii=False))
+
+    @contextmanager
+    def misura(self, nome, **attributi):
+        """Misura la durata del blocco come span `nome`; gli attributi finiscono solo nel log."""
+        inizio = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            attributi['errore'] = True
+            raise
+        finally:
+            self.registra(nome, (time.perf_counter() - inizio) * 1000, **attributi)
+
+    def conta_campi(self, dati_patente):
+        """Conta, per ogni campo di dati_patente, se il valore è stato trovato o no."""
+        with self._lock:
+            for campo, valore in dati_patente.items():
+                if campo == 'provenienza':
+                    continue
+                self._campi[campo, bool(valore)] += 1
+
+    def riepilogo(self):
+        """Una riga per span: numero di misure, p50, p95 e massimo (ms) sugli ultimi campioni."""
+        with self._lock:
+            durate = {nome: list(valori) for nome, valori in self._durate.items()}
+            conteggi = dict(self._conteggi)
+        return [
+            {
+                'span': nome,
+                'misure': conteggi[nome],
+                'p50_ms': percentile(valori, 0.5),
+                'p95_ms': percentile(valori, 0.95),
+                'max_ms': max(valori),
+            }
+            for nome, valori in sorted(durate.items())
+        ]
+
+    def riepilogo_campi(self):
+        """Una riga per campo di dati_patente: documenti in cui è stato trovato o no."""
+        with self._lock:
+            campi = Counter(self._campi)
+        nomi = sorted({campo for campo, _ in campi}, key=lambda c: -campi[c, False])
+        righe = []
+        for campo in nomi:
+            trovati, mancanti = campi[campo, True], campi[campo, False]
+            righe.append({
+                'campo': campo,
+                'trovati': trovati,
+                'mancanti': mancanti,
+                'trovati_%': round(100 * trovati / (trovati + mancanti), 1),
+            })
+        return righe
+
+    def azzera(self):
+        with self._lock:
+            self._durate.clear()
+            self._conteggi.clear()
+            self._campi.clear()
+
+
+metriche = RegistroMetriche()
+misura = metriche.misura
+registra = metriche.registra
@@ -0,0 +1,162 @@
+import os
+import queue
+import shlex
+import threading
+import time
+from contextlib import contextmanager
+
+from metriche import misura, registra
+from scheduler_ocr import scheduler_ocr
+
+# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+# Un thread OpenMP per lettura: il parallelismo lo decide scheduler_ocr (una
+# lettura per core), non ogni Tesseract per conto suo. Va impostato prima di
+# caricare la libreria (tesserocr) e viene ereditato dai processi di pytesseract.
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Backend OCR usato da estrai_dati_patente. Se è installato tesserocr (binding
+# della C API di Tesseract) si tiene un pool di motori già inizializzati: niente
+# processo nuovo, niente file temporanei e traineddata caricato una volta sola.
+# Senza tesserocr si ripiega su pytesseract, che lancia l'eseguibile a ogni chiamata.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+def _analizza_config(config):
+    """Traduce una stringa di opzioni in stile pytesseract ('--psm 7 -c k=v') in (psm, variabili)."""
+    psm = None
+    variabili = {}
+    parti = shlex.split(config or '')
+    i = 0
+    while i < len(parti):
+        parte = parti[i]
+        if parte == '--psm' and i + 1 < len(parti):
+            psm = int(parti[i + 1])
+            i += 1
+        elif parte == '-c' and i + 1 < len(parti):
+            chiave, _, valore = parti[i + 1].partition('=')
+            variabili[chiave] = valore
+            i += 1
+        i += 1
+    return psm, variabili
+
+
+class PoolTesseract:
+    """
+    Pool limitato di istanze tesserocr.PyTessBaseAPI per una lingua.
+    Le istanze vengono create al primo bisogno e riutilizzate; se sono tutte
+    occupate il chiamante attende che una si liberi.
+    """
+
+    def __init__(self, lang='ita', dimensione=None):
+        self.lang = lang
+        self.dimensione = dimensione or os.cpu_count() or 1
+        self._libere = queue.LifoQueue()
+        self._create = 0
+        self._lock = threading.Lock()
+
+    def _nuovo_motore(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    @contextmanager
+    def motore(self):
+        try:
+            api = self._libere.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crea = self._create < self.dimensione
+                if crea:
+                    self._create += 1
+            if crea:
+                try:
+                    api = self._nuovo_motore()
+                except Exception:
+                    with self._lock:
+                        self._create -= 1
+                    raise
+            else:
+                api = self._libere.get()
+        try:
+            yield api
+        finally:
+            self._libere.put(api)
+
+    def leggi(self, image, config=''):
+        psm, variabili = _analizza_config(config)
+        with self.motore() as api:
+            psm_precedente = api.GetPageSegMode()
+            precedenti = {k: api.GetVariableAsString(k) for k in variabili}
+            try:
+                if psm is not None:
+                    api.SetPageSegMode(psm)
+                for chiave, valore in variabili.items():
+                    api.SetVariable(chiave, valore)
+                # L'immagine Pillow passa direttamente in memoria al motore.
+                api.SetImage(image)
+                return api.GetUTF8Text()
+            finally:
+                # Il motore torna nel pool con le impostazioni di partenza.
+                api.Clear()
+                api.SetPageSegMode(psm_precedente)
+                for chiave, valore in precedenti.items():
+                    api.SetVariable(chiave, valore or '')
+
+    def prepara(self):
+        """Crea subito tutti i motori del pool (per servizi che non vogliono pagare l'avvio alla prima lettura)."""
+        while True:
+            with self._lock:
+                if self._create >= self.dimensione:
+                    return
+                self._create += 1
+            try:
+                api = self._nuovo_motore()
+            except Exception:
+                with self._lock:
+                    self._create -= 1
+                raise
+            self._libere.put(api)
+
+    def chiudi(self):
+        while True:
+            try:
+                api = self._libere.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+            with self._lock:
+                self._create -= 1
+
+
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def pool_per_lingua(lang):
+    with _pool_lock:
+        if lang not in _pool:
+            _pool[lang] = PoolTesseract(lang)
+        return _pool[lang]
+
+
+def backend_attivo():
+    return 'tesserocr' if tesserocr is not None else 'pytesseract'
+
+
+def leggi_testo(image, lang='ita', config=''):
+    """
+    Esegue l'OCR su un'immagine Pillow con le stesse opzioni di
+    pytesseract.image_to_string, usando il pool tesserocr se disponibile.
+    Attende un posto libero nello scheduler di processo (vedi scheduler_ocr).
+    """
+    richiesta = time.perf_counter()
+    with scheduler_ocr.slot():
+        registra('attesa_ocr', (time.perf_counter() - richiesta) * 1000)
+        with misura('tesseract', backend=backend_attivo(), config=config):
+            if tesserocr is not None:
+                return pool_per_lingua(lang).leggi(image, config)
+            # Importato al primo uso: pytesseract carica pandas (mezzo secondo all'avvio).
+            import pytesseract
+            return pytesseract.image_to_string(image, lang=lang, config=config)
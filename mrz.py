@@ -0,0 +1,147 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from parser_patente import espandi_anno
+
+# Zona a lettura ottica (MRZ, ICAO 9303) sul retro della carta d'identità
+# elettronica: formato TD1, tre righe da 30 caratteri con lettere, cifre e '<'.
+# Ogni gruppo (numero del documento, data di nascita, data di scadenza e la
+# riga intera) ha una cifra di controllo: un campo letto male dall'OCR si
+# riconosce, e spesso si corregge provando le confusioni tipiche (O/0, I/1...).
+
+LUNGHEZZA_TD1 = 30
+# Lunghezza minima di una riga OCR per considerarla una riga MRZ (qualche carattere può mancare).
+LUNGHEZZA_MINIMA_RIGA = 24
+ALFABETO_MRZ = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<'
+_PESI = (7, 3, 1)
+
+# Confusioni tipiche dell'OCR tra lettere e cifre, nei due sensi.
+_LETTERE_IN_CIFRE = str.maketrans('ODQIZSGB', '00012568')
+_CIFRE_IN_LETTERE = str.maketrans('01258', 'OIZSB')
+_SCAMBI = {'0': 'O', 'O': '0', '1': 'I', 'I': '1', '2': 'Z', 'Z': '2', '5': 'S', 'S': '5',
+           '6': 'G', 'G': '6', '8': 'B', 'B': '8', 'D': '0'}
+
+_RE_NON_MRZ = re.compile(r'[^A-Z0-9<]')
+
+MRZ = namedtuple('MRZ', 'campi controlli')
+
+
+def cifra_controllo(testo):
+    """Cifra di controllo ICAO 9303 (pesi 7, 3, 1; '<' vale 0, A vale 10)."""
+    totale = 0
+    for posizione, carattere in enumerate(testo):
+        if carattere.isdigit():
+            valore = int(carattere)
+        elif 'A' <= carattere <= 'Z':
+            valore = ord(carattere) - ord('A') + 10
+        else:
+            valore = 0
+        totale += valore * _PESI[posizione % 3]
+    return str(totale % 10)
+
+
+def righe_mrz(testo):
+    """Le ultime tre righe del testo OCR che hanno la forma di righe MRZ TD1 (30 caratteri), o None."""
+    candidate = []
+    for riga in testo.upper().splitlines():
+        # Le virgolette basse sono il '<' letto male; gli spazi dentro la riga non contano.
+        riga = _RE_NON_MRZ.sub('', riga.replace('«', '<<').replace('‹', '<').replace(' ', ''))
+        if len(riga) >= LUNGHEZZA_MINIMA_RIGA and '<' in riga:
+            candidate.append(riga[:LUNGHEZZA_TD1].ljust(LUNGHEZZA_TD1, '<'))
+    return candidate[-3:] if len(candidate) >= 3 else None
+
+
+def _correggi(valore, cifra):
+    """(valore, valido): se la cifra di controllo non torna prova a cambiare un carattere ambiguo."""
+    cifra = cifra.translate(_LETTERE_IN_CIFRE)
+    if cifra_controllo(valore) == cifra:
+        return valore, True
+    for posizione, carattere in enumerate(valore):
+        alternativa = _SCAMBI.get(carattere)
+        if alternativa is not None:
+            variante = valore[:posizione] + alternativa + valore[posizione + 1:]
+            if cifra_controllo(variante) == cifra:
+                return variante, True
+    return valore, False
+
+
+def _data(aammgg, secolo=None):
+    """Data AAMMGG della MRZ come GG/MM/AAAA ('' se non valida)."""
+    data = f"{aammgg[4:6]}/{aammgg[2:4]}/{aammgg[0:2]}"
+    data = data[:-2] + secolo + data[-2:] if secolo else espandi_anno(data)
+    try:
+        datetime.strptime(data, '%d/%m/%Y')
+    except ValueError:
+        return ''
+    return data
+
+
+def _nomi(riga):
+    cognome, _, nome = riga.translate(_CIFRE_IN_LETTERE).partition('<<')
+    return ' '.join(cognome.replace('<', ' ').split()), ' '.join(nome.replace('<', ' ').split())
+
+
+def analizza_td1(righe):
+    """
+    Campi della MRZ TD1 (tre righe da 30 caratteri) e, per ogni cifra di
+    controllo, se torna. I campi hanno lo stesso formato di dati_patente
+    (date GG/MM/AAAA, nomi in maiuscolo con spazi).
+    """
+    riga1, riga2, riga3 = (r.ljust(LUNGHEZZA_TD1, '<')[:LUNGHEZZA_TD1] for r in righe)
+
+    numero, cifra_numero = riga1[5:14], riga1[14]
+    if cifra_numero == '<':
+        # Numero di oltre 9 caratteri: continua nei dati opzionali, con la cifra di controllo in fondo.
+        resto = riga1[15:30].split('<', 1)[0]
+        numero, cifra_numero = numero + resto[:-1], resto[-1:] or '<'
+    numero, numero_valido = _correggi(numero, cifra_numero)
+
+    # Date e cifre di controllo sono solo numeriche: le lettere lette lì sono cifre confuse.
+    nascita = riga2[0:7].translate(_LETTERE_IN_CIFRE)
+    scadenza = riga2[8:15].translate(_LETTERE_IN_CIFRE)
+    nascita_valida = cifra_controllo(nascita[:6]) == nascita[6]
+    scadenza_valida = cifra_controllo(scadenza[:6]) == scadenza[6]
+    if len(numero) == 9:
+        # Il controllo composito si calcola sulla riga con il numero già corretto.
+        riga1 = riga1[:5] + numero + cifra_numero.translate(_LETTERE_IN_CIFRE) + riga1[15:]
+    composito_valido = (cifra_controllo(riga1[5:30] + nascita + scadenza + riga2[18:29])
+                        == riga2[29].translate(_LETTERE_IN_CIFRE))
+
+    cognome, nome = _nomi(riga3)
+    campi = {
+        'cognome': cognome,
+        'nome': nome,
+        'data_nascita': _data(nascita[:6]),
+        'data_scadenza': _data(scadenza[:6], secolo='20'),
+        'numero_documento': numero.replace('<', ''),
+        'sesso': riga2[7] if riga2[7] in 'MF' else '',
+        'nazionalita': riga2[15:18].translate(_CIFRE_IN_LETTERE).replace('<', ''),
+        'stato_emittente': riga1[2:5].translate(_CIFRE_IN_LETTERE).replace('<', ''),
+    }
+    controlli = {
+        'numero_documento': numero_valido,
+        'data_nascita': nascita_valida,
+        'data_scadenza': scadenza_valida,
+        'composito': composito_valido,
+    }
+    return MRZ(campi, controlli)
+
+
+def componi_td1(numero, data_nascita, sesso, data_scadenza, cognome, nome, stato='ITA', nazionalita='ITA',
+                tipo='C'):
+    """Le tre righe MRZ TD1 di un documento (date GG/MM/AAAA): per i documenti sintetici e le prove."""
+    def campo(testo, lunghezza):
+        return _RE_NON_MRZ.sub('<', testo.upper().replace(' ', '<'))[:lunghezza].ljust(lunghezza, '<')
+
+    def aammgg(data):
+        return data[8:10] + data[3:5] + data[0:2]
+
+    numero = campo(numero, 9)
+    nascita, scadenza = aammgg(data_nascita), aammgg(data_scadenza)
+    riga1 = campo(tipo, 2) + campo(stato, 3) + numero + cifra_controllo(numero) + '<' * 15
+    riga2 = (nascita + cifra_controllo(nascita) + (sesso or '<') + scadenza + cifra_controllo(scadenza)
+             + campo(nazionalita, 3) + '<' * 11)
+    riga2 += cifra_controllo(riga1[5:30] + riga2[0:7] + riga2[8:15] + riga2[18:29])
+    riga3 = campo(f"{cognome}<<{nome}", LUNGHEZZA_TD1)
+    return [riga1, riga2, riga3]
@@ -0,0 +1,354 @@
+from PIL import Image, UnidentifiedImageError
+import re
+from collections import Counter, namedtuple
+from datetime import datetime
+import io
+import logging
+import threading
+
+from cache_ocr import CacheOCR, hash_contenuto, hash_percettivo
+from documenti import (TIPO_PREDEFINITO, Classificazione, classifica_documento, dati_vuoti, estrai_carta_identita,
+                       estrai_senza_dati, mrz_nel_testo, riconosci_dal_testo)
+from metriche import metriche, misura, registra
+from motore_ocr import leggi_testo
+from parser_patente import analizza_testo_patente, pulisci_testo_ocr
+from preelaborazione import preelabora_immagine
+from zone_patente import CONFIG_ZONE, CONFIG_ZONE_ALTERNATIVA, ZONE_PATENTE, individua_tessera, leggi_zone, ocr_zone
+
+logger = logging.getLogger(__name__)
+
+# Cache condivisa tra tutte le sessioni: un rerun di Streamlit (click su un radio,
+# digitazione nella targa) non deve rieseguire Tesseract sulla stessa foto.
+cache_ocr = CacheOCR()
+
+_heif_registrato = False
+
+def _registra_heif():
+    # pillow_heif si carica solo alla prima foto che Pillow non sa aprire da solo (HEIC).
+    global _heif_registrato
+    if _heif_registrato:
+        return False
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    _heif_registrato = True
+    return True
+
+def decodifica_immagine(sorgente):
+    """Apre un file immagine (percorso o file-like) e lo decodifica subito, misurando il tempo."""
+    try:
+        image = Image.open(sorgente)
+    except UnidentifiedImageError:
+        if not _registra_heif():
+            raise
+        if hasattr(sorgente, 'seek'):
+            sorgente.seek(0)
+        image = Image.open(sorgente)
+    # Le foto HEIC (iPhone) passano da pillow_heif: misurate a parte.
+    nome = 'conversione_heic' if image.format in ('HEIF', 'HEIC') else 'decodifica_upload'
+    with misura(nome, formato=image.format):
+        image.load()
+    return image
+
+def apri_immagine(image_input):
+    """
+    Apre l'input come immagine Pillow in una modalità adatta a Tesseract.
+    Accetta un percorso di file (stringa) o un oggetto immagine Pillow/Streamlit UploadedFile.
+    """
+    image = None
+    if isinstance(image_input, str):
+        # Se è un percorso, apri l'immagine
+        image = decodifica_immagine(image_input)
+    elif hasattr(image_input, 'getvalue'): # Se è un oggetto Streamlit UploadedFile
+        image = decodifica_immagine(io.BytesIO(image_input.getvalue()))
+    elif isinstance(image_input, Image.Image):
+        # Se è già un oggetto Pillow Image, usalo direttamente
+        image = image_input
+    else:
+        raise TypeError(f"Tipo di oggetto immagine non supportato: {type(image_input)}")
+
+    # Assicurati che l'immagine sia in modalità RGB per Tesseract se necessario
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    elif image.mode == 'P': # Gestisci immagini con palette
+        image = image.convert('RGB')
+    return image
+
+def estrai_dati_patente(image_input, modalita='pagina', preelaborazione=True, tipo_documento=None):
+    """
+    Estrae i dati da un'immagine della patente (o della carta d'identità) usando OCR.
+    Accetta un percorso di file (stringa) o un oggetto immagine Pillow/Streamlit UploadedFile.
+
+    Il tipo di documento (vedi documenti.classifica_documento) sceglie
+    l'estrattore di ESTRATTORI; con tipo_documento lo si indica direttamente.
+    Se né i pixel né la sonda danno indizi si legge il fronte della patente, e
+    solo se non ne escono almeno CAMPI_FRONTE_MINIMI campi validi si cerca un
+    altro tipo nel testo letto (documenti.riconosci_dal_testo).
+    dati_patente ha sempre la chiave 'tipo_documento', più quelle proprie
+    dell'estrattore.
+    modalita e preelaborazione: vedi estrai_fronte_patente.
+    """
+    image = apri_immagine(image_input)
+    if tipo_documento is None:
+        classificazione = classifica_documento(image)
+    else:
+        classificazione = Classificazione(tipo_documento, 'indicato', None, '')
+    tipo = classificazione.tipo
+    dati_patente, full_text, cleaned_text_block = ESTRATTORI[tipo].estrai(
+        image, classificazione, modalita=modalita, preelaborazione=preelaborazione)
+    if classificazione.motivo == 'predefinito':
+        # Nessun indizio prima dell'OCR: se nella pagina letta c'è una MRZ valida, era una carta d'identità.
+        dati_mrz = mrz_nel_testo(full_text)
+        if dati_mrz is not None:
+            tipo, dati_patente = 'carta_identita', dati_mrz
+        elif len(campi_fronte_validi(dati_patente)) < CAMPI_FRONTE_MINIMI:
+            riconosciuta = riconosci_dal_testo(classificazione, full_text)
+            if riconosciuta.tipo != TIPO_PREDEFINITO:
+                tipo = riconosciuta.tipo
+                dati_patente, full_text, cleaned_text_block = ESTRATTORI[tipo].estrai(
+                    image, riconosciuta, modalita=modalita, preelaborazione=preelaborazione)
+    dati_patente['tipo_documento'] = tipo
+    return dati_patente, full_text, cleaned_text_block
+
+def estrai_fronte_patente(image_input, modalita='pagina', preelaborazione=True):
+    """
+    Estrae i campi numerati dal fronte della patente.
+
+    modalita='pagina' esegue l'OCR sull'intera foto; modalita='zone' individua la
+    tessera e legge in parallelo solo le zone dei campi numerati (vedi zone_patente);
+    modalita='cascata' parte da un passaggio rapido a bassa risoluzione e rilegge
+    solo i campi mancanti (vedi estrai_dati_patente_cascata); in dati_patente
+    'provenienza' dice, per ogni campo, lo stadio che l'ha letto.
+    preelaborazione: True per la configurazione standard, un dizionario per
+    modificarla (vedi preelaborazione.CONFIG_PREELABORAZIONE), False per disattivarla.
+    """
+    image = apri_immagine(image_input)
+
+    if modalita == 'cascata':
+        dati_patente, full_text, cleaned_text_block, provenienza = estrai_dati_patente_cascata(image, preelaborazione)
+        dati_patente['provenienza'] = provenienza
+        return dati_patente, full_text, cleaned_text_block
+
+    if preelaborazione:
+        config = preelaborazione if isinstance(preelaborazione, dict) else None
+        with misura('preelaborazione'):
+            image, tempi = preelabora_immagine(image, config)
+        for passo, durata_ms in tempi.items():
+            registra(f'preelaborazione.{passo}', durata_ms)
+
+    if modalita == 'zone':
+        full_text = ocr_zone(image)
+    elif modalita == 'pagina':
+        # Esegui l'OCR sull'intera immagine con lingua italiana
+        full_text = leggi_testo(image, lang='ita')
+    else:
+        raise ValueError(f"Modalità di estrazione non valida: {modalita}")
+    logger.debug("Testo OCR completo estratto:\n%s", full_text)
+
+    with misura('parsing'):
+        cleaned_text_block = pulisci_testo_ocr(full_text)
+        logger.debug("Testo OCR pulito per l'elaborazione:\n%s", cleaned_text_block)
+
+        dati_patente = analizza_testo_patente(cleaned_text_block)
+    return dati_patente, full_text, cleaned_text_block
+
+# === CASCATA: PASSAGGIO RAPIDO, POI RILETTURA DEI SOLI CAMPI NON VALIDI ===
+
+# Zona della tessera da cui proviene ciascun campo di dati_patente.
+CAMPO_ZONA = {
+    'cognome': '1',
+    'nome': '2',
+    'data_nascita': '3',
+    'luogo_nascita': '3',
+    'data_rilascio': '4A',
+    'data_scadenza': '4B',
+    'numero_patente': '5',
+}
+
+# Passaggio rapido: metà dei DPI della preelaborazione standard.
+CONFIG_PASSAGGIO_RAPIDO = {'dpi': 150}
+
+# Stadi successivi al passaggio rapido: (nome, configurazione Tesseract delle zone).
+STADI_CASCATA = (
+    ('zone', CONFIG_ZONE),
+    ('zone_psm', CONFIG_ZONE_ALTERNATIVA),
+)
+
+# Numero patente: formato attuale (es. AB1234567C) e formati precedenti
+# con una sola lettera iniziale o 6-8 cifre.
+_RE_NUMERO_PATENTE = re.compile(r'^[A-Z]{1,2}\d{6,8}[A-Z]?$')
+
+# Contatori di processo: quale stadio ha prodotto i campi, e quanti documenti
+# sono stati risolti interamente dal passaggio rapido.
+statistiche_cascata = Counter()
+# Campi letti dal fronte della patente (dati_patente può avere chiavi in più, es. provenienza),
+# e quanti devono essere plausibili perché la foto sia davvero un fronte: nel testo di
+# altri documenti il parser trova a volte un campo isolato (es. un "nome" fatto di categorie).
+CAMPI_FRONTE = tuple(dati_vuoti())
+CAMPI_FRONTE_MINIMI = 2
+_lock_statistiche = threading.Lock()
+
+def _data_valida(valore):
+    try:
+        return datetime.strptime(valore.replace('.', '/'), '%d/%m/%Y')
+    except ValueError:
+        return None
+
+def campi_fronte_validi(dati_patente):
+    """Campi del fronte della patente letti con un valore plausibile."""
+    errati = campi_non_validi(dati_patente)
+    return [chiave for chiave in CAMPI_FRONTE if chiave not in errati]
+
+def campi_non_validi(dati_patente):
+    """Restituisce l'insieme delle chiavi di dati_patente vuote o non plausibili."""
+    errati = {chiave for chiave, valore in dati_patente.items() if not valore}
+    date = {}
+    for chiave in ('data_nascita', 'data_rilascio', 'data_scadenza'):
+        if dati_patente[chiave]:
+            date[chiave] = _data_valida(dati_patente[chiave])
+            if date[chiave] is None:
+                errati.add(chiave)
+    if dati_patente['numero_patente'] and not _RE_NUMERO_PATENTE.match(dati_patente['numero_patente']):
+        errati.add('numero_patente')
+    if date.get('data_rilascio') and date.get('data_scadenza') and date['data_scadenza'] <= date['data_rilascio']:
+        errati.update(('data_rilascio', 'data_scadenza'))
+    if date.get('data_nascita') and date.get('data_rilascio') and date['data_rilascio'] <= date['data_nascita']:
+        errati.update(('data_nascita', 'data_rilascio'))
+    return errati
+
+def estrai_dati_patente_cascata(image_input, preelaborazione=True):
+    """
+    Estrazione a cascata: un passaggio rapido a pagina intera su un'immagine
+    ridotta e, solo se qualche campo manca o non è valido, la rilettura delle
+    zone corrispondenti a piena risoluzione e poi con un'altra segmentazione.
+
+    Restituisce (dati_patente, full_text, cleaned_text_block, provenienza), con
+    provenienza = {campo: stadio che l'ha prodotto, o None se non trovato}.
+    """
+    image = apri_immagine(image_input)
+    config_base = preelaborazione if isinstance(preelaborazione, dict) else {}
+
+    dati_patente, full_text, cleaned_text_block = estrai_fronte_patente(
+        image, modalita='pagina', preelaborazione={**config_base, **CONFIG_PASSAGGIO_RAPIDO}
+    )
+    provenienza = {chiave: 'rapido' for chiave, valore in dati_patente.items() if valore}
+    testi = [full_text]
+    testi_puliti = [cleaned_text_block]
+
+    errati = campi_non_validi(dati_patente)
+    tessera = None
+    for stadio, config_zone in STADI_CASCATA:
+        if not errati:
+            break
+        if tessera is None:
+            with misura('preelaborazione'):
+                preparata = preelabora_immagine(image, config_base)[0] if preelaborazione else image
+            tessera = individua_tessera(preparata)
+        zone = sorted({CAMPO_ZONA[chiave] for chiave in errati}, key=list(ZONE_PATENTE).index)
+        testo_stadio = leggi_zone(tessera, zone, config_zone)
+        with misura('parsing'):
+            pulito_stadio = pulisci_testo_ocr(testo_stadio)
+            logger.debug("Cascata, stadio '%s' sulle zone %s:\n%s", stadio, zone, pulito_stadio)
+            nuovi = analizza_testo_patente(pulito_stadio)
+        for chiave in errati:
+            if nuovi[chiave]:
+                dati_patente[chiave] = nuovi[chiave]
+                provenienza[chiave] = stadio
+        testi.append(testo_stadio)
+        testi_puliti.append(pulito_stadio)
+        errati = campi_non_validi(dati_patente)
+
+    for chiave, valore in dati_patente.items():
+        if not valore:
+            provenienza[chiave] = None
+
+    with _lock_statistiche:
+        statistiche_cascata['documenti'] += 1
+        if all(stadio == 'rapido' for stadio in provenienza.values()):
+            statistiche_cascata['documenti_solo_rapido'] += 1
+        for stadio in provenienza.values():
+            statistiche_cascata[f"campi_{stadio or 'mancanti'}"] += 1
+
+    return dati_patente, '\n'.join(testi), ' '.join(testi_puliti), provenienza
+
+# === TIPI DI DOCUMENTO ===
+
+# Estrattore per tipo di documento (vedi documenti.classifica_documento): chiamato come
+# estrai(image, classificazione, modalita=..., preelaborazione=...) e deve restituire
+# (dati_patente, full_text, cleaned_text_block). avviso: messaggio per l'operatore
+# quando la foto non contiene i dati da leggere.
+Estrattore = namedtuple('Estrattore', 'descrizione estrai avviso')
+
+def _estrai_patente_fronte(image, classificazione, modalita='pagina', preelaborazione=True):
+    return estrai_fronte_patente(image, modalita=modalita, preelaborazione=preelaborazione)
+
+ESTRATTORI = {
+    'patente_fronte': Estrattore("Patente (fronte)", _estrai_patente_fronte, ''),
+    'patente_retro': Estrattore(
+        "Patente (retro)", estrai_senza_dati,
+        "È il retro della patente: fotografa il fronte, con i campi numerati."),
+    'carta_identita': Estrattore("Carta d'identità (retro, MRZ)", estrai_carta_identita, ''),
+    'carta_identita_fronte': Estrattore(
+        "Carta d'identità (fronte)", estrai_senza_dati,
+        "È il fronte della carta d'identità: fotografa il retro, con le tre righe MRZ in basso."),
+}
+
+def _leggi_bytes(image_input):
+    """Restituisce i byte grezzi dell'input, o None se non disponibili."""
+    if isinstance(image_input, (bytes, bytearray)):
+        return bytes(image_input)
+    if isinstance(image_input, str):
+        with open(image_input, 'rb') as f:
+            return f.read()
+    if hasattr(image_input, 'getvalue'):
+        return image_input.getvalue()
+    return None
+
+def _copia_risultato(risultato):
+    # Il chiamante modifica il dizionario (es. i campi corretti a mano):
+    # non deve alterare la copia in cache.
+    dati_patente, full_text, cleaned_text_block = risultato
+    dati_patente = dict(dati_patente)
+    if 'provenienza' in dati_patente:
+        dati_patente['provenienza'] = dict(dati_patente['provenienza'])
+    return dati_patente, full_text, cleaned_text_block
+
+def estrai_dati_patente_cache(image_input, modalita='pagina', preelaborazione=True, digest=None):
+    """
+    Come estrai_dati_patente, ma riusa il risultato se la stessa immagine
+    (stessi byte, o uno scatto quasi identico) è già stata elaborata.
+    digest: hash dei byte del file da cui è stata decodificata un'immagine
+    Pillow (vedi archivio_immagini), se già noto; evita di ricalcolarlo sui pixel.
+    """
+    dati_bytes = None if digest is not None else _leggi_bytes(image_input)
+    if digest is not None:
+        image = apri_immagine(image_input)
+    elif dati_bytes is None:
+        if not isinstance(image_input, Image.Image):
+            raise TypeError(f"Tipo di oggetto immagine non supportato: {type(image_input)}")
+        image = image_input
+        digest = hash_contenuto(image.tobytes())
+    else:
+        image = None
+        digest = hash_contenuto(dati_bytes)
+    # La chiave distingue le impostazioni: stessa foto, lettura diversa.
+    if isinstance(preelaborazione, dict):
+        impostazioni = f"{modalita}:{sorted(preelaborazione.items())}:"
+    else:
+        impostazioni = f"{modalita}:{bool(preelaborazione)}:"
+    chiave = impostazioni + digest
+
+    risultato = cache_ocr.get(chiave)
+    if risultato is not None:
+        return _copia_risultato(risultato)
+
+    if image is None:
+        image = decodifica_immagine(io.BytesIO(dati_bytes))
+    phash = hash_percettivo(image) if cache_ocr.soglia_phash is not None else None
+    risultato = cache_ocr.get_simile(phash, prefisso=impostazioni)
+    if risultato is None:
+        cache_ocr.registra_miss()
+        with misura(f'documento.{modalita}'):
+            risultato = estrai_dati_patente(image, modalita=modalita, preelaborazione=preelaborazione)
+        metriche.conta_campi(risultato[0])
+    cache_ocr.put(chiave, risultato, phash)
+    return _copia_risultato(risultato)
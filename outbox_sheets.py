@@ -0,0 +1,218 @@
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from metriche import misura
+
+# Coda locale e persistente dei controlli da scrivere su Google Sheets.
+# Il salvataggio dall'app scrive solo su SQLite (immediato, anche senza rete);
+# un thread in background invia le righe in blocchi con append_rows, ritentando
+# con attesa crescente. Ogni riga ha un identificativo generato dal client,
+# scritto nella colonna dopo COLUMNS, per non duplicarla se un invio "fallito"
+# era in realtà arrivato al foglio.
+
+DIMENSIONE_BLOCCO = 50
+INTERVALLO_INVIO_SECONDI = 2.0
+ATTESA_MIN_SECONDI = 2.0
+ATTESA_MAX_SECONDI = 300.0
+# Per quanto si ricordano gli id già inviati (per ignorare un accoda ripetuto della stessa riga).
+CONSERVA_INVIATI_SECONDI = 30 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS coda (
+    id_riga TEXT PRIMARY KEY,
+    valori TEXT NOT NULL,
+    creato REAL NOT NULL,
+    -- invii iniziati: > 0 vuol dire che la riga può essere già sul foglio
+    tentativi INTEGER NOT NULL DEFAULT 0,
+    prossimo_tentativo REAL NOT NULL DEFAULT 0,
+    ultimo_errore TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS inviati (
+    id_riga TEXT PRIMARY KEY,
+    inviato REAL NOT NULL
+);
+"""
+
+
+def nuovo_id_riga():
+    return uuid.uuid4().hex
+
+
+class FoglioLocale:
+    """
+    Sostituto in memoria di un worksheet gspread (append_rows, col_values, get_values),
+    per provare l'app e la coda senza credenziali Google. Con fallimenti > 0 le
+    prossime chiamate ad append_rows sollevano un errore, come un problema di rete.
+    """
+
+    def __init__(self, righe=None):
+        self.righe = [list(r) for r in (righe or [])]
+        self.fallimenti = 0
+        self.chiamate_append = 0
+
+    def append_rows(self, values, **kwargs):
+        self.chiamate_append += 1
+        if self.fallimenti > 0:
+            self.fallimenti -= 1
+            raise ConnectionError("Invio simulato fallito")
+        self.righe.extend(list(r) for r in values)
+
+    def col_values(self, col):
+        return [r[col - 1] if len(r) >= col else '' for r in self.righe]
+
+    def get_all_values(self):
+        return [list(r) for r in self.righe]
+
+    def get_values(self, intervallo):
+        # Solo intervalli aperti del tipo "A<riga>:<colonna>", come quelli di sync_sheets.
+        prima = int(re.match(r'^[A-Z]+(\d+)', intervallo).group(1))
+        return [list(r) for r in self.righe[prima - 1:]]
+
+
+class OutboxSheets:
+    """Coda persistente (SQLite) con invio in background verso un worksheet."""
+
+    def __init__(self, percorso_db, fornitore_foglio, colonna_id,
+                 dimensione_blocco=DIMENSIONE_BLOCCO, intervallo=INTERVALLO_INVIO_SECONDI):
+        """
+        fornitore_foglio: funzione senza argomenti che restituisce il worksheet
+        (chiamata a ogni invio, così credenziali e connessione possono arrivare dopo).
+        colonna_id: numero (1-based) della colonna del foglio con l'id della riga.
+        """
+        self.percorso_db = percorso_db
+        self.fornitore_foglio = fornitore_foglio
+        self.colonna_id = colonna_id
+        self.dimensione_blocco = dimensione_blocco
+        self.intervallo = intervallo
+        self._sveglia = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.ultimo_errore = ''
+        self.ultimo_invio = None
+        with self._connetti() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connetti(self):
+        conn = sqlite3.connect(self.percorso_db, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def accoda(self, valori, id_riga=None):
+        """Mette in coda una riga (lista di valori) e restituisce subito il suo id."""
+        id_riga = id_riga or nuovo_id_riga()
+        with self._connetti() as conn:
+            gia_inviata = conn.execute("SELECT 1 FROM inviati WHERE id_riga = ?", (id_riga,)).fetchone()
+            if not gia_inviata:
+                conn.execute(
+                    "INSERT OR IGNORE INTO coda (id_riga, valori, creato) VALUES (?, ?, ?)",
+                    (id_riga, json.dumps(list(valori), ensure_ascii=False), time.time())
+                )
+        self._sveglia.set()
+        return id_riga
+
+    def in_attesa(self):
+        with self._connetti() as conn:
+            return conn.execute("SELECT COUNT(*) FROM coda").fetchone()[0]
+
+    def _attesa(self, tentativi):
+        attesa = min(ATTESA_MAX_SECONDI, ATTESA_MIN_SECONDI * 2 ** (tentativi - 1))
+        return attesa * random.uniform(0.8, 1.2)
+
+    def invia_blocco(self):
+        """
+        Invia al foglio un blocco di righe pronte. Restituisce il numero di righe
+        confermate; in caso di errore le righe restano in coda con un nuovo orario
+        di tentativo.
+        """
+        adesso = time.time()
+        with self._connetti() as conn:
+            # Il tentativo si conta prima dell'invio, nella stessa transazione della lettura:
+            # se il processo muore dopo append_rows ma prima della conferma, al riavvio
+            # le righe risultano già tentate e si controlla il foglio prima di rimandarle.
+            conn.execute("BEGIN IMMEDIATE")
+            blocco = conn.execute(
+                "SELECT id_riga, valori, tentativi FROM coda WHERE prossimo_tentativo <= ? "
+                "ORDER BY creato LIMIT ?", (adesso, self.dimensione_blocco)
+            ).fetchall()
+            conn.executemany("UPDATE coda SET tentativi = tentativi + 1 WHERE id_riga = ?",
+                             [(id_riga,) for id_riga, _, _ in blocco])
+        if not blocco:
+            return 0
+
+        try:
+            foglio = self.fornitore_foglio()
+            da_inviare = blocco
+            if any(tentativi for _, _, tentativi in blocco):
+                # Un tentativo precedente può essere arrivato al foglio senza conferma.
+                with misura('sheets.col_values'):
+                    presenti = set(foglio.col_values(self.colonna_id))
+                da_inviare = [voce for voce in blocco if voce[0] not in presenti]
+            if da_inviare:
+                with misura('sheets.append_rows', righe=len(da_inviare)):
+                    foglio.append_rows([json.loads(valori) + [id_riga] for id_riga, valori, _ in da_inviare])
+        except Exception as e:
+            self.ultimo_errore = f"{type(e).__name__}: {e}"
+            with self._connetti() as conn:
+                conn.executemany(
+                    "UPDATE coda SET prossimo_tentativo = ?, ultimo_errore = ? "
+                    "WHERE id_riga = ?",
+                    [(adesso + self._attesa(tentativi + 1), self.ultimo_errore, id_riga)
+                     for id_riga, _, tentativi in blocco]
+                )
+            return 0
+
+        with self._connetti() as conn:
+            conn.executemany("DELETE FROM coda WHERE id_riga = ?", [(id_riga,) for id_riga, _, _ in blocco])
+            conn.executemany("INSERT OR REPLACE INTO inviati (id_riga, inviato) VALUES (?, ?)",
+                             [(id_riga, adesso) for id_riga, _, _ in blocco])
+            conn.execute("DELETE FROM inviati WHERE inviato < ?", (adesso - CONSERVA_INVIATI_SECONDI,))
+        self.ultimo_errore = ''
+        self.ultimo_invio = adesso
+        return len(blocco)
+
+    def svuota_coda(self):
+        """Invia blocchi finché ce ne sono di pronti; restituisce le righe confermate."""
+        totale = 0
+        while True:
+            inviate = self.invia_blocco()
+            if not inviate:
+                return totale
+            totale += inviate
+
+    def _ciclo(self):
+        while not self._stop.is_set():
+            self.svuota_coda()
+            self._sveglia.wait(self.intervallo)
+            self._sveglia.clear()
+
+    def avvia(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._ciclo, name="outbox-sheets", daemon=True)
+            self._thread.start()
+        return self
+
+    def sveglia(self):
+        self._sveglia.set()
+
+    def riprova_subito(self):
+        """Annulla l'attesa delle righe fallite e sveglia subito il thread di invio."""
+        with self._connetti() as conn:
+            conn.execute("UPDATE coda SET prossimo_tentativo = 0")
+        self._sveglia.set()
+
+    def ferma(self):
+        self._stop.set()
+        self._sveglia.set()
+        if self._thread is not None:
+            self._thread.join()
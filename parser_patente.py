@@ -0,0 +1,221 @@
+import logging
+import re
+from datetime import datetime
+
+# Parser dei campi numerati della patente. Il blocco di testo pulito viene
+# scansionato una sola volta per trovare i marcatori dei campi ("1.", "2.",
+# "3.", "4A.", "4B.", "4C.", "5."); ogni campo si ricava poi dalle posizioni
+# dei marcatori con match ancorati, senza riscandire l'intero testo per campo.
+# Le regole sono le stesse delle vecchie regex con lookahead, campo per campo.
+
+logger = logging.getLogger(__name__)
+
+# Pulizia del testo (vedi pulisci_testo_ocr)
+_RE_CARATTERI_AMMESSI = re.compile(r'[^A-Z0-9\s\/\.:\-\(\)]')
+_RE_PARENTESI_LUOGO = re.compile(r'\(([A-Z\s]+)\)')
+_RE_SPAZI_MULTIPLI = re.compile(r'\s+')
+
+_RE_SPAZI = re.compile(r'\s*')
+_RE_DATA_NASCITA = re.compile(r'\d{2}[./]\d{2}[./]\d{2}(?:\d{2})?')
+_RE_DATA = re.compile(r'\d{2}[./]\d{2}[./]\d{4}')
+_RE_CLASSE_LUOGO = re.compile(r'[A-Z\s\'-]*')
+_RE_NUMERO_PATENTE = re.compile(r'[A-Z0-9\/\-]*')
+_RE_NON_SPAZI = re.compile(r'\S*')
+_RE_SOLO_NOME = re.compile(r'[^A-Z\s\'-]')
+
+# Per ogni campo, i marcatori che ne chiudono il valore.
+_FINE_COGNOME = frozenset(('2', '3', '4A', '4B', '4C', '5'))
+_FINE_NOME = frozenset(('3', '4A', '4B', '4C', '5'))
+_FINE_NASCITA = frozenset(('4A', '4C', '4B', '5'))
+_FINE_RILASCIO = frozenset(('4C', '4B', '5'))
+_FINE_SCADENZA = frozenset(('4C', '5'))
+
+# Tolleranza in anni nel futuro per le date di nascita con anno a 2 cifre.
+TOLLERANZA_ANNO = 5
+
+
+def pulisci_testo_ocr(full_text):
+    """Normalizza il testo OCR grezzo nel blocco su cui lavora il parser dei campi."""
+    # Passaggio 1: Rimuovi caratteri indesiderati che non sono numeri, lettere, o i delimitatori / . - : ( )
+    cleaned_text_block = _RE_CARATTERI_AMMESSI.sub('', full_text.upper())
+    # Passaggio 2: Rimuovi le parentesi intorno al luogo di nascita
+    cleaned_text_block = _RE_PARENTESI_LUOGO.sub(r'\1', cleaned_text_block)
+    # Passaggio 3: Normalizza gli spazi multipli in un singolo spazio
+    return _RE_SPAZI_MULTIPLI.sub(' ', cleaned_text_block).strip()
+
+
+def espandi_anno(data):
+    """Porta a 4 cifre l'anno di una data GG/MM/AA; le date con anno a 4 cifre restano invariate."""
+    if len(data) != 8:
+        return data
+    anno = int(data[-2:])
+    # Aggiunta una tolleranza di 5 anni nel futuro per patenti molto recenti
+    secolo = '20' if anno <= datetime.now().year % 100 + TOLLERANZA_ANNO else '19'
+    return data[:-2] + secolo + data[-2:]
+
+
+class _Marcatori:
+    """Posizioni dei marcatori di campo in un blocco di testo, trovate in un'unica scansione."""
+
+    def __init__(self, testo):
+        self.testo = testo
+        # (tipo, inizio del marcatore, inizio del valore dopo il punto e gli spazi)
+        self.per_tipo = {}
+        self.per_inizio = {}
+        self.elenco = []
+        # Ogni marcatore finisce con un punto: si saltano da un punto all'altro
+        # (str.find) e si guarda all'indietro, invece di provare la regex in
+        # ogni posizione del testo.
+        lunghezza = len(testo)
+        punto = testo.find('.')
+        while punto != -1:
+            k = punto - 1
+            while k >= 0 and testo[k].isspace():
+                k -= 1
+            tipo = None
+            if k >= 0:
+                carattere = testo[k]
+                if carattere in '1235':
+                    tipo = carattere
+                elif carattere in 'ABC' and k > 0 and testo[k - 1] == '4':
+                    tipo = '4' + carattere
+                    k -= 1
+            if tipo is not None:
+                valore = punto + 1
+                while valore < lunghezza and testo[valore].isspace():
+                    valore += 1
+                voce = (tipo, k, valore)
+                self.per_tipo.setdefault(tipo, []).append(voce)
+                self.per_inizio[k] = tipo
+                self.elenco.append((k, tipo))
+            punto = testo.find('.', punto + 1)
+
+    def di_tipo(self, tipo):
+        return self.per_tipo.get(tipo, ())
+
+    def prossimo(self, da, tipi):
+        """Inizio del primo marcatore tra tipi che parte in posizione >= da, o la fine del testo."""
+        for inizio, tipo in self.elenco:
+            if inizio >= da and tipo in tipi:
+                return inizio
+        return len(self.testo)
+
+    def chiude_in(self, posizione, tipi):
+        """Vero se in posizione finisce il testo o (dopo eventuali spazi) inizia un marcatore tra tipi."""
+        if posizione == len(self.testo):
+            return True
+        posizione = _RE_SPAZI.match(self.testo, posizione).end()
+        return self.per_inizio.get(posizione) in tipi
+
+
+def _testo_libero(marcatori, tipo, fine):
+    """Valore di un campo di testo (cognome, nome): dal marcatore al primo marcatore di chiusura."""
+    testo = marcatori.testo
+    for _, _, valore in marcatori.di_tipo(tipo):
+        if valore < len(testo):
+            # Il valore ha almeno un carattere anche se subito dopo c'è un altro marcatore.
+            return testo[valore:marcatori.prossimo(valore + 1, fine)].strip()
+        return None
+    return None
+
+
+def _nascita(marcatori):
+    """Data e luogo di nascita (campo 3): la data e poi il luogo fino al marcatore 4A/4B/4C/5."""
+    testo = marcatori.testo
+    for _, _, valore in marcatori.di_tipo('3'):
+        data = _RE_DATA_NASCITA.match(testo, valore)
+        if not data:
+            continue
+        fine_data = data.end()
+        inizio_luogo = _RE_SPAZI.match(testo, fine_data).end()
+        fine_luogo = _RE_CLASSE_LUOGO.match(testo, inizio_luogo).end()
+        if fine_luogo > inizio_luogo and marcatori.chiude_in(fine_luogo, _FINE_NASCITA):
+            return data.group(), testo[inizio_luogo:fine_luogo].strip()
+        # Come le vecchie regex: il luogo può ridursi agli spazi dopo la data.
+        if inizio_luogo > fine_data and marcatori.chiude_in(inizio_luogo, _FINE_NASCITA):
+            return data.group(), ''
+    return None
+
+
+def _data_campo(marcatori, tipo, fine):
+    """Data a 4 cifre di un campo (4A, 4B), seguita direttamente da un marcatore di chiusura."""
+    testo = marcatori.testo
+    for _, _, valore in marcatori.di_tipo(tipo):
+        data = _RE_DATA.match(testo, valore)
+        if data and marcatori.chiude_in(data.end(), fine):
+            return data.group()
+    return None
+
+
+def _numero_patente(marcatori):
+    """Numero patente (campo 5): almeno 8 caratteri alfanumerici, '/' o '-'; altrimenti la prima parola."""
+    testo = marcatori.testo
+    candidati = marcatori.di_tipo('5')
+    for _, _, valore in candidati:
+        numero = _RE_NUMERO_PATENTE.match(testo, valore).group()
+        if len(numero) >= 8:
+            return numero, False
+    # Fallback più generico: qualsiasi cosa dopo "5." fino al primo spazio.
+    for _, _, valore in candidati:
+        parola = _RE_NON_SPAZI.match(testo, valore).group()
+        if parola:
+            return parola, True
+    return None, False
+
+
+def analizza_testo_patente(cleaned_text_block):
+    """Ricava i campi della patente dal blocco di testo pulito, con un'unica scansione dei marcatori."""
+    dati_patente = {
+        'cognome': '',
+        'nome': '',
+        'data_nascita': '',
+        'luogo_nascita': '',
+        'data_rilascio': '',
+        'data_scadenza': '',
+        'numero_patente': ''
+    }
+    marcatori = _Marcatori(cleaned_text_block)
+    # I messaggi di debug si formattano solo se il livello è attivo.
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for chiave, tipo, fine, etichetta in (('cognome', '1', _FINE_COGNOME, "Cognome (Campo 1)"),
+                                          ('nome', '2', _FINE_NOME, "Nome (Campo 2)")):
+        estratto = _testo_libero(marcatori, tipo, fine)
+        if estratto is not None:
+            dati_patente[chiave] = _RE_SOLO_NOME.sub('', estratto).strip()
+            if debug:
+                logger.debug("%s - Estratto: '%s', Pulito: '%s'", etichetta, estratto, dati_patente[chiave])
+        elif debug:
+            logger.debug("%s non trovato.", etichetta)
+
+    nascita = _nascita(marcatori)
+    if nascita:
+        data_nascita_raw, luogo = nascita
+        dati_patente['data_nascita'] = espandi_anno(data_nascita_raw)
+        dati_patente['luogo_nascita'] = luogo
+        if debug:
+            logger.debug("Data di Nascita (Campo 3) - Estratto: '%s', Pulito: '%s'",
+                         data_nascita_raw, dati_patente['data_nascita'])
+            logger.debug("Luogo di Nascita (Campo 3) - Pulito: '%s'", luogo)
+    elif debug:
+        logger.debug("Data e Luogo di Nascita (Campo 3) non trovati.")
+
+    for chiave, tipo, fine, etichetta in (('data_rilascio', '4A', _FINE_RILASCIO, "Data di Rilascio (Campo 4A)"),
+                                          ('data_scadenza', '4B', _FINE_SCADENZA, "Data di Scadenza (Campo 4B)")):
+        data = _data_campo(marcatori, tipo, fine)
+        if data:
+            dati_patente[chiave] = data
+            if debug:
+                logger.debug("%s - Estratto: '%s'", etichetta, data)
+        elif debug:
+            logger.debug("%s non trovata.", etichetta)
+
+    numero, fallback = _numero_patente(marcatori)
+    if numero:
+        dati_patente['numero_patente'] = numero
+        if debug:
+            logger.debug("Numero Patente (Campo 5)%s - Estratto: '%s'", " - FALLBACK" if fallback else "", numero)
+    elif debug:
+        logger.debug("Numero Patente (Campo 5) non trovato.")
+
+    return dati_patente
@@ -0,0 +1,123 @@
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Preparazione dell'immagine prima dell'OCR. Le foto dei telefoni (soprattutto
+# HEIC) sono molto più grandi di quanto serva a Tesseract: riportarle a una
+# risoluzione "da scanner" e a un bianco/nero pulito riduce il tempo di OCR.
+# Tutte le operazioni sui pixel sono vettoriali (NumPy/Pillow), mai cicli Python.
+
+LARGHEZZA_TESSERA_MM = 85.6
+
+CONFIG_PREELABORAZIONE = {
+    'exif': True,
+    # DPI desiderati sulla tessera e quota del lato lungo della foto occupata dalla tessera.
+    'dpi': 300,
+    'frazione_tessera': 0.8,
+    'scala_di_grigi': True,
+    'binarizza': True,
+    # Lato della finestra e offset della soglia adattiva (media locale - offset).
+    'finestra_soglia': 31,
+    'offset_soglia': 10,
+    'raddrizza': True,
+    'angolo_max': 5.0,
+    'passo_angolo': 0.5,
+}
+
+_LATO_STIMA_INCLINAZIONE = 600
+
+
+def _lato_lungo_obiettivo(config):
+    larghezza_tessera_px = LARGHEZZA_TESSERA_MM / 25.4 * config['dpi']
+    return int(round(larghezza_tessera_px / config['frazione_tessera']))
+
+
+def ridimensiona(image, config):
+    """Riduce la foto alla risoluzione utile per l'OCR (non ingrandisce mai)."""
+    obiettivo = _lato_lungo_obiettivo(config)
+    lato_lungo = max(image.size)
+    if lato_lungo <= obiettivo:
+        return image
+    scala = obiettivo / lato_lungo
+    # reduce() con fattore intero è molto più rapido del ricampionamento diretto
+    # su foto da 12 MP; il resize finale rifinisce la dimensione.
+    fattore = int(1 / scala) // 2
+    if fattore >= 2:
+        image = image.reduce(fattore)
+    nuova = (max(1, round(image.width * obiettivo / max(image.size))),
+             max(1, round(image.height * obiettivo / max(image.size))))
+    return image.resize(nuova, Image.LANCZOS)
+
+
+def soglia_adattiva(image, finestra, offset):
+    """
+    Binarizzazione con soglia pari alla media locale (finestra x finestra)
+    meno un offset, calcolata con l'immagine integrale.
+    """
+    grigio = np.asarray(image.convert('L'), dtype=np.float64)
+    h, w = grigio.shape
+    integrale = np.zeros((h + 1, w + 1))
+    integrale[1:, 1:] = grigio.cumsum(axis=0).cumsum(axis=1)
+
+    raggio = finestra // 2
+    y0 = np.clip(np.arange(h) - raggio, 0, h)
+    y1 = np.clip(np.arange(h) + raggio + 1, 0, h)
+    x0 = np.clip(np.arange(w) - raggio, 0, w)
+    x1 = np.clip(np.arange(w) + raggio + 1, 0, w)
+
+    somma = (integrale[np.ix_(y1, x1)] - integrale[np.ix_(y0, x1)]
+             - integrale[np.ix_(y1, x0)] + integrale[np.ix_(y0, x0)])
+    area = np.outer(y1 - y0, x1 - x0)
+    binaria = np.where(grigio > somma / area - offset, 255, 0).astype(np.uint8)
+    return Image.fromarray(binaria, mode='L')
+
+
+def stima_inclinazione(image, angolo_max, passo):
+    """
+    Stima l'inclinazione del testo (in gradi) cercando la rotazione che rende
+    più "a righe" il profilo orizzontale dei pixel scuri.
+    """
+    probe = image.convert('L')
+    scala = _LATO_STIMA_INCLINAZIONE / max(probe.size)
+    if scala < 1:
+        probe = probe.resize((max(1, round(probe.width * scala)), max(1, round(probe.height * scala))))
+    # Inchiostro = 255, sfondo = 0: le zone scoperte dalla rotazione restano vuote.
+    inchiostro = ImageOps.invert(probe)
+
+    migliore_angolo, migliore_punteggio = 0.0, -1.0
+    for angolo in np.arange(-angolo_max, angolo_max + passo / 2, passo):
+        ruotata = np.asarray(inchiostro.rotate(float(angolo), resample=Image.NEAREST), dtype=np.float64)
+        punteggio = ruotata.sum(axis=1).var()
+        if punteggio > migliore_punteggio:
+            migliore_angolo, migliore_punteggio = float(angolo), punteggio
+    return migliore_angolo
+
+
+def preelabora_immagine(image, config=None):
+    """
+    Applica i passaggi abilitati in config (vedi CONFIG_PREELABORAZIONE) e
+    restituisce (immagine, tempi), con tempi = {passaggio: millisecondi}.
+    """
+    config = {**CONFIG_PREELABORAZIONE, **(config or {})}
+    tempi = {}
+
+    def misura(nome, funzione, *args):
+        inizio = time.perf_counter()
+        risultato = funzione(*args)
+        tempi[nome] = (time.perf_counter() - inizio) * 1000
+        return risultato
+
+    if config['exif']:
+        image = misura('exif', ImageOps.exif_transpose, image)
+    image = misura('ridimensiona', ridimensiona, image, config)
+    if config['scala_di_grigi'] or config['binarizza']:
+        image = misura('scala_di_grigi', image.convert, 'L')
+    if config['binarizza']:
+        image = misura('binarizza', soglia_adattiva, image, config['finestra_soglia'], config['offset_soglia'])
+    if config['raddrizza']:
+        angolo = misura('stima_inclinazione', stima_inclinazione, image, config['angolo_max'], config['passo_angolo'])
+        if angolo:
+            image = misura('raddrizza', lambda: image.rotate(angolo, resample=Image.BICUBIC, expand=True,
+                                                              fillcolor='white'))
+    return image, tempi
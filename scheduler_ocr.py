@@ -0,0 +1,110 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metriche import percentile
+
+# Limite di processo alle letture Tesseract contemporanee. Tutte le sessioni
+# Streamlit condividono la stessa macchina: senza un limite ogni sessione lancia
+# le sue letture (e ogni Tesseract i suoi thread OpenMP), i core vengono
+# sovraccaricati e la latenza peggiora per tutti insieme. Qui al massimo
+# max_concorrenti letture girano insieme; le altre aspettano in code separate
+# per sessione, servite a turno, così una sessione con molte zone da leggere non
+# fa aspettare le altre.
+
+CAMPIONI_TEMPI = 500
+
+# Sessione a cui attribuire le letture OCR del contesto corrente (vedi sessione_corrente).
+sessione_ocr = contextvars.ContextVar('sessione_ocr', default='')
+
+
+def _concorrenti_default():
+    valore = os.environ.get('SCANNER_OCR_CONCORRENTI')
+    return int(valore) if valore else os.cpu_count() or 1
+
+
+@contextmanager
+def sessione_corrente(sessione):
+    """Attribuisce alla sessione indicata le letture OCR eseguite nel blocco."""
+    token = sessione_ocr.set(sessione)
+    try:
+        yield
+    finally:
+        sessione_ocr.reset(token)
+
+
+class SchedulerOCR:
+    """Semaforo con coda equa per sessione (round robin) e tempi di attesa/lettura."""
+
+    def __init__(self, max_concorrenti=None):
+        self.max_concorrenti = max_concorrenti or _concorrenti_default()
+        self._lock = threading.Lock()
+        # sessione -> eventi in attesa; l'ordine delle chiavi è il turno.
+        self._code = OrderedDict()
+        self._attivi = 0
+        self.eseguiti = 0
+        self.attese_ms = deque(maxlen=CAMPIONI_TEMPI)
+        self.durate_ms = deque(maxlen=CAMPIONI_TEMPI)
+
+    def _assegna(self):
+        # Da chiamare col lock: libera i posti disponibili, una sessione per volta.
+        while self._attivi < self.max_concorrenti and self._code:
+            sessione, coda = next(iter(self._code.items()))
+            evento = coda.popleft()
+            if coda:
+                self._code.move_to_end(sessione)
+            else:
+                del self._code[sessione]
+            self._attivi += 1
+            evento.set()
+
+    @contextmanager
+    def slot(self, sessione=None):
+        """Attende un posto libero e lo tiene per la durata del blocco."""
+        sessione = sessione_ocr.get() if sessione is None else sessione
+        evento = threading.Event()
+        richiesta = time.perf_counter()
+        with self._lock:
+            self._code.setdefault(sessione, deque()).append(evento)
+            self._assegna()
+        evento.wait()
+        inizio = time.perf_counter()
+        try:
+            yield
+        finally:
+            fine = time.perf_counter()
+            with self._lock:
+                self._attivi -= 1
+                self.eseguiti += 1
+                self.attese_ms.append((inizio - richiesta) * 1000)
+                self.durate_ms.append((fine - inizio) * 1000)
+                self._assegna()
+
+    def statistiche(self):
+        """Letture in corso e in coda, e percentili dei tempi di attesa e di lettura (ms)."""
+        with self._lock:
+            attese, durate = list(self.attese_ms), list(self.durate_ms)
+            in_coda = sum(len(coda) for coda in self._code.values())
+            attivi = self._attivi
+        return {
+            'max_concorrenti': self.max_concorrenti,
+            'attivi': attivi,
+            'in_coda': in_coda,
+            'eseguiti': self.eseguiti,
+            'attesa_p50_ms': percentile(attese, 0.5),
+            'attesa_p95_ms': percentile(attese, 0.95),
+            'ocr_p50_ms': percentile(durate, 0.5),
+            'ocr_p95_ms': percentile(durate, 0.95),
+        }
+
+    def azzera_statistiche(self):
+        with self._lock:
+            self.eseguiti = 0
+            self.attese_ms.clear()
+            self.durate_ms.clear()
+
+
+scheduler_ocr = SchedulerOCR()
@@ -0,0 +1,381 @@
+"""
+Servizio HTTP locale per l'estrazione dei dati delle patenti da altri programmi
+(es. il software della centrale operativa), senza passare dalla pagina Streamlit.
+
+    python servizio_ocr.py --porta 8502
+    curl --data-binary @patente.jpg "http://127.0.0.1:8502/estrai?modalita=zone"
+
+Endpoint:
+    POST /estrai[?modalita=pagina|zone|cascata]
+        corpo: i byte dell'immagine (JPG, PNG o HEIC)
+        -> {"dati_patente": {...}, "suggerimenti": {...},
+            "tempi_ms": {"attesa": ..., "estrazione": ..., "totale": ...}}
+        dati_patente["tipo_documento"] dice quale documento si è riconosciuto
+        (vedi ocr_patente.ESTRATTORI); per la carta d'identità ci sono anche
+        numero_documento e controllo_mrz.
+        Con modalita=cascata dati_patente["provenienza"] indica, per ogni campo,
+        lo stadio che l'ha letto ("rapido", "zone", "zone_psm"; null se manca).
+    POST /estrai/lotto
+        corpo JSON: {"modalita": "zone", "immagini": ["<base64>", ...]}
+        -> {"risultati": [come /estrai, oppure {"errore": ..., "stato": 422}], "tempi_ms": {"totale": ...}}
+    GET /stato
+        lavoratori, coda, richieste rifiutate, scheduler OCR, cache e tempi delle fasi
+
+All'avvio si caricano la catena OCR e i motori Tesseract e si legge una
+tessera vuota per ogni modalità: la prima richiesta non paga l'inizializzazione.
+I documenti sono letti da --lavoratori thread, con la stessa cache e lo stesso
+scheduler_ocr dell'app (le letture di un client non fanno aspettare gli altri).
+Oltre ai documenti in lettura ne possono aspettare al massimo --coda: quando la
+coda è piena il servizio risponde subito 503 con Retry-After, invece di
+accumulare richieste che scadrebbero comunque. Un lotto è accettato solo se c'è
+posto per tutte le sue immagini, che vengono lette in parallelo.
+Il servizio non ha autenticazione: ascolta su 127.0.0.1 salvo --host diverso.
+"""
+import argparse
+import base64
+import binascii
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as TempoScaduto
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image, UnidentifiedImageError
+
+from indice_luoghi import SOGLIA_SUGGERIMENTO, carica_indice
+from metriche import metriche, percentile
+from scheduler_ocr import scheduler_ocr, sessione_corrente
+
+logger = logging.getLogger(__name__)
+
+MODALITA = ('pagina', 'zone', 'cascata')
+MAX_BYTE_IMMAGINE = 15 * 1024 * 1024
+MAX_LOTTO = 16
+TIMEOUT_SECONDI = 60
+CAMPIONI_TEMPI = 500
+
+
+class CodaPiena(Exception):
+    """Non c'è posto per altri documenti: il client deve riprovare più tardi."""
+
+    def __init__(self, riprova_tra):
+        super().__init__(f"coda piena, riprovare tra {riprova_tra} s")
+        self.riprova_tra = riprova_tra
+
+
+class ErroreRichiesta(Exception):
+    def __init__(self, stato, messaggio):
+        super().__init__(messaggio)
+        self.stato = stato
+
+
+def stato_errore(errore):
+    """Codice HTTP per un errore di estrazione."""
+    if isinstance(errore, ErroreRichiesta):
+        return errore.stato
+    if isinstance(errore, (UnidentifiedImageError, TypeError)):
+        return 422
+    if isinstance(errore, TempoScaduto):
+        return 504
+    return 500
+
+
+class ServizioOCR:
+    """Lavoratori OCR con coda limitata; il server HTTP è solo un modo di chiamarli."""
+
+    def __init__(self, lavoratori=None, coda=None, funzione_ocr=None, suggerisci_luoghi=True):
+        """
+        lavoratori: documenti letti insieme (predefinito: come scheduler_ocr, uno per core).
+        coda: documenti che possono aspettare oltre a quelli in lettura (predefinito 4 per lavoratore).
+        funzione_ocr: chiamata come funzione_ocr(byte_immagine, modalita=...) e deve restituire
+        (dati_patente, full_text, cleaned_text_block); se None, estrai_dati_patente_cache.
+        """
+        self.lavoratori = lavoratori or scheduler_ocr.max_concorrenti
+        self.coda = coda if coda is not None else 4 * self.lavoratori
+        self.funzione_ocr = funzione_ocr
+        self.indice_luoghi = carica_indice() if suggerisci_luoghi else None
+        self._executor = ThreadPoolExecutor(max_workers=self.lavoratori, thread_name_prefix='servizio-ocr')
+        self._lock = threading.Lock()
+        # Documenti accettati e non ancora finiti (in coda o in lettura).
+        self._ammessi = 0
+        self.eseguiti = 0
+        self.errori = 0
+        self.rifiutati = 0
+        self.durate_ms = deque(maxlen=CAMPIONI_TEMPI)
+
+    def prepara(self):
+        """Carica la catena OCR e i motori e fa una lettura di prova per modalità; restituisce i ms impiegati."""
+        inizio = time.perf_counter()
+        if self.funzione_ocr is None:
+            from ocr_patente import estrai_dati_patente, estrai_dati_patente_cache
+            from motore_ocr import pool_per_lingua, tesserocr
+            self.funzione_ocr = estrai_dati_patente_cache
+            try:
+                if tesserocr is not None:
+                    pool_per_lingua('ita').prepara()
+                # Tessera bianca: nessun testo, ma passa da ogni fase (e verifica che Tesseract ci sia).
+                vuota = Image.new('RGB', (856, 540), 'white')
+                for modalita in MODALITA:
+                    estrai_dati_patente(vuota, modalita=modalita)
+            except Exception as e:
+                logger.warning("Lettura di prova non riuscita (%s: %s): le richieste potrebbero fallire",
+                               type(e).__name__, e)
+            # I tempi della prova non devono finire nelle statistiche del servizio.
+            metriche.azzera()
+            scheduler_ocr.azzera_statistiche()
+        return (time.perf_counter() - inizio) * 1000
+
+    def _riprova_tra(self):
+        # Da chiamare col lock: secondi per smaltire la coda attuale, almeno uno.
+        durata_ms = percentile(self.durate_ms, 0.5) or 1000
+        return max(1, math.ceil(self._ammessi / self.lavoratori * durata_ms / 1000))
+
+    def _ammetti(self, quanti):
+        with self._lock:
+            if self._ammessi + quanti > self.lavoratori + self.coda:
+                self.rifiutati += quanti
+                raise CodaPiena(self._riprova_tra())
+            self._ammessi += quanti
+
+    def _concluso(self, futuro):
+        # Chiamata anche per i documenti annullati prima della lettura.
+        with self._lock:
+            self._ammessi -= 1
+            if not futuro.cancelled():
+                if futuro.exception() is None:
+                    self.eseguiti += 1
+                else:
+                    self.errori += 1
+
+    def _esegui(self, dati, modalita, cliente, ricevuto):
+        inizio = time.perf_counter()
+        # Lo scheduler serve i client a turno: un lotto grande non blocca le richieste degli altri.
+        with sessione_corrente(cliente):
+            dati_patente, _, _ = self.funzione_ocr(dati, modalita=modalita)
+        # Il luogo dell'elenco è solo proposto: dati_patente resta come letto (vedi indice_luoghi).
+        suggerimenti = {}
+        luogo_letto = dati_patente.get('luogo_nascita')
+        if self.indice_luoghi is not None and luogo_letto:
+            luogo, confidenza = self.indice_luoghi.correggi_luogo(luogo_letto)
+            if confidenza >= SOGLIA_SUGGERIMENTO and luogo != luogo_letto:
+                suggerimenti['luogo_nascita'] = {'proposto': luogo, 'confidenza': confidenza}
+        fine = time.perf_counter()
+        with self._lock:
+            self.durate_ms.append((fine - inizio) * 1000)
+        return {
+            'dati_patente': dati_patente,
+            'suggerimenti': suggerimenti,
+            'tempi_ms': {
+                'attesa': round((inizio - ricevuto) * 1000, 1),
+                'estrazione': round((fine - inizio) * 1000, 1),
+                'totale': round((fine - ricevuto) * 1000, 1),
+            },
+        }
+
+    def _invia(self, immagini, modalita, cliente):
+        self._ammetti(len(immagini))
+        ricevuto = time.perf_counter()
+        futuri = []
+        for dati in immagini:
+            futuro = self._executor.submit(self._esegui, dati, modalita, cliente, ricevuto)
+            futuro.add_done_callback(self._concluso)
+            futuri.append(futuro)
+        return futuri
+
+    def estrai(self, dati, modalita='pagina', cliente='', timeout=TIMEOUT_SECONDI):
+        """Dati di una patente dai byte della foto; solleva CodaPiena se non c'è posto."""
+        futuro, = self._invia([dati], modalita, cliente)
+        try:
+            return futuro.result(timeout)
+        except TempoScaduto:
+            futuro.cancel()
+            raise
+
+    def estrai_lotto(self, immagini, modalita='pagina', cliente='', timeout=TIMEOUT_SECONDI):
+        """
+        Come estrai per più foto, lette in parallelo: un risultato per foto,
+        nello stesso ordine, con {'errore', 'stato'} per quelle non riuscite.
+        """
+        futuri = self._invia(immagini, modalita, cliente)
+        scadenza = time.monotonic() + timeout
+        risultati = []
+        for futuro in futuri:
+            try:
+                risultati.append(futuro.result(max(0, scadenza - time.monotonic())))
+            except Exception as e:
+                futuro.cancel()
+                if isinstance(e, TempoScaduto):
+                    e = TempoScaduto(f"lettura non conclusa entro {timeout} s")
+                risultati.append({'errore': str(e) or type(e).__name__, 'stato': stato_errore(e)})
+        return risultati
+
+    def stato(self):
+        with self._lock:
+            ammessi = self._ammessi
+            stato = {
+                'lavoratori': self.lavoratori,
+                'coda_massima': self.coda,
+                'in_lettura': min(ammessi, self.lavoratori),
+                'in_coda': max(0, ammessi - self.lavoratori),
+                'eseguiti': self.eseguiti,
+                'errori': self.errori,
+                'rifiutati': self.rifiutati,
+                'estrazione_p50_ms': percentile(self.durate_ms, 0.5),
+                'estrazione_p95_ms': percentile(self.durate_ms, 0.95),
+            }
+        stato['scheduler'] = scheduler_ocr.statistiche()
+        ocr_patente = sys.modules.get('ocr_patente')
+        if ocr_patente is not None:
+            cache = ocr_patente.cache_ocr
+            stato['cache'] = {'voci': len(cache), 'hit': cache.hit + cache.hit_phash, 'miss': cache.miss}
+        stato['fasi'] = metriche.riepilogo()
+        return stato
+
+    def chiudi(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class GestoreRichieste(BaseHTTPRequestHandler):
+    # Connessioni persistenti: chi manda molte richieste non riapre il socket ogni volta.
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ServizioOCR/1'
+
+    def log_message(self, formato, *argomenti):
+        logger.debug("%s " + formato, self.client_address[0], *argomenti)
+
+    def _rispondi(self, stato, corpo, intestazioni=None):
+        dati = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(stato)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dati)))
+        for nome, valore in (intestazioni or {}).items():
+            self.send_header(nome, valore)
+        self.end_headers()
+        self.wfile.write(dati)
+
+    def _leggi_corpo(self, massimo):
+        try:
+            lunghezza = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            lunghezza = -1
+        if lunghezza < 0 or lunghezza > massimo:
+            # Il corpo resta sul socket: la connessione non è più riutilizzabile.
+            self.close_connection = True
+            raise ErroreRichiesta(413 if lunghezza > massimo else 400,
+                                  f"corpo mancante o oltre {massimo // (1024 * 1024)} MB")
+        return self.rfile.read(lunghezza)
+
+    def _modalita(self, valore):
+        if valore not in MODALITA:
+            raise ErroreRichiesta(400, f"modalita deve essere una tra {', '.join(MODALITA)}")
+        return valore
+
+    def _lotto(self):
+        try:
+            richiesta = json.loads(self._leggi_corpo(MAX_BYTE_IMMAGINE * MAX_LOTTO * 4 // 3))
+            immagini = [base64.b64decode(voce, validate=True) for voce in richiesta['immagini']]
+        except (ValueError, KeyError, TypeError, binascii.Error):
+            raise ErroreRichiesta(400, 'corpo atteso: {"modalita": ..., "immagini": ["<base64>", ...]}')
+        if not 0 < len(immagini) <= MAX_LOTTO:
+            raise ErroreRichiesta(400, f"un lotto contiene da 1 a {MAX_LOTTO} immagini")
+        if any(len(dati) > MAX_BYTE_IMMAGINE for dati in immagini):
+            raise ErroreRichiesta(413, f"immagine oltre {MAX_BYTE_IMMAGINE // (1024 * 1024)} MB")
+        return self._modalita(richiesta.get('modalita', 'pagina')), immagini
+
+    def do_POST(self):
+        servizio = self.server.servizio
+        percorso = urlsplit(self.path)
+        cliente = self.client_address[0]
+        inizio = time.perf_counter()
+        try:
+            if percorso.path == '/estrai':
+                modalita = self._modalita(parse_qs(percorso.query).get('modalita', ['pagina'])[0])
+                dati = self._leggi_corpo(MAX_BYTE_IMMAGINE)
+                if not dati:
+                    raise ErroreRichiesta(400, "corpo vuoto: inviare i byte dell'immagine")
+                self._rispondi(200, servizio.estrai(dati, modalita, cliente, self.server.timeout_richieste))
+            elif percorso.path == '/estrai/lotto':
+                modalita, immagini = self._lotto()
+                risultati = servizio.estrai_lotto(immagini, modalita, cliente, self.server.timeout_richieste)
+                self._rispondi(200, {
+                    'risultati': risultati,
+                    'tempi_ms': {'totale': round((time.perf_counter() - inizio) * 1000, 1)},
+                })
+            else:
+                raise ErroreRichiesta(404, f"percorso sconosciuto: {percorso.path}")
+        except CodaPiena as e:
+            self._rispondi(503, {'errore': str(e)}, {'Retry-After': str(e.riprova_tra)})
+        except Exception as e:
+            stato = stato_errore(e)
+            if stato == 500:
+                logger.exception("Errore nell'estrazione")
+            elif stato == 504:
+                e = f"lettura non conclusa entro {self.server.timeout_richieste} s"
+            self._rispondi(stato, {'errore': str(e) or type(e).__name__})
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/stato':
+            self._rispondi(200, self.server.servizio.stato())
+        else:
+            self._rispondi(404, {'errore': f"percorso sconosciuto: {self.path}"})
+
+
+def avvia_server(servizio, host='127.0.0.1', porta=8502, timeout=TIMEOUT_SECONDI):
+    """Server HTTP (un thread per connessione) che inoltra le richieste al servizio."""
+    server = ThreadingHTTPServer((host, porta), GestoreRichieste)
+    server.daemon_threads = True
+    server.servizio = servizio
+    server.timeout_richieste = timeout
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servizio HTTP locale per l'estrazione dei dati delle patenti.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8502)
+    parser.add_argument('--lavoratori', type=int, help="Documenti letti insieme (predefinito: uno per core)")
+    parser.add_argument('--coda', type=int, help="Documenti in attesa oltre i quali si risponde 503")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT_SECONDI,
+                        help="Secondi massimi per richiesta, attesa compresa (poi 504)")
+    parser.add_argument('--senza-luoghi', action='store_true',
+                        help="Non suggerire il luogo di nascita dall'elenco dei luoghi")
+    parser.add_argument('--simula-ms', type=float,
+                        help="Solo per prove di carico: lettura fittizia di circa questa durata al posto dell'OCR")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("SCANNER_LOG_LEVEL", "INFO"),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    # Come nell'app: con SCANNER_LOG_METRICHE=INFO ogni span viene scritto come riga JSON.
+    logging.getLogger("metriche").setLevel(os.environ.get("SCANNER_LOG_METRICHE", "WARNING"))
+
+    funzione_ocr = None
+    if args.simula_ms:
+        from bench_concorrenza_ocr import calibra_lettura_fittizia, lettura_fittizia
+        giri = calibra_lettura_fittizia(args.simula_ms)
+
+        def funzione_ocr(dati, modalita):
+            lettura_fittizia(giri)
+            return {}, '', ''
+
+    servizio = ServizioOCR(args.lavoratori, args.coda, funzione_ocr, suggerisci_luoghi=not args.senza_luoghi)
+    logger.info("Catena OCR pronta in %.0f ms", servizio.prepara())
+    server = avvia_server(servizio, args.host, args.porta, args.timeout)
+    logger.info("In ascolto su http://%s:%d (%d lavoratori, coda %d)",
+                args.host, args.porta, servizio.lavoratori, servizio.coda)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        servizio.chiudi()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Statistiche dei controlli calcolate in modo vettoriale. I dati del foglio
+# arrivano come stringhe: prepara_controlli li converte una volta sola (DATA_ORA
+# in datetime, SI/NO in booleani, COMUNE in categoria) e i riepiloghi sono poi
+# semplici groupby su qualsiasi intervallo di date.
+
+FORMATO_DATA_ORA = "%d/%m/%Y %H:%M:%S"
+FORMATO_ESEMPIO = "31/12/2024 23:59:59"
+COLONNE_SI_NO = ["COMMERCIALE", "COPE", "CINOFILI"]
+
+
+def _uguale_si(serie):
+    """Booleano "valore == SI" (senza maiuscole/spazi) calcolato sui soli valori distinti."""
+    codici, distinti = pd.factorize(serie)
+    si = pd.Index(distinti).astype(str).str.strip().str.upper() == "SI"
+    # codice -1 = valore mancante: l'elemento aggiunto in coda vale False
+    return np.append(si, False)[codici]
+
+
+def _non_vuoto(serie):
+    codici, distinti = pd.factorize(serie)
+    pieno = pd.Index(distinti).astype(str).str.strip() != ""
+    return np.append(pieno, False)[codici]
+
+
+# Posizioni fisse di GG/MM/AAAA HH:MM:SS: cifre e separatori.
+_POSIZIONI_CIFRE = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+_SEPARATORI = {2: "/", 5: "/", 10: " ", 13: ":", 16: ":"}
+
+
+def _converti_formato_fisso(testo):
+    """
+    Interpreta stringhe GG/MM/AAAA HH:MM:SS leggendo le cifre per posizione su
+    un array di codici carattere, senza strptime elemento per elemento.
+    Restituisce (date, valide); le righe non valide sono NaT. Una data nel
+    formato giusto ma impossibile (es. mese 13) non è valida: la interpreta
+    pandas come le altre, e può scambiare giorno e mese.
+    """
+    lunghezza = len(FORMATO_ESEMPIO)
+    # Un carattere in più della lunghezza attesa: le stringhe più lunghe non vengono troncate a una data valida.
+    caratteri = np.array(testo, dtype=f"U{lunghezza + 1}")
+    codici = caratteri.view(np.uint32).reshape(len(testo), lunghezza + 1)
+    cifre = codici[:, _POSIZIONI_CIFRE].astype(np.int64) - ord("0")
+    valide = (np.char.str_len(caratteri) == lunghezza) & ((cifre >= 0) & (cifre <= 9)).all(axis=1)
+    for posizione, separatore in _SEPARATORI.items():
+        valide &= codici[:, posizione] == ord(separatore)
+    cifre = cifre[valide]
+
+    def numero(*colonne):
+        valore = 0
+        for colonna in colonne:
+            valore = valore * 10 + cifre[:, colonna]
+        return valore
+
+    giorno, mese, anno = numero(0, 1), numero(2, 3), numero(4, 5, 6, 7)
+    ora, minuto, secondo = numero(8, 9), numero(10, 11), numero(12, 13)
+    # Data costruita per aritmetica su datetime64: inizio del mese + giorni + secondi.
+    inizio_mese = ((anno - 1970) * 12 + mese - 1).astype("datetime64[M]")
+    giorni_nel_mese = ((inizio_mese + 1).astype("datetime64[D]") - inizio_mese.astype("datetime64[D]")).astype(np.int64)
+    corrette = ((mese >= 1) & (mese <= 12) & (giorno >= 1) & (giorno <= giorni_nel_mese)
+                & (ora <= 23) & (minuto <= 59) & (secondo <= 59))
+    istanti = (inizio_mese.astype("datetime64[s]") + ((giorno - 1) * 86400 + ora * 3600 + minuto * 60 + secondo)
+               ).astype("datetime64[ns]")
+    date = np.full(len(testo), np.datetime64("NaT"), dtype="datetime64[ns]")
+    posizioni = np.flatnonzero(valide)[corrette]
+    date[posizioni] = istanti[corrette]
+    valide = np.zeros(len(testo), dtype=bool)
+    valide[posizioni] = True
+    return date, valide
+
+
+def converti_data_ora(serie):
+    """Stringhe GG/MM/AAAA HH:MM:SS -> datetime; i formati diversi vengono interpretati col giorno prima."""
+    testo = serie.fillna("").astype(str).to_numpy(dtype=object)
+    valori, valide = _converti_formato_fisso(testo)
+    date = pd.Series(valori, index=serie.index)
+    altre = np.flatnonzero(~valide)
+    altre = altre[[bool(testo[i].strip()) for i in altre]]
+    if len(altre):
+        date.iloc[altre] = pd.to_datetime(serie.iloc[altre], format="mixed", dayfirst=True, errors="coerce")
+    return date
+
+
+def prepara_controlli(df):
+    """
+    Converte il DataFrame grezzo del foglio nei tipi usati dai riepiloghi:
+    DATA_ORA datetime, COMMERCIALE/COPE/CINOFILI booleani, RILIEVI_PRESENTI
+    booleano, COMUNE categoria. Le righe senza una DATA_ORA valida vengono scartate.
+    """
+    preparato = pd.DataFrame(index=df.index)
+    vuota = pd.Series("", index=df.index)
+    preparato["DATA_ORA"] = converti_data_ora(df["DATA_ORA"] if "DATA_ORA" in df else vuota)
+    preparato["COMUNE"] = (df["COMUNE"] if "COMUNE" in df else vuota).astype(str).astype("category")
+    for colonna in COLONNE_SI_NO:
+        preparato[colonna] = _uguale_si(df[colonna]) if colonna in df else False
+    preparato["RILIEVI_PRESENTI"] = _non_vuoto(df["RILIEVI"]) if "RILIEVI" in df else False
+    return preparato[preparato["DATA_ORA"].notna()]
+
+
+def filtra_periodo(controlli, dal, al):
+    """Controlli con data tra dal e al (date, estremi inclusi)."""
+    inizio = pd.Timestamp(datetime.combine(dal, datetime.min.time()))
+    fine = pd.Timestamp(datetime.combine(al, datetime.min.time()) + timedelta(days=1))
+    data_ora = controlli["DATA_ORA"]
+    return controlli[(data_ora >= inizio) & (data_ora < fine)]
+
+
+def riepilogo_per_comune(controlli, dal, al):
+    """
+    Un'unica groupby per comune nel periodo: primo e ultimo controllo, totale,
+    commerciali, privati, COPE, cinofili e rilievi.
+    """
+    periodo = filtra_periodo(controlli, dal, al)
+    tabella = periodo.groupby("COMUNE", observed=True, sort=True).agg(
+        primo_controllo=("DATA_ORA", "min"),
+        ultimo_controllo=("DATA_ORA", "max"),
+        totale=("DATA_ORA", "size"),
+        commerciali=("COMMERCIALE", "sum"),
+        cope=("COPE", "sum"),
+        cinofili=("CINOFILI", "sum"),
+        rilievi=("RILIEVI_PRESENTI", "sum"),
+    )
+    tabella.insert(4, "privati", tabella["totale"] - tabella["commerciali"])
+    return tabella
+
+
+def riepilogo_per_giorno(controlli, dal, al):
+    """Totali per giorno nel periodo (stesse colonne di riepilogo_per_comune, senza orari)."""
+    periodo = filtra_periodo(controlli, dal, al)
+    tabella = periodo.groupby(periodo["DATA_ORA"].dt.normalize().rename("GIORNO"), sort=True).agg(
+        totale=("DATA_ORA", "size"),
+        commerciali=("COMMERCIALE", "sum"),
+        cope=("COPE", "sum"),
+        cinofili=("CINOFILI", "sum"),
+        rilievi=("RILIEVI_PRESENTI", "sum"),
+    )
+    tabella.insert(2, "privati", tabella["totale"] - tabella["commerciali"])
+    return tabella
+
+
+def totali(tabella):
+    """Somma delle colonne numeriche di un riepilogo (es. il totale della giornata dai comuni)."""
+    colonne = ["totale", "commerciali", "privati", "cope", "cinofili", "rilievi"]
+    return {colonna: int(tabella[colonna].sum()) for colonna in colonne}
@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metriche import misura
+
+# Copia locale (SQLite) del foglio dei controlli per la tab STATISTICHE.
+# La prima sincronizzazione scarica tutto il foglio e memorizza la posizione
+# della riga di intestazione; le successive chiedono solo le righe dopo l'ultima
+# già copiata. Un TTL condiviso da tutte le sessioni evita che più operatori che
+# aprono le statistiche insieme facciano ciascuno una richiesta al foglio.
+# Le modifiche a righe già copiate non vengono viste: per quelle c'è la
+# sincronizzazione completa. Con alla_sincronizzazione le righe scaricate
+# vengono passate anche a chi tiene indici propri (vedi indice_precedenti).
+
+TTL_SECONDI_DEFAULT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    chiave TEXT PRIMARY KEY,
+    valore TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS righe (
+    numero INTEGER PRIMARY KEY,
+    valori TEXT NOT NULL
+);
+"""
+
+
+def trova_intestazione(righe):
+    """Indice (0-based) della prima riga che contiene la colonna DATA_ORA, o -1."""
+    for i, row in enumerate(righe):
+        if "DATA_ORA" in [c.strip().upper() for c in row]:
+            return i
+    return -1
+
+
+def lettera_colonna(numero):
+    """Numero di colonna 1-based -> lettera A1 (1 -> A, 27 -> AA)."""
+    lettere = ''
+    while numero > 0:
+        numero, resto = divmod(numero - 1, 26)
+        lettere = chr(ord('A') + resto) + lettere
+    return lettere
+
+
+class MirrorFoglio:
+    """Specchio locale e incrementale di un worksheet con una riga di intestazione."""
+
+    def __init__(self, percorso_db, fornitore_foglio, ttl_secondi=TTL_SECONDI_DEFAULT, alla_sincronizzazione=None):
+        """
+        alla_sincronizzazione: funzione opzionale chiamata dopo ogni sincronizzazione
+        con (intestazioni, [(numero di riga, valori)] scaricate, completa).
+        """
+        self.percorso_db = percorso_db
+        self.fornitore_foglio = fornitore_foglio
+        self.ttl_secondi = ttl_secondi
+        self.alla_sincronizzazione = alla_sincronizzazione
+        self._lock = threading.Lock()
+        self._ultima_sincronizzazione = 0.0
+        self._df = None
+        with self._connetti() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connetti(self):
+        conn = sqlite3.connect(self.percorso_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _meta(self, conn):
+        return {chiave: json.loads(valore) for chiave, valore in conn.execute("SELECT chiave, valore FROM meta")}
+
+    def _salva_meta(self, conn, **valori):
+        conn.executemany("INSERT OR REPLACE INTO meta (chiave, valore) VALUES (?, ?)",
+                         [(chiave, json.dumps(valore)) for chiave, valore in valori.items()])
+
+    def intestazioni(self):
+        with self._connetti() as conn:
+            return self._meta(conn).get('intestazioni')
+
+    def _sincronizzazione_completa(self, foglio, conn):
+        with misura('sheets.get_all_values'):
+            data_raw = foglio.get_all_values()
+        conn.execute("DELETE FROM righe")
+        conn.execute("DELETE FROM meta")
+        indice = trova_intestazione(data_raw)
+        if indice == -1:
+            return None, []
+        intestazioni = [c.strip().upper() for c in data_raw[indice]]
+        # I numeri di riga sono quelli del foglio (1-based).
+        nuove = [(indice + 2 + i, r) for i, r in enumerate(data_raw[indice + 1:])]
+        conn.executemany("INSERT INTO righe (numero, valori) VALUES (?, ?)",
+                         [(numero, json.dumps(r, ensure_ascii=False)) for numero, r in nuove])
+        self._salva_meta(conn, riga_intestazione=indice + 1, intestazioni=intestazioni,
+                         ultima_riga=indice + 1 + len(nuove))
+        return intestazioni, nuove
+
+    def _sincronizzazione_incrementale(self, foglio, conn, meta):
+        prima = meta['ultima_riga'] + 1
+        intervallo = f"A{prima}:{lettera_colonna(len(meta['intestazioni']))}"
+        with misura('sheets.get_values'):
+            nuove = [(prima + i, r) for i, r in enumerate(foglio.get_values(intervallo))]
+        # L'API omette le righe vuote in coda: l'ultima riga copiata avanza solo
+        # di quelle restituite.
+        conn.executemany("INSERT OR REPLACE INTO righe (numero, valori) VALUES (?, ?)",
+                         [(numero, json.dumps(r, ensure_ascii=False)) for numero, r in nuove])
+        self._salva_meta(conn, ultima_riga=meta['ultima_riga'] + len(nuove))
+        return meta['intestazioni'], nuove
+
+    def sincronizza(self, forza=False, completa=False):
+        """
+        Aggiorna la copia locale e restituisce il numero di righe scaricate.
+        Entro il TTL non contatta il foglio (a meno di forza=True); con completa=True
+        riscarica tutto il foglio.
+        """
+        with self._lock:
+            if not (forza or completa) and time.monotonic() - self._ultima_sincronizzazione < self.ttl_secondi:
+                return 0
+            foglio = self.fornitore_foglio()
+            with self._connetti() as conn:
+                meta = self._meta(conn)
+                completa = completa or 'intestazioni' not in meta
+                if completa:
+                    intestazioni, nuove = self._sincronizzazione_completa(foglio, conn)
+                else:
+                    intestazioni, nuove = self._sincronizzazione_incrementale(foglio, conn, meta)
+            self._ultima_sincronizzazione = time.monotonic()
+            if nuove or completa:
+                self._df = None
+            if self.alla_sincronizzazione is not None and intestazioni and (nuove or completa):
+                self.alla_sincronizzazione(intestazioni, nuove, completa)
+            return len(nuove)
+
+    def righe_numerate(self):
+        """[(numero di riga, valori)] di tutte le righe copiate, senza contattare il foglio."""
+        with self._connetti() as conn:
+            return [(numero, json.loads(v)) for numero, v in conn.execute("SELECT numero, valori FROM righe ORDER BY numero")]
+
+    def dataframe(self):
+        """
+        DataFrame delle righe non vuote, con le intestazioni del foglio; viene
+        ricostruito solo se ci sono novità ed è condiviso tra le sessioni, quindi
+        va copiato prima di modificarlo.
+        """
+        with self._lock:
+            if self._df is not None:
+                return self._df
+            with self._connetti() as conn:
+                intestazioni = self._meta(conn).get('intestazioni')
+                righe = [json.loads(v) for (v,) in conn.execute("SELECT valori FROM righe ORDER BY numero")]
+            if intestazioni is None:
+                return None
+            import pandas as pd
+            larghezza = len(intestazioni)
+            righe = [(r + [''] * larghezza)[:larghezza] for r in righe if any(c.strip() for c in r)]
+            self._df = pd.DataFrame(righe, columns=intestazioni)
+            return self._df
@@ -0,0 +1,27 @@
+import random
+
+import pytest
+
+from corpus_sintetico import dati_casuali, disegna_tessera, fotografa, verifica_parser
+from zone_patente import ALTEZZA_CANONICA, LARGHEZZA_CANONICA
+
+
+@pytest.mark.parametrize('seme', range(50))
+def test_parser_legge_il_testo_perfetto(seme):
+    # Se il parser non ricava i valori attesi dal testo stampato, il corpus misura il parser e non l'OCR.
+    valori, righe = dati_casuali(random.Random(seme))
+    assert verifica_parser(righe, valori) == []
+
+
+def test_stesso_seme_stesso_documento():
+    assert dati_casuali(random.Random(7)) == dati_casuali(random.Random(7))
+
+
+def test_tessera_e_foto():
+    rng = random.Random(0)
+    _, righe = dati_casuali(rng)
+    tessera = disegna_tessera(righe, [], rng)
+    assert tessera.size == (LARGHEZZA_CANONICA, ALTEZZA_CANONICA)
+    foto, parametri = fotografa(tessera, rng)
+    assert foto.mode == 'RGB'
+    assert parametri['larghezza_tessera'] > 0
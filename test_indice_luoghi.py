@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from indice_luoghi import ESTERO, IndiceLuoghi, carica_indice, cartella_cache, distanza, leggi_elenco
+
+ELENCO = """\
+# Elenco di prova
+TORTONA;AL
+CARROSIO;AL
+AVEZZANO;AQ
+FORLI';FC
+SAN GIORGIO;AL
+SAN GIORGIO;MN
+FRANCIA;EE
+MAROCCO;EE
+"""
+
+
+@pytest.fixture
+def percorsi(tmp_path, monkeypatch):
+    monkeypatch.setenv('SCANNER_CACHE_DIR', str(tmp_path / 'cache'))
+    elenco = tmp_path / 'luoghi.txt'
+    elenco.write_text(ELENCO, encoding='utf-8')
+    return str(elenco), os.path.join(cartella_cache(), 'luoghi.idx')
+
+
+@pytest.fixture
+def indice(percorsi):
+    return carica_indice(*percorsi)
+
+
+def test_distanza():
+    assert distanza('TORTONA', 'TORTONA') == 0
+    assert distanza('TORTQNA', 'TORTONA') == 1
+    assert distanza('ABCDEF', 'UVWXYZ') == 6
+    # Oltre il limite il calcolo si ferma e restituisce limite + 1.
+    assert distanza('ABCDEF', 'UVWXYZ', limite=2) == 3
+    assert distanza('A', 'ABCDEFG', limite=3) == 4
+    assert distanza('TORTQNA', 'TORTONA', limite=3) == 1
+
+
+def test_leggi_elenco_ignora_commenti(percorsi):
+    luoghi = leggi_elenco(percorsi[0])
+    assert luoghi[0] == ('TORTONA', 'AL')
+    assert len(luoghi) == 8
+
+
+def test_corrispondenza_esatta(indice):
+    luogo = indice.cerca("forlì")
+    assert (luogo.nome, luogo.sigla, luogo.confidenza) == ("FORLI'", 'FC', 1.0)
+    assert indice.correggi_luogo('TORTONA AL') == ('TORTONA AL', 1.0)
+
+
+def test_errore_ocr_corretto_con_la_sigla(indice):
+    valore, confidenza = indice.correggi_luogo('TORTQNA AL')
+    assert valore == 'TORTONA AL'
+    assert confidenza == pytest.approx(0.857, abs=0.001)
+
+
+def test_sigla_decide_tra_omonimi(indice):
+    assert indice.cerca('SAN GIORGIO', 'MN').sigla == 'MN'
+    assert indice.cerca('SAN GIORGIO', 'AL').sigla == 'AL'
+    # Anche a parità di distanza, con un errore OCR nel nome.
+    assert indice.cerca('SAN GI0RGIO', 'MN').sigla == 'MN'
+
+
+def test_stati_esteri(indice):
+    assert indice.correggi_luogo('MAROCC0') == ('MAROCCO', pytest.approx(0.857, abs=0.001))
+    # "EE" non è una provincia: resta parte del nome cercato, e un estero non riceve sigle.
+    assert ESTERO not in indice.province
+    valore, _ = indice.correggi_luogo('FRANCLA AL')
+    assert valore == 'FRANCIA'
+
+
+def test_comune_assente_non_diventa_uguale(indice):
+    # SAREZZANO non è nell'elenco: il più vicino è solo un suggerimento con confidenza < 1.
+    valore, confidenza = indice.correggi_luogo('SAREZZANO AL')
+    assert valore != 'SAREZZANO AL'
+    assert confidenza < 1.0
+
+
+def test_nessuna_corrispondenza(indice):
+    assert indice.correggi_luogo('') == ('', 0.0)
+    assert indice.correggi_luogo('QQQ') == ('QQQ', 0.0)
+
+
+def test_indice_in_cache_e_ricostruito(percorsi):
+    elenco, salvato = percorsi
+    primo = carica_indice(elenco, salvato)
+    assert os.path.exists(salvato)
+    assert isinstance(carica_indice(elenco, salvato), IndiceLuoghi)
+    assert len(carica_indice(elenco, salvato)) == len(primo)
+
+    with open(elenco, 'a', encoding='utf-8') as f:
+        f.write('SAREZZANO;AL\n')
+    aggiornato = carica_indice(elenco, salvato)
+    assert len(aggiornato) == len(primo) + 1
+    assert aggiornato.correggi_luogo('SAREZZANO AL') == ('SAREZZANO AL', 1.0)
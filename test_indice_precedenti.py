@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from indice_precedenti import GIORNI_PRECEDENTI, IndicePrecedenti, chiave_persona, chiave_targa, data_ora_iso
+
+# Il percorso veloce di data_ora_iso (pezzi riordinati) deve dare lo stesso
+# risultato di strptime, o '' dove strptime non legge la data.
+CASI_DATA_ORA = {
+    "31/12/2024 23:59:59": "2024-12-31 23:59:59",
+    "01/02/2024 08:05": "2024-02-01 08:05:00",
+    "29/02/2024 12:00:00": "2024-02-29 12:00:00",     # anno bisestile
+    "1/2/2024 08:05": "2024-02-01 08:05:00",          # giorno e mese a una cifra
+    "01/02/2024": "2024-02-01 00:00:00",
+    " 01/02/2024 10:00:00 ": "2024-02-01 10:00:00",
+    "29/02/2023 12:00:00": "",                        # non esiste
+    "31/04/2024 10:00:00": "",                        # non esiste
+    "00/00/2024 10:00": "",
+    "00/01/2024 10:00": "",
+    "01/00/2024 10:00": "",
+    "01/13/2024 10:00": "",
+    "32/01/2024 10:00": "",
+    "01/02/2024 24:00": "",
+    "01/02/2024 23:60": "",
+    "01/02/2024 23:59:60": "",
+    "2024-02-01 10:00:00": "",
+    "": "",
+    None: "",
+}
+
+
+@pytest.mark.parametrize("valore", CASI_DATA_ORA)
+def test_data_ora_iso(valore):
+    assert data_ora_iso(valore) == CASI_DATA_ORA[valore]
+
+
+def test_chiave_targa():
+    assert chiave_targa("ab 123-cd") == "AB123CD"
+    assert chiave_targa("AB123CD") == chiave_targa(" ab.123.cd ")
+    assert chiave_targa("") == ""
+    assert chiave_targa(None) == ""
+
+
+def test_chiave_persona():
+    chiave = chiave_persona("D'Angelo", " anna  maria", "1/2/80")
+    assert chiave == "D ANGELO|ANNA MARIA|01/02/1980"
+    assert chiave_persona("D ANGELO", "ANNA MARIA", "01.02.1980") == chiave
+    assert chiave_persona("D-ANGELO", "ANNA-MARIA", "01-02-1980") == chiave
+
+
+def test_chiave_persona_incompleta():
+    assert chiave_persona("ROSSI", "MARIO", "") == ""
+    assert chiave_persona("ROSSI", "", "01/02/1980") == ""
+    assert chiave_persona("ROSSI", "MARIO", "1980") == ""
+    assert chiave_persona("ROSSI", "MARIO", "01/AB/1980") == ""
+
+
+def controllo(quando, targa="AB123CD", cognome="ROSSI", nome="MARIO", data_nascita="01/02/1980", comune="GAVI"):
+    return {
+        "DATA_ORA": quando.strftime("%d/%m/%Y %H:%M:%S"), "COMUNE": comune, "TARGA": targa,
+        "COGNOME": cognome, "NOME": nome, "DATA_NASCITA": data_nascita,
+    }
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return IndicePrecedenti(str(tmp_path / "precedenti.sqlite3"))
+
+
+def test_cerca_solo_negli_ultimi_giorni(indice):
+    adesso = datetime.now().replace(microsecond=0)
+    assert indice.vuoto()
+    indice.registra("recente", controllo(adesso - timedelta(days=1), comune="NOVI LIGURE"))
+    indice.registra("al_limite", controllo(adesso - timedelta(days=GIORNI_PRECEDENTI - 1)))
+    indice.registra("vecchio", controllo(adesso - timedelta(days=GIORNI_PRECEDENTI + 1)))
+    indice.registra("altra_targa", controllo(adesso, targa="ZZ999ZZ", cognome="VERDI"))
+    assert not indice.vuoto()
+
+    trovati = indice.cerca(targa="ab 123 cd", cognome="rossi", nome="mario", data_nascita="1/2/80")
+    # Dal più recente; il controllo oltre la finestra non compare.
+    assert [p["comune"] for p in trovati["targa"]] == ["NOVI LIGURE", "GAVI"]
+    assert trovati["targa"][0]["data_ora"] == (adesso - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    assert len(trovati["persona"]) == 2
+
+    assert len(indice.cerca(targa="AB123CD", giorni=GIORNI_PRECEDENTI + 2)["targa"]) == 3
+
+
+def test_cerca_senza_chiavi(indice):
+    indice.registra("recente", controllo(datetime.now()))
+    assert indice.cerca() == {"targa": [], "persona": []}
+    # Persona incompleta: si cerca solo per targa.
+    trovati = indice.cerca(targa="AB123CD", cognome="ROSSI")
+    assert len(trovati["targa"]) == 1
+    assert trovati["persona"] == []
+
+
+def test_data_non_leggibile_esclusa(indice):
+    dati = controllo(datetime.now())
+    dati["DATA_ORA"] = "00/00/2024 10:00"
+    indice.registra("illeggibile", dati)
+    assert indice.cerca(targa="AB123CD")["targa"] == []
+
+
+def test_righe_del_foglio_sostituiscono_quelle_dell_app(indice):
+    quando = datetime.now() - timedelta(days=2)
+    dati = controllo(quando)
+    indice.registra("id-1", dati)
+    intestazioni = list(dati) + ["ID_RIGA"]
+    righe = [(2, list(dati.values()) + ["id-1"]), (3, [""] * len(intestazioni))]
+    assert indice.aggiorna_da_foglio(intestazioni, righe) == 1
+    assert len(indice.cerca(targa="AB123CD")["targa"]) == 1
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from corpus_sintetico import (dati_carta_identita, dati_casuali, disegna_carta_identita_retro, disegna_tessera,
+                              fotografa, trova_font)
+from documenti import RIGHE_MRZ_MINIME, conta_righe_mrz, dati_da_mrz, tipo_da_testo
+from mrz import analizza_td1, cifra_controllo, componi_td1, righe_mrz
+from zone_patente import individua_tessera
+
+# Esempio TD1 della specifica ICAO 9303 (parte 5).
+ESEMPIO_ICAO = [
+    "I<UTOD231458907<<<<<<<<<<<<<<<",
+    "7408122F1204159UTO<<<<<<<<<<<6",
+    "ERIKSSON<<ANNA<MARIA<<<<<<<<<<",
+]
+
+
+def test_cifra_controllo():
+    assert cifra_controllo("D23145890") == "7"
+    assert cifra_controllo("740812") == "2"
+    assert cifra_controllo("120415") == "9"
+    assert cifra_controllo("<<<") == "0"
+
+
+def test_esempio_icao():
+    letta = analizza_td1(ESEMPIO_ICAO)
+    assert all(letta.controlli.values())
+    assert letta.campi == {
+        'cognome': 'ERIKSSON',
+        'nome': 'ANNA MARIA',
+        'data_nascita': '12/08/1974',
+        'data_scadenza': '15/04/2012',
+        'numero_documento': 'D23145890',
+        'sesso': 'F',
+        'nazionalita': 'UTO',
+        'stato_emittente': 'UTO',
+    }
+
+
+def test_componi_e_analizza():
+    righe = componi_td1("CA12345AB", "01/02/1980", "M", "15/03/2031", "D ANGELO", "ANNA MARIA")
+    assert [len(r) for r in righe] == [30, 30, 30]
+    letta = analizza_td1(righe)
+    assert all(letta.controlli.values())
+    assert letta.campi['numero_documento'] == "CA12345AB"
+    assert (letta.campi['cognome'], letta.campi['nome']) == ("D ANGELO", "ANNA MARIA")
+    assert (letta.campi['data_nascita'], letta.campi['data_scadenza']) == ("01/02/1980", "15/03/2031")
+    assert letta.campi['stato_emittente'] == "ITA"
+
+
+def test_righe_mrz_dal_testo_ocr():
+    testo = "INDIRIZZO DI RESIDENZA\n" + "\n".join(r.replace("<<", "«", 2) for r in ESEMPIO_ICAO)
+    assert righe_mrz(testo) == ESEMPIO_ICAO
+    assert righe_mrz("PATENTE DI GUIDA\n1. ROSSI") is None
+
+
+def test_cifra_confusa_corretta():
+    # L'OCR legge la O al posto dello 0 nel numero del documento: la cifra di controllo lo corregge.
+    righe = [ESEMPIO_ICAO[0].replace("D23145890", "D2314589O"), *ESEMPIO_ICAO[1:]]
+    letta = analizza_td1(righe)
+    assert letta.campi['numero_documento'] == "D23145890"
+    assert all(letta.controlli.values())
+    assert dati_da_mrz(letta)['controllo_mrz'] == 'valido'
+
+
+def test_riga_non_correggibile():
+    # Una cifra della data di nascita letta male non è una confusione lettera/cifra: resta errata.
+    righe = [ESEMPIO_ICAO[0], ESEMPIO_ICAO[1].replace("7408122", "7408132"), ESEMPIO_ICAO[2]]
+    letta = analizza_td1(righe)
+    assert not letta.controlli['data_nascita']
+    assert letta.controlli['numero_documento'] and letta.controlli['data_scadenza']
+    assert dati_da_mrz(letta)['controllo_mrz'] == 'non valido: data_nascita, composito'
+
+
+def test_mrz_non_letta():
+    assert dati_da_mrz(None)['controllo_mrz'] == 'non letta'
+
+
+@pytest.mark.parametrize('testo, tipo', [
+    ("\n".join(ESEMPIO_ICAO), 'carta_identita'),
+    ("PATENTE DI GUIDA\nREPUBBLICA ITALIANA", 'patente_fronte'),
+    ("REPUBBLICA ITALIANA\nCARTA DI IDENTITÀ", 'carta_identita_fronte'),
+    ("9. 10. 11. 12.\nAM\nA1\nB 01.01.20\nBE\nC1", 'patente_retro'),
+    # Con l'intestazione del fronte le categorie sono quelle del campo 9.
+    ("REPUBBLICA ITALIANA\n9. AM A1 B", None),
+    ("", None),
+])
+def test_tipo_da_testo(testo, tipo):
+    assert tipo_da_testo(testo) == tipo
+
+
+@pytest.mark.parametrize('seme', range(5))
+def test_righe_mrz_sui_pixel(seme):
+    # Foto come quelle di corpus_sintetico --documenti: retro della carta d'identità e fronte della patente.
+    font = trova_font()
+    if not font:
+        pytest.skip("nessun font TrueType per disegnare la MRZ")
+    rng = random.Random(seme)
+    _, righe = dati_carta_identita(rng)
+    carta, _ = fotografa(disegna_carta_identita_retro(righe, font, rng), rng)
+    assert conta_righe_mrz(individua_tessera(carta)) >= RIGHE_MRZ_MINIME
+
+    _, righe_patente = dati_casuali(rng)
+    patente, _ = fotografa(disegna_tessera(righe_patente, font, rng), rng)
+    assert conta_righe_mrz(individua_tessera(patente)) < RIGHE_MRZ_MINIME
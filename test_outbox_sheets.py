@@ -0,0 +1,111 @@
+import sqlite3
+import time
+
+import pytest
+
+import outbox_sheets
+from outbox_sheets import FoglioLocale, OutboxSheets
+
+COLONNA_ID = 3
+
+
+class ProcessoInterrotto(BaseException):
+    """Il processo muore: nessun except Exception lo intercetta."""
+
+
+class FoglioInterrotto(FoglioLocale):
+    """Le righe arrivano al foglio, poi il processo muore prima della conferma."""
+
+    def append_rows(self, values, **kwargs):
+        super().append_rows(values, **kwargs)
+        raise ProcessoInterrotto()
+
+
+def outbox(percorso, foglio):
+    return OutboxSheets(str(percorso), lambda: foglio, COLONNA_ID, dimensione_blocco=10)
+
+
+def id_sul_foglio(foglio):
+    return foglio.col_values(COLONNA_ID)
+
+
+def test_accoda_e_invia(tmp_path):
+    foglio = FoglioLocale()
+    coda = outbox(tmp_path / 'coda.sqlite3', foglio)
+    id_a = coda.accoda(['ROSSI', 'MARIO'])
+    id_b = coda.accoda(['VERDI', 'ANNA'])
+    assert coda.in_attesa() == 2
+
+    assert coda.svuota_coda() == 2
+    assert coda.in_attesa() == 0
+    assert foglio.righe == [['ROSSI', 'MARIO', id_a], ['VERDI', 'ANNA', id_b]]
+    # Un accoda ripetuto di una riga già inviata non la rimette in coda.
+    coda.accoda(['ROSSI', 'MARIO'], id_riga=id_a)
+    assert coda.in_attesa() == 0
+
+
+def test_errore_attesa_e_nuovo_tentativo(tmp_path):
+    foglio = FoglioLocale()
+    foglio.fallimenti = 1
+    coda = outbox(tmp_path / 'coda.sqlite3', foglio)
+    coda.accoda(['ROSSI', 'MARIO'])
+
+    assert coda.invia_blocco() == 0
+    assert coda.ultimo_errore.startswith('ConnectionError')
+    # In attesa del prossimo tentativo la riga non si rimanda.
+    assert coda.invia_blocco() == 0
+    assert foglio.chiamate_append == 1
+
+    coda.riprova_subito()
+    assert coda.invia_blocco() == 1
+    assert coda.ultimo_errore == ''
+    assert len(foglio.righe) == 1
+
+
+def test_invio_arrivato_senza_conferma_non_si_duplica(tmp_path, monkeypatch):
+    foglio = FoglioLocale()
+    coda = outbox(tmp_path / 'coda.sqlite3', foglio)
+    id_riga = coda.accoda(['ROSSI', 'MARIO'])
+    # Le righe arrivano al foglio ma la risposta si perde.
+    originale = FoglioLocale.append_rows
+
+    def arrivata_poi_errore(self, values, **kwargs):
+        originale(self, values, **kwargs)
+        raise TimeoutError("risposta persa")
+
+    monkeypatch.setattr(FoglioLocale, 'append_rows', arrivata_poi_errore)
+    assert coda.invia_blocco() == 0
+    monkeypatch.undo()
+
+    coda.riprova_subito()
+    assert coda.invia_blocco() == 1
+    assert id_sul_foglio(foglio) == [id_riga]
+
+
+def test_processo_interrotto_dopo_invio_non_duplica(tmp_path):
+    percorso = tmp_path / 'coda.sqlite3'
+    foglio = FoglioInterrotto()
+    id_riga = outbox(percorso, foglio).accoda(['ROSSI', 'MARIO'])
+    with pytest.raises(ProcessoInterrotto):
+        outbox(percorso, foglio).invia_blocco()
+
+    # Riavvio: la riga è ancora in coda, ma risulta già tentata.
+    foglio_dopo = FoglioLocale(foglio.righe)
+    riavviata = outbox(percorso, foglio_dopo)
+    assert riavviata.in_attesa() == 1
+    assert riavviata.svuota_coda() == 1
+    assert id_sul_foglio(foglio_dopo) == [id_riga]
+
+
+def test_inviati_vecchi_eliminati(tmp_path, monkeypatch):
+    percorso = tmp_path / 'coda.sqlite3'
+    coda = outbox(percorso, FoglioLocale())
+    coda.accoda(['ROSSI', 'MARIO'])
+    coda.svuota_coda()
+
+    adesso = time.time()
+    monkeypatch.setattr(outbox_sheets.time, 'time', lambda: adesso + outbox_sheets.CONSERVA_INVIATI_SECONDI + 1)
+    coda.accoda(['VERDI', 'ANNA'])
+    coda.svuota_coda()
+    with sqlite3.connect(percorso) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM inviati").fetchone()[0] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from parser_patente import analizza_testo_patente, espandi_anno, pulisci_testo_ocr
+
+# Uscite del parser su testi OCR tipici, fissate quando il parser a scansione
+# unica ha sostituito le vecchie regex per campo: devono restare uguali.
+# Unica differenza voluta rispetto alle vecchie regex: l'anno di nascita già a
+# 4 cifre resta com'è (prima 01/02/1980 diventava 01/02/191980).
+
+VUOTI = {
+    'cognome': '', 'nome': '', 'data_nascita': '', 'luogo_nascita': '',
+    'data_rilascio': '', 'data_scadenza': '', 'numero_patente': '',
+}
+
+CASI = {
+    'completo': (
+        "PATENTE DI GUIDA\nREPUBBLICA ITALIANA\n1. ROSSI\n2. MARIO\n3. 01/02/80 TORINO (TO)\n"
+        "4a. 15/03/2020 4c. MIT-UCO\n4b. 15/03/2030\n5. U1A234567B\n9. B",
+        {'cognome': 'ROSSI', 'nome': 'MARIO', 'data_nascita': '01/02/1980', 'luogo_nascita': 'TORINO TO',
+         'data_rilascio': '15/03/2020', 'data_scadenza': '15/03/2030', 'numero_patente': 'U1A234567B'},
+    ),
+    'anno_a_4_cifre': (
+        "1. ROSSI\n2. MARIO\n3. 01/02/1980 TORINO (TO)\n4a. 15/03/2020\n4b. 15/03/2030\n5. U1A234567B",
+        {'cognome': 'ROSSI', 'nome': 'MARIO', 'data_nascita': '01/02/1980', 'luogo_nascita': 'TORINO TO',
+         'data_rilascio': '15/03/2020', 'data_scadenza': '15/03/2030', 'numero_patente': 'U1A234567B'},
+    ),
+    'anno_recente': (
+        "1. GALLO\n2. SARA\n3. 23/11/05 ROMA (RM)\n5. RM5012345X",
+        {**VUOTI, 'cognome': 'GALLO', 'nome': 'SARA', 'data_nascita': '23/11/2005', 'luogo_nascita': 'ROMA RM',
+         'numero_patente': 'RM5012345X'},
+    ),
+    'rumore_ocr': (
+        "1 . D'ANGELO\n2.  ANNA MARIA\n3 . 23.11.05 SAN GIOVANNI (FI)| ~\n4a 4a. 02.01.2023 4c. MC-AL\n"
+        "4b. 02.01.2033 5. AL5012345X *",
+        {**VUOTI, 'cognome': 'DANGELO', 'nome': 'ANNA MARIA', 'data_rilascio': '02.01.2023',
+         'data_scadenza': '02.01.2033', 'numero_patente': 'AL5012345X'},
+    ),
+    'campi_mancanti': (
+        "1. BIANCHI 2. LUCA 5. TO1234567",
+        {**VUOTI, 'cognome': 'BIANCHI', 'nome': 'LUCA', 'numero_patente': 'TO1234567'},
+    ),
+    'colonne_mescolate': (
+        "1. VERDI 4a. 10/10/2019 2. GIULIA 4b. 10/10/2029 3. 07/07/99 NOVI LIGURE (AL) 5. U1N987654Z",
+        {**VUOTI, 'cognome': 'VERDI', 'nome': 'GIULIA', 'data_nascita': '07/07/1999',
+         'luogo_nascita': 'NOVI LIGURE AL', 'numero_patente': 'U1N987654Z'},
+    ),
+    'vuoto': ("", VUOTI),
+}
+
+
+@pytest.mark.parametrize('nome', CASI)
+def test_analizza_testo_patente(nome):
+    testo, atteso = CASI[nome]
+    assert analizza_testo_patente(pulisci_testo_ocr(testo)) == atteso
+
+
+def test_pulisci_testo_ocr():
+    assert pulisci_testo_ocr("  3. 01/02/80  Torino (TO)|\n4a. ") == "3. 01/02/80 TORINO TO 4A."
+
+
+def test_espandi_anno():
+    assert espandi_anno('01/02/80') == '01/02/1980'
+    assert espandi_anno('23/11/05') == '23/11/2005'
+    assert espandi_anno('01/02/1980') == '01/02/1980'
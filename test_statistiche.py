@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from statistiche import converti_data_ora, prepara_controlli
+
+# Il percorso veloce di converti_data_ora (cifre per posizione) deve dare gli
+# stessi risultati di pandas che interpreta ogni valore col giorno prima.
+CASI = [
+    "31/12/2024 23:59:59",
+    "01/02/2024 08:05:09",
+    "29/02/2024 12:00:00",      # anno bisestile
+    "29/02/2023 12:00:00",      # non esiste
+    "31/04/2024 10:00:00",      # non esiste
+    "00/01/2024 10:00:00",
+    "01/00/2024 10:00:00",
+    "00/00/2024 00:00:00",
+    "01/13/2024 10:00:00",
+    "24/12/2024 24:00:00",
+    "24/12/2024 23:60:00",
+    "1/2/2024 10:00:00",        # giorno e mese a una cifra
+    "01/02/2024 10:00",         # senza secondi
+    "01/02/2024",               # senza ora
+    " 01/02/2024 10:00:00 ",    # spazi intorno
+    "01/02/2024 10:00:00x",
+    "01-02-2024 10:00:00",
+    "",
+    "   ",
+    "NON UNA DATA",
+]
+
+
+def atteso(valore):
+    if not valore.strip():
+        return pd.NaT
+    return pd.to_datetime(pd.Series([valore]), format="mixed", dayfirst=True, errors="coerce").iloc[0]
+
+
+@pytest.mark.parametrize("valore", CASI)
+def test_converti_data_ora_come_pandas(valore):
+    ottenuto = converti_data_ora(pd.Series([valore])).iloc[0]
+    previsto = atteso(valore)
+    assert (pd.isna(ottenuto) and pd.isna(previsto)) or ottenuto == previsto
+
+
+def test_converti_data_ora_serie_mista():
+    serie = pd.Series(CASI + [None], index=range(100, 100 + len(CASI) + 1))
+    date = converti_data_ora(serie)
+    assert list(date.index) == list(serie.index)
+    for valore, ottenuto in zip(CASI, date):
+        previsto = atteso(valore)
+        assert (pd.isna(ottenuto) and pd.isna(previsto)) or ottenuto == previsto
+    assert pd.isna(date.iloc[-1])
+
+
+def test_prepara_controlli_scarta_date_non_valide():
+    df = pd.DataFrame({
+        "DATA_ORA": ["01/02/2024 10:00:00", "00/00/2024 10:00:00", ""],
+        "COMUNE": ["GAVI", "GAVI", "GAVI"],
+        "COPE": ["SI", " si ", "NO"],
+        "RILIEVI": ["", "X", ""],
+    })
+    controlli = prepara_controlli(df)
+    assert len(controlli) == 1
+    assert bool(controlli["COPE"].iloc[0]) is True
+    assert bool(controlli["RILIEVI_PRESENTI"].iloc[0]) is False
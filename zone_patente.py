@@ -0,0 +1,133 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import numpy as np
+from PIL import Image
+
+from motore_ocr import leggi_testo
+
+# Lettura "per zone" della patente UE italiana (fronte, formato ID-1 85,6 x 54 mm).
+# La tessera viene ritagliata e riportata a una dimensione canonica; ogni campo
+# numerato ha una zona fissa che viene letta da sola con impostazioni dedicate.
+
+# ~300 DPI sul formato ID-1: abbastanza per Tesseract, molto meno di una foto da 12 MP.
+LARGHEZZA_CANONICA = 1012
+ALTEZZA_CANONICA = 638
+RAPPORTO_ID1 = 85.6 / 54.0
+
+# Zone in frazioni della tessera canonica: (sinistra, alto, destra, basso).
+ZONE_PATENTE = {
+    '1': (0.30, 0.19, 0.98, 0.29),
+    '2': (0.30, 0.28, 0.98, 0.37),
+    '3': (0.30, 0.36, 0.98, 0.46),
+    '4A': (0.30, 0.45, 0.64, 0.54),
+    '4B': (0.30, 0.53, 0.64, 0.62),
+    '5': (0.30, 0.61, 0.98, 0.71),
+}
+
+_WHITELIST_DATE = '-c tessedit_char_whitelist=0123456789./'
+_WHITELIST_NUMERO = '-c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/-'
+
+# Configurazione Tesseract per zona: una sola riga (--psm 7) e alfabeto ridotto
+# dove il contenuto è noto (solo date per 4A/4B, codice alfanumerico per il 5).
+CONFIG_ZONE = {
+    '1': '--psm 7',
+    '2': '--psm 7',
+    '3': '--psm 7',
+    '4A': f'--psm 7 {_WHITELIST_DATE}',
+    '4B': f'--psm 7 {_WHITELIST_DATE}',
+    '5': f'--psm 7 {_WHITELIST_NUMERO}',
+}
+# Seconda scelta per le zone rilette dalla cascata: riga "grezza" (--psm 13),
+# che non passa dall'analisi del layout e recupera righe tagliate o inclinate.
+CONFIG_ZONE_ALTERNATIVA = {campo: config.replace('--psm 7', '--psm 13') for campo, config in CONFIG_ZONE.items()}
+
+# Etichetta del campo letta insieme al valore (es. "4a." o "4b)"): va tolta
+# perché la whitelist delle date può trasformarla in cifre spurie.
+_RE_ETICHETTA = {
+    campo: re.compile(r'^\s*' + campo[0] + (r'\s*' + campo[1] if len(campo) > 1 else '') + r'\s*[.,)]?\s*',
+                      re.IGNORECASE)
+    for campo in ZONE_PATENTE
+}
+_RE_DATA = re.compile(r'\d{2}[./]\d{2}[./]\d{4}')
+
+# Soglia di "bordo forte" e frazione minima di pixel di bordo per riga/colonna
+# usate per trovare il rettangolo della tessera sullo sfondo.
+_LATO_ANALISI = 400
+_FRAZIONE_BORDI = 0.04
+
+
+def individua_tessera(image):
+    """
+    Trova il riquadro della tessera nella foto e lo restituisce ritagliato e
+    ridimensionato alla dimensione canonica. Se il riquadro trovato non è
+    plausibile usa l'intera immagine.
+    """
+    scala = _LATO_ANALISI / max(image.size)
+    piccola = image.convert('L')
+    if scala < 1:
+        piccola = piccola.resize((max(1, round(image.width * scala)), max(1, round(image.height * scala))))
+    else:
+        scala = 1.0
+    grigio = np.asarray(piccola, dtype=np.int16)
+
+    gradiente = np.zeros(grigio.shape, dtype=np.int16)
+    gradiente[:, 1:] = np.abs(np.diff(grigio, axis=1))
+    gradiente[1:, :] = np.maximum(gradiente[1:, :], np.abs(np.diff(grigio, axis=0)))
+    bordi = gradiente > (gradiente.mean() + gradiente.std())
+
+    righe = np.flatnonzero(bordi.mean(axis=1) > _FRAZIONE_BORDI)
+    colonne = np.flatnonzero(bordi.mean(axis=0) > _FRAZIONE_BORDI)
+    riquadro = None
+    if righe.size and colonne.size:
+        alto, basso = righe[0], righe[-1] + 1
+        sinistra, destra = colonne[0], colonne[-1] + 1
+        larghezza, altezza = destra - sinistra, basso - alto
+        area_relativa = (larghezza * altezza) / float(grigio.size)
+        if altezza and area_relativa > 0.2 and 0.7 < (larghezza / altezza) / RAPPORTO_ID1 < 1.4:
+            riquadro = tuple(int(round(v / scala)) for v in (sinistra, alto, destra, basso))
+
+    tessera = image.crop(riquadro) if riquadro else image
+    return tessera.resize((LARGHEZZA_CANONICA, ALTEZZA_CANONICA), Image.LANCZOS)
+
+
+def ritaglia_zona(tessera, campo):
+    sinistra, alto, destra, basso = ZONE_PATENTE[campo]
+    w, h = tessera.size
+    return tessera.crop((round(sinistra * w), round(alto * h), round(destra * w), round(basso * h)))
+
+
+def _leggi_zona(tessera, campo, config):
+    testo = leggi_testo(ritaglia_zona(tessera, campo), lang='ita', config=config)
+    testo = ' '.join(testo.split())
+    if campo in ('4A', '4B'):
+        # Con la whitelist l'etichetta "4a." può diventare "44." o "4.": si tiene solo la data.
+        date = _RE_DATA.findall(testo)
+        return date[-1] if date else ''
+    return _RE_ETICHETTA[campo].sub('', testo, count=1)
+
+
+def leggi_zone(tessera, campi=None, config_zone=None, max_workers=None):
+    """
+    Legge in parallelo le zone indicate (tutte se campi è None) di una tessera
+    già canonica e restituisce un testo con un campo per riga, già preceduto dal
+    proprio marcatore ("1.", "2.", ...): lo stesso formato del testo OCR a
+    pagina intera, ma senza che i campi si mescolino tra loro.
+    """
+    campi = list(campi or ZONE_PATENTE)
+    config_zone = config_zone or CONFIG_ZONE
+    # Sia pytesseract (processo esterno) sia tesserocr (rilascia il GIL) lavorano
+    # davvero in parallelo: i thread bastano. Ogni thread riceve una copia del
+    # contesto, così le letture restano attribuite alla sessione del chiamante
+    # nello scheduler OCR.
+    with ThreadPoolExecutor(max_workers=max_workers or len(campi)) as executor:
+        futuri = [executor.submit(contextvars.copy_context().run, _leggi_zona, tessera, campo, config_zone[campo])
+                  for campo in campi]
+        valori = [futuro.result() for futuro in futuri]
+    return '\n'.join(f"{campo}. {valore}" for campo, valore in zip(campi, valori))
+
+
+def ocr_zone(image, max_workers=None):
+    """Individua la tessera nella foto e ne legge tutte le zone (vedi leggi_zone)."""
+    return leggi_zone(individua_tessera(image), max_workers=max_workers)